@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reproducible performance benchmarks of MACES
+
+The benchmarks run on a synthetic case (see synthetic_case.py) created in a
+temporary directory, so they need neither the site database nor forcing
+files of a real case and run offline. The benchmark groups are
+    startup : configuration, site database and forcing reading and platform
+              construction
+    hydro   : ModelRun/ModelCallback loop of the hydrodynamic core over one
+              day on short and long platforms
+    methods : methods of every mineral and organic matter accretion model
+    coupler : coupled simulation days of model combinations
+    io      : writers of site and aggregated output files
+Results are written into a json file. If a baseline result file is given,
+the median times are compared with it and the script exits with 1 when a
+benchmark is slower than the regression threshold.
+
+Usage:
+    python run_benchmarks.py -o results.json [-b baseline.json] [-q]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import platform
+import tempfile
+import importlib
+import subprocess
+import numpy as np
+import synthetic_case as syn
+from datetime import datetime
+from optparse import OptionParser
+
+import TAIMODSuper
+import maces_config as mcfg
+import maces_utilities as utils
+import maces_coupler as cpl
+import maces_archive as archive
+import maces_ensemble as ens
+
+BENCHMARK_GROUPS = ['startup', 'hydro', 'methods', 'coupler', 'io']
+# model combinations (MINAC, OMAC) of the coupler benchmarks
+COUPLER_COMBOS = [('F07MOD', 'DA07MOD'), ('M12MOD', 'M12MOD'),
+                  ('KM12MOD', 'KM12MOD'), ('DA07MOD', 'K16MOD')]
+# forcing files of the startup benchmark (namelist file, variable, step unit)
+FORCING_FILES = [('SLR', 'SLR', 'year'), ('Tair', 'Tair', 'hour'),
+                 ('U10', 'U10', 'minute'), ('h', 'h', 'minute'),
+                 ('Wave', 'Twav', 'minute'), ('SSC', 'TSM', 'minute')]
+NSITE = 8       # number of sites of the synthetic case
+NDAY = 1        # number of simulated days of the hydro and coupler benchmarks
+
+def time_call(func, repeat, number=1):
+    """Time a function.
+    Arguments:
+        func : function without arguments
+        repeat : number of timing repeats
+        number : number of calls per repeat
+    Returns : list of seconds per call of each repeat
+    """
+    times = []
+    for __ in range(repeat):
+        t0 = time.perf_counter()
+        for __ in range(number):
+            func()
+        times.append((time.perf_counter() - t0) / number)
+    return times
+
+def get_git_revision():
+    """Get the git revision of the source tree.
+    Arguments:
+    Returns : commit hash or empty string if unknown
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=syn.SRC_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def get_machine_info():
+    """Get the description of the benchmark machine.
+    Arguments:
+    Returns : dictionary of machine and software information
+    """
+    return {'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'revision': get_git_revision(),
+            'date': datetime.now().isoformat(timespec='seconds')}
+
+def import_hydro_module(module_dir):
+    """Import the compiled hydrodynamic core.
+    Arguments:
+        module_dir : directory of the TAIHydroMOD library (empty for src)
+    Returns : tai_hydro_mod object or None if it is not built
+    """
+    if len(module_dir)>0:
+        sys.path.insert(0, os.path.abspath(module_dir))
+    try:
+        module = importlib.import_module('TAIHydroMOD')
+    except ImportError:
+        return None
+    return module.tai_hydro_mod
+
+def get_model_classes(module_name, xmlfile):
+    """Get the model classes that have parameters in a parameter file.
+    Arguments:
+        module_name : model module name
+        xmlfile : parameter file
+    Returns : list of (class name, class, parameters)
+    """
+    module = importlib.import_module(module_name)
+    classes = []
+    for name, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__!=module_name:
+            continue
+        params = utils.parseXML_params(xmlfile, name)
+        if len(params)>0:
+            classes.append((name, cls, params))
+    return classes
+
+def compare_results(results, baseline, threshold):
+    """Compare benchmark results with a baseline.
+    Arguments:
+        results : benchmark results
+        baseline : baseline benchmark results
+        threshold : relative slowdown of a regression
+    Returns : list of regressed benchmark names
+    """
+    regressions = []
+    print('{:<40s} {:>12s} {:>12s} {:>8s}'.format('benchmark', 'baseline',
+          'current', 'ratio'))
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            print('{:<40s} {:>12s} {:>12.4g}'.format(name, 'new',
+                  result['rate']))
+            continue
+        base = baseline['benchmarks'][name]
+        ratio = result['median'] / base['median']
+        status = ''
+        if ratio>1.0+threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio<1.0/(1.0+threshold):
+            status = 'faster'
+        print('{:<40s} {:>12.4g} {:>12.4g} {:>8.3f} {:s}'.format(name,
+              base['rate'], result['rate'], ratio, status))
+    print('rates are in ' + ', '.join(sorted(set(result['unit'] for result
+          in results['benchmarks'].values()))))
+    return regressions
+
+###############################################################################
+class BenchmarkSuite(object):
+    """Benchmarks of a synthetic MACES case.
+
+    Attributes:
+        m_case_dir : synthetic case directory
+        m_config : case configuration
+        m_taihydro : hydrodynamic core (None if it is not built)
+        m_repeat : number of timing repeats
+        m_quick : True to run the short platform and default models only
+        m_sizes : benchmarked platform sizes
+        m_results : benchmark results keyed by name
+    """
+
+    # constructor
+    def __init__(self, case_dir, taihydro, repeat, quick):
+        self.m_case_dir = case_dir
+        namelist_file = syn.make_case(case_dir, NSITE, NDAY)
+        self.m_config = mcfg.MacesConfig.from_xml(namelist_file)
+        self.m_taihydro = taihydro
+        self.m_repeat = repeat
+        self.m_quick = quick
+        self.m_results = {}
+        self.m_sizes = ['short'] if quick else ['short', 'long']
+
+    def record(self, name, times, work, unit, **extra):
+        """Record the timing of a benchmark.
+        Arguments:
+            name : benchmark name
+            times : list of seconds per call
+            work : work amount per call in rate units
+            unit : rate unit
+            extra : additional result items
+        Returns :
+        """
+        median = float(np.median(times))
+        result = {'median': median, 'min': float(np.min(times)),
+                  'repeat': len(times), 'rate': work / median,
+                  'unit': unit}
+        result.update(extra)
+        self.m_results[name] = result
+        print('{:<40s} {:>11.4g} s {:>12.4g} {:s}'.format(name, median,
+              result['rate'], unit))
+        sys.stdout.flush()
+
+    def get_params(self, minac, omac):
+        """Get the linked parameters of a model combination.
+        Arguments:
+            minac : mineral accretion model
+            omac : organic matter accretion model
+        Returns : dictionary of component parameters
+        """
+        params = self.m_config.get_params()
+        namelist = self.m_config.get_namelist()
+        params['MINAC'] = utils.parseXML_params(namelist['MINAC_FILE'], minac)
+        params['OMAC'] = utils.parseXML_params(namelist['OMAC_FILE'], omac)
+        ens.link_model_params(params)
+        return params
+
+    def init_hydro(self, plat, params):
+        """Initialize the hydrodynamic core on a platform.
+        Arguments:
+            plat : platform dictionary
+            params : dictionary of component parameters
+        Returns :
+        """
+        namelist = self.m_config.get_namelist()
+        hydro_params = params['HYDRO']
+        self.m_taihydro.inithydromod(plat['x'], plat['zh'], plat['fetch'],
+            1e-3*syn.SITE_TEMPLATE['TSM'], len(namelist['HYDRO_TOL']),
+            TAIMODSuper.npft)
+        self.m_taihydro.setmodelparams(hydro_params['d50'],
+            hydro_params['Cz0'], hydro_params['Kdf'], hydro_params['cbc'],
+            hydro_params['cwc'], hydro_params['fr'], hydro_params['alphaA'],
+            hydro_params['betaA'], hydro_params['alphaD'],
+            hydro_params['betaD'], hydro_params['cD0'], hydro_params['ScD'])
+
+    def bench_startup(self):
+        namelist = self.m_config.get_namelist()
+        namelist_file = os.path.join(self.m_case_dir, mcfg.NAMELIST_FILE)
+        times = time_call(lambda: mcfg.MacesConfig.from_xml(namelist_file),
+                          self.m_repeat)
+        self.record('startup/load_config', times, 1.0, 'cases/s')
+
+        read_sites = lambda: utils.read_site_database(namelist['SITE_FILE'],
+            1, NSITE)
+        times = time_call(read_sites, self.m_repeat)
+        self.record('startup/read_site_database', times, NSITE, 'sites/s')
+
+        date0 = datetime.strptime(namelist['RUN_STARTDATE'], '%Y-%m-%d')
+        date1 = datetime.strptime(namelist['RUN_STOPDATE'], '%Y-%m-%d')
+        def read_forcings():
+            for key, varname, unit in FORCING_FILES:
+                utils.read_force_data(namelist['FILE_' + key], varname,
+                    date0.date(), date1.date(), namelist[key + '_TSTEP'],
+                    unit, [0, NSITE])
+        times = time_call(read_forcings, self.m_repeat)
+        self.record('startup/read_forcings', times, NSITE, 'sites/s')
+
+        site_db = read_sites()
+        def build_platforms():
+            diva_segments, pft_segments, pft_codes, __ = \
+                utils.build_platform_segments(site_db, TAIMODSuper.npft)
+            for ii in range(NSITE):
+                indice = pft_codes[ii]>=0
+                utils.construct_site_platform(diva_segments[ii],
+                    site_db['coastline'][ii], site_db['fetchagl'][ii],
+                    namelist['CELL_RES'], namelist['CELL_NUM'],
+                    pft_segments[ii][indice], pft_codes[ii][indice])
+        times = time_call(build_platforms, self.m_repeat)
+        self.record('startup/build_platforms', times, NSITE, 'sites/s')
+
+    def bench_hydro(self):
+        if self.m_taihydro is None:
+            print('hydro benchmarks are skipped: TAIHydroMOD is not built')
+            return
+        taihydro = self.m_taihydro
+        namelist = self.m_config.get_namelist()
+        params = self.get_params(namelist['MINAC_TYPE'],
+                                 namelist['OMAC_TYPE'])
+        forcings = syn.get_site_forcings(NDAY)
+        imex = namelist['HYDRO_SCHEME']=='imex'
+        for size in self.m_sizes:
+            plat = syn.get_site_platform(size)
+            nx = len(plat['x'])
+            zeros = np.zeros(nx, dtype=np.float64, order='F')
+            xref = utils.get_refshore_coordinate(plat['x'], plat['zh'])
+            nstep = [0]
+            def run_hydro():
+                self.init_hydro(plat, params)
+                t = 0.0
+                curstep = 50.0
+                nstep[0] = 0
+                while t <= 8.64e4 * NDAY:
+                    indx = utils.get_forcing_index(t, 'minute',
+                                                   namelist['h_TSTEP'])
+                    taihydro.modelsetup(zeros, zeros, plat['zh'],
+                        plat['pft'], zeros, xref, forcings['Twav'][indx],
+                        forcings['h0'][indx] - plat['zh'][0],
+                        forcings['U10'][indx], forcings['Cs0'][indx])
+                    curstep, nextstep, error = taihydro.modelrun(cpl.rk4_mode,
+                        imex, namelist['HYDRO_TOL'], namelist['DYN_CHECK'],
+                        curstep)
+                    assert error==0, "runge-Kutta iteration is more than MAXITER"
+                    taihydro.modelcallback(namelist['WAVE_TYPE'])
+                    t = t + curstep
+                    curstep = max(nextstep, 0.1)
+                    nstep[0] = nstep[0] + 1
+                taihydro.finalizehydromod()
+            times = time_call(run_hydro, self.m_repeat)
+            self.record('hydro/' + size, times, NDAY*3600.0,
+                        'site-days/core-hour', nx=nx, steps=nstep[0])
+
+    def bench_methods(self):
+        namelist = self.m_config.get_namelist()
+        plat = syn.get_site_platform(self.m_sizes[-1])
+        x = plat['x']
+        zh = plat['zh']
+        pft = plat['pft']
+        nx = len(x)
+        npool = TAIMODSuper.npool
+        h = np.maximum(0.3 - zh, 0.0)
+        wet = (h>0).astype(np.float64)
+        zeros = np.zeros(nx, dtype=np.float64, order='F')
+        mac_inputs = {'x': x, 'xref': utils.get_refshore_coordinate(x, zh),
+                      'pft': pft, 'zh': zh, 'Css': 0.02*wet, 'tau': 0.3*wet,
+                      'U': 0.2*wet, 'h': h, 'Bag': np.where(pft>=2, 0.5, 0.0),
+                      'Esed': zeros, 'Dsed': zeros, 'Lbed': zeros,
+                      'S': utils.get_platform_slope(x, zh), 'dtau': zeros,
+                      'TR': syn.SITE_TEMPLATE['mtidalrng'], 'dt': 60.0,
+                      'refCss': 1e-3*syn.SITE_TEMPLATE['TSM']}
+        omac_inputs = {'x': x, 'zh': zh, 'S': mac_inputs['S'], 'pft': pft,
+                       'OM': 10.0*np.ones((nx,npool), order='F'),
+                       'Bag': mac_inputs['Bag'], 'Bbg': mac_inputs['Bag'],
+                       'DepOM': zeros,
+                       'DecayOM': np.zeros((nx,npool), order='F'),
+                       'TR': syn.SITE_TEMPLATE['mtidalrng'],
+                       'MHHW': syn.SITE_TEMPLATE['mhws'], 'month': 7,
+                       'doy': 180, 'Tair': 293.0}
+        number = 50
+        for name, cls, params in get_model_classes('minac_mod',
+                                                   namelist['MINAC_FILE']):
+            model = cls(params)
+            def run_minac():
+                model.mineral_suspension(mac_inputs)
+                model.mineral_deposition(mac_inputs)
+                model.bed_loading(mac_inputs)
+            times = time_call(run_minac, self.m_repeat, number)
+            self.record('methods/MINAC/' + name, times, 1.0, 'steps/s',
+                        nx=nx)
+        for name, cls, params in get_model_classes('omac_mod',
+                                                   namelist['OMAC_FILE']):
+            model = cls(params)
+            def run_omac():
+                model.aboveground_biomass(omac_inputs)
+                model.belowground_biomass(omac_inputs)
+                model.organic_deposition(omac_inputs)
+                model.soilcarbon_decay(omac_inputs)
+            times = time_call(run_omac, self.m_repeat, number)
+            self.record('methods/OMAC/' + name, times, 1.0, 'steps/s',
+                        nx=nx)
+
+    def bench_coupler(self):
+        if self.m_taihydro is None:
+            print('coupler benchmarks are skipped: TAIHydroMOD is not built')
+            return
+        namelist = self.m_config.get_namelist()
+        forcings = syn.get_site_forcings(NDAY)
+        combos = COUPLER_COMBOS[:1] if self.m_quick else COUPLER_COMBOS
+        mac_module = importlib.import_module('minac_mod')
+        omac_module = importlib.import_module('omac_mod')
+        wavero_module = importlib.import_module('wavero_mod')
+        lndmgr_module = importlib.import_module('lndmgr_mod')
+        for size in self.m_sizes:
+            plat = syn.get_site_platform(size)
+            nx = len(plat['x'])
+            for minac, omac in combos:
+                params = self.get_params(minac, omac)
+                def run_coupler():
+                    models = {'taihydro': self.m_taihydro,
+                        'mac_mod': getattr(mac_module, minac)(params['MINAC']),
+                        'omac_mod': getattr(omac_module, omac)(params['OMAC']),
+                        'wavero_mod': getattr(wavero_module,
+                            namelist['WAVERO_TYPE'])(params['WAVERO']),
+                        'lndmgr_mod': getattr(lndmgr_module,
+                            namelist['LNDMGR_TYPE'])(params['LNDMGR'])}
+                    tai_state = {'pft': np.array(plat['pft'], order='F'),
+                        'zh': np.array(plat['zh'], order='F'),
+                        'Bag': np.zeros(nx, dtype=np.float64, order='F'),
+                        'Bbg': np.zeros(nx, dtype=np.float64, order='F'),
+                        'OM': np.zeros((nx,TAIMODSuper.npool),
+                                       dtype=np.float64, order='F')}
+                    input_data = {'coord': {'x': plat['x'], 'dx': plat['dx'],
+                                            'fetch': plat['fetch']},
+                                  'state': tai_state, 'forcings': forcings,
+                                  'namelist': namelist}
+                    self.init_hydro(plat, params)
+                    try:
+                        cpl.run_tai_maces(input_data, models, False)
+                    finally:
+                        self.m_taihydro.finalizehydromod()
+                times = time_call(run_coupler, self.m_repeat)
+                self.record('coupler/' + size + '/' + minac + '-' + omac,
+                            times, NDAY*3600.0, 'site-days/core-hour', nx=nx)
+
+    def bench_io(self):
+        namelist = self.m_config.get_namelist()
+        plat = syn.get_site_platform(self.m_sizes[-1])
+        x = plat['x']
+        nx = len(x)
+        nt_hydro = 24 * NDAY + 1
+        nt_ecogeom = NDAY
+        rng = np.random.default_rng(0)
+        uhydro_out = {'x': np.float32(x)}
+        for key, __, __, __, __, __ in utils.HYDRO_OUTPUT_VARS:
+            uhydro_out[key] = rng.random((nt_hydro,nx)).astype(np.float32)
+        ecogeom_out = archive.EcogeomArchive(x, nt_ecogeom,
+                                             TAIMODSuper.npool).finalize()
+        for key, __, __, __, __, __ in utils.ECOGEOM_OUTPUT_VARS:
+            if key!='pft':
+                ecogeom_out[key][:] = rng.random(np.shape(ecogeom_out[key]))
+        ecogeom_out['pft'][:] = plat['pft']
+        out_dir = os.path.join(self.m_case_dir, 'out')
+        filename = os.path.join(out_dir, 'bench_hydro.nc')
+        times = time_call(lambda: utils.write_hydro_outputs(filename,
+            namelist['HYDRO_TSTEP'], uhydro_out), self.m_repeat)
+        self.record('io/write_hydro_outputs', times, 1.0, 'files/s', nx=nx)
+        filename = os.path.join(out_dir, 'bench_ecogeom.nc')
+        times = time_call(lambda: utils.write_ecogeom_outputs(filename,
+            namelist['ECOGEOM_TSTEP'], ecogeom_out), self.m_repeat)
+        self.record('io/write_ecogeom_outputs', times, 1.0, 'files/s', nx=nx)
+        filename = os.path.join(out_dir, 'bench_shard.nc')
+        def append_sites():
+            if os.path.exists(filename):
+                os.remove(filename)
+            for ii in range(NSITE):
+                utils.append_site_outputs(filename, namelist['HYDRO_TSTEP'],
+                    'hydro', ii, uhydro_out)
+        times = time_call(append_sites, self.m_repeat)
+        self.record('io/append_site_outputs', times, NSITE, 'sites/s', nx=nx)
+
+    def run(self, groups):
+        """Run benchmark groups.
+        Arguments:
+            groups : list of benchmark group names
+        Returns : dictionary of the machine information and results
+        """
+        for group in groups:
+            getattr(self, 'bench_' + group)()
+        return {'machine': get_machine_info(), 'repeat': self.m_repeat,
+                'quick': self.m_quick, 'benchmarks': self.m_results}
+
+if __name__=='__main__':
+
+    parser = OptionParser()
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      default="benchmark_results.json",
+                      help="benchmark result json file")
+    parser.add_option("-b", "--baseline", dest="baseline", metavar="FILE",
+                      default="", help="baseline result json file to compare")
+    parser.add_option("-t", "--threshold", dest="threshold", type="float",
+                      default=0.15, help="relative slowdown of a regression")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=3, help="number of timing repeats")
+    parser.add_option("-g", "--groups", dest="groups",
+                      default=','.join(BENCHMARK_GROUPS),
+                      help="comma separated benchmark groups")
+    parser.add_option("-m", "--module-dir", dest="module_dir", default="",
+                      help="directory of the built TAIHydroMOD library")
+    parser.add_option("-q", "--quick", dest="quick", action="store_true",
+                      default=False,
+                      help="run the short platform and default models only")
+    (options, args) = parser.parse_args()
+
+    groups = [group.strip() for group in options.groups.split(',')]
+    for group in groups:
+        assert group in BENCHMARK_GROUPS, "unknown benchmark group " + group
+    taihydro = import_hydro_module(options.module_dir)
+
+    case_dir = tempfile.mkdtemp(prefix='maces_bench_')
+    try:
+        suite = BenchmarkSuite(case_dir, taihydro, options.repeat,
+                               options.quick)
+        results = suite.run(groups)
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if len(options.baseline)>0:
+        with open(options.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, options.threshold)
+        if len(regressions)>0:
+            print('performance regressions: ' + ', '.join(regressions))
+            sys.exit(1)
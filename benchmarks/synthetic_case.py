@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic sites and forcings of the MACES benchmarks
+
+The synthetic site is modeled on a DIVA segment of the Hunter Estuary with
+three vegetated pft segments. Forcings are a semidiurnal plus diurnal tide,
+a diurnal wind cycle and a seasonal air temperature cycle, so that every
+benchmark is reproducible without external data.
+"""
+
+import os
+import sys
+import shutil
+import numpy as np
+import pandas as pd
+from netCDF4 import Dataset
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'src')
+sys.path.insert(0, SRC_DIR)
+
+import maces_config as mcfg
+import maces_utilities as utils
+
+REF_DATE = 20040101     # reference date of synthetic forcings
+# site database columns of the reference site
+SITE_TEMPLATE = {'DIVA_ID': 466, 'Latitude': -32.85, 'Longitude': 151.75,
+                 'coastline': 113.06, 'fetchagl': 30, 'mtidalrng': 0.842,
+                 'mhws': 0.581, 'mhwn': 0.242, 'uplift': 0.064,
+                 'TSM': 9.41, 'salinity': 28}
+SITE_AREAS = [0.0, 0.0, 0.0, 339.2, 621.8, 508.8, 418.3, 192.2, 768.8,
+              1175.8, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+SITE_PFTS = [18.4, 1.6, 15.6, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+SITE_PFT_ORDERS = [1, 0, 2, -1, -1, -1, -1, -1, -1, -1]
+# platform sizes (maximum cell number in a DIVA segment)
+PLATFORM_SIZES = {'short': 10, 'long': 50}
+CELL_RES = 5.0          # reference node cell length (m)
+
+def make_site_database(nsite, seed=0):
+    """Make a synthetic site database. Sites differ in their coastline
+       length and upper platform areas.
+    Arguments:
+        nsite : number of sites
+        seed : random seed
+    Returns : site database data frame
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for ii in range(nsite):
+        row = dict(SITE_TEMPLATE)
+        row['DIVA_ID'] = SITE_TEMPLATE['DIVA_ID'] + ii
+        row['coastline'] = SITE_TEMPLATE['coastline'] * \
+            (0.8 + 0.4*rng.random())
+        scale = 1.0 + 0.3*rng.random()
+        for jj, area in enumerate(SITE_AREAS):
+            row['area{:02d}'.format(jj+1)] = area*scale if jj>=8 else area
+        for jj, length in enumerate(SITE_PFTS):
+            row['pft{:d}'.format(jj)] = length
+        for jj, order in enumerate(SITE_PFT_ORDERS):
+            row['pft{:d}_order'.format(jj)] = order
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def get_site_platform(size='short'):
+    """Construct the platform of the reference site.
+    Arguments:
+        size : platform size (short or long)
+    Returns : platform dictionary of construct_site_platform
+    """
+    diva_segments = np.array(SITE_AREAS) / SITE_TEMPLATE['coastline']
+    orders = np.array(SITE_PFT_ORDERS)
+    pfts = np.argsort(np.where(orders>=0, orders, 99), kind='stable')
+    pfts = pfts[:np.sum(orders>=0)]
+    segments = np.array(SITE_PFTS)[pfts]
+    return utils.construct_site_platform(diva_segments,
+        SITE_TEMPLATE['coastline'], SITE_TEMPLATE['fetchagl'], CELL_RES,
+        PLATFORM_SIZES[size], segments, pfts)
+
+def get_tide_level(t):
+    """Get the synthetic tide level.
+    Arguments:
+        t : time since the reference date (s)
+    Returns : tide level (msl)
+    """
+    return 0.45*np.sin(2*np.pi*t/44712.0) + 0.1*np.sin(2*np.pi*t/86400.0)
+
+def get_site_forcings(nday, minute_step=15):
+    """Get the synthetic forcings of a site for the coupler.
+    Arguments:
+        nday : number of simulated days
+        minute_step : time step (minute) of tide, wind, wave and SSC
+    Returns : forcing dictionary of run_tai_maces
+    """
+    nt = (nday + 1) * 24 * 60 // minute_step
+    t = 60.0 * minute_step * np.arange(nt)
+    forcings = {}
+    forcings['h0'] = get_tide_level(t)
+    forcings['U10'] = 5.0 + 2.0*np.sin(2*np.pi*t/86400.0)
+    forcings['Twav'] = 3.0 * np.ones(nt)
+    forcings['Cs0'] = 1e-3 * (20.0 + 5.0*np.sin(2*np.pi*t/44712.0))
+    forcings['Tair'] = 288.0 + 5.0*np.sin(2*np.pi*np.arange(nday+1)/365.0)
+    forcings['rslr'] = 3.0 * np.ones(10) - SITE_TEMPLATE['uplift']
+    forcings['sal'] = float(SITE_TEMPLATE['salinity'])
+    forcings['trng'] = SITE_TEMPLATE['mtidalrng']
+    forcings['mhws'] = SITE_TEMPLATE['mhws']
+    forcings['mhwn'] = SITE_TEMPLATE['mhwn']
+    forcings['refCss'] = 1e-3 * SITE_TEMPLATE['TSM']
+    return forcings
+
+def write_forcings(case_dir, nsite, nday, minute_step=15):
+    """Write synthetic forcing files of all sites.
+    Arguments:
+        case_dir : case directory
+        nsite : number of sites
+        nday : number of days
+        minute_step : time step (minute) of tide, wind, wave and SSC
+    Returns :
+    """
+    forcings = get_site_forcings(nday, minute_step)
+    files = [('force_h.nc', 'h', forcings['h0']),
+             ('force_U10.nc', 'U10', forcings['U10']),
+             ('force_wave.nc', 'Twav', forcings['Twav']),
+             ('force_SSC.nc', 'TSM', 1e3*forcings['Cs0']),
+             ('force_Tair.nc', 'Tair', forcings['Tair']),
+             ('force_SLR.nc', 'SLR', 3.0*np.ones(10))]
+    for filename, varname, data in files:
+        try:
+            nc = Dataset(os.path.join(case_dir, filename), 'w')
+            nc.createDimension('time', None)
+            nc.createDimension('site', nsite)
+            var = nc.createVariable('date', 'i4')
+            var.assignValue(REF_DATE)
+            var = nc.createVariable(varname, 'f8', ('time','site'))
+            var[:] = np.repeat(data[:,None], nsite, axis=1)
+        finally:
+            nc.close()
+
+def make_case(case_dir, nsite=4, nday=2, minac='F07MOD', omac='DA07MOD'):
+    """Make a synthetic MACES case from the namelist and parameter files
+       of the source directory.
+    Arguments:
+        case_dir : case directory
+        nsite : number of sites
+        nday : number of simulated days
+        minac : mineral accretion model
+        omac : organic matter accretion model
+    Returns : namelist file of the case
+    """
+    os.makedirs(os.path.join(case_dir, 'out'), exist_ok=True)
+    for filename in [mcfg.NAMELIST_FILE] + \
+            list(mcfg.COMPONENT_FILES.values()):
+        shutil.copy(os.path.join(SRC_DIR, filename), case_dir)
+    make_site_database(nsite).to_excel(os.path.join(case_dir,
+        'DIVA_maces.xlsx'), sheet_name=utils.SITE_SHEET, index=False)
+    write_forcings(case_dir, nsite, nday + 2)
+    stop_day = 1 + nday
+    mcfg.edit_case(case_dir, {
+        'NAMELIST:RUNROOT': os.path.abspath(case_dir),
+        'NAMELIST:DIN_ROOT': os.path.abspath(case_dir),
+        'NAMELIST:DOUT_ROOT': os.path.abspath(os.path.join(case_dir, 'out')),
+        'NAMELIST:SITE_FILE': os.path.abspath(os.path.join(case_dir,
+            'DIVA_maces.xlsx')),
+        'NAMELIST:MINAC_TYPE': minac, 'NAMELIST:OMAC_TYPE': omac,
+        'NAMELIST:RUN_STARTDATE': '2004-01-01',
+        'NAMELIST:RUN_STOPDATE': '2004-01-{:02d}'.format(stop_day),
+        'NAMELIST:SPINUP_N': 1, 'NAMELIST:FIRST_ID': 1,
+        'NAMELIST:LAST_ID': nsite, 'NAMELIST:Verbose': 'FALSE'})
+    return os.path.join(case_dir, mcfg.NAMELIST_FILE)
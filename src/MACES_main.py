@@ -8,300 +8,559 @@ Main program to run the MACES model
 @author: Zeli Tan
 """
 
+import os
 import sys
+import copy
 import importlib
 import TAIMODSuper
-import pandas as pd
 import numpy as np
 import maces_utilities as utils
 import maces_coupler as cpl
+import maces_archive as archive
+import maces_ensemble as ens
+import maces_config as mcfg
+import maces_executor as mexe
+import maces_profile as mprof
 from datetime import date
-from mpi4py import MPI
 from optparse import OptionParser
 from TAIHydroMOD import tai_hydro_mod as taihydro
-        
-if __name__=='__main__':
-    
-    # use the OptionParser to parse the command line options
-    parser = OptionParser()
-    parser.add_option("-f", "--file", type="string", dest="filename", 
-                      default='namelist.maces.xml')
-    (options, args) = parser.parse_args()
-    
-    # MPI commands
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    numprocs = comm.Get_size()
-    
-    if rank == 0:
-        master_process = True
-    else:
-        master_process = False
-        
-    # set how the run status is shown
-    #np.set_printoptions(precision=3, suppress=True)
-    np.set_printoptions(precision=3, suppress=False)
-        
-    # read MACES namelist xml file and parameter xml files
-    if master_process:
-        # MACES namelist xml file
-        namelist = utils.parseXML_namelist(options.filename)
-        # MINAC model xml file
-        xmlfile = namelist['MINAC_FILE']
-        mac_name = namelist['MINAC_TYPE']
-        mac_params = utils.parseXML_params(xmlfile, mac_name)
-        # OMAC model xml file
-        xmlfile = namelist['OMAC_FILE']
-        omac_name = namelist['OMAC_TYPE']
-        omac_params = utils.parseXML_params(xmlfile, omac_name)
-        # WAVERO model xml file
-        xmlfile = namelist['WAVERO_FILE']
-        wavero_name = namelist['WAVERO_TYPE']
-        wavero_params = utils.parseXML_params(xmlfile, wavero_name)
-        # LNDMGR model xml file
-        xmlfile = namelist['LNDMGR_FILE']
-        lndmgr_name = namelist['LNDMGR_TYPE']
-        lndmgr_params = utils.parseXML_params(xmlfile, lndmgr_name)
-        # hydrodynamic model xml file
-        xmlfile = namelist['HYDRO_FILE']
-        hydro_params = utils.parseXML_hydro_params(xmlfile)
-    else:
-        namelist = None
-        mac_params = None
-        omac_params = None
-        wavero_params = None
-        lndmgr_params = None
-        hydro_params = None
-    namelist = comm.bcast(namelist, root=0)
-    mac_params = comm.bcast(mac_params, root=0)
-    omac_params = comm.bcast(omac_params, root=0)
-    wavero_params = comm.bcast(wavero_params, root=0)
-    lndmgr_params = comm.bcast(lndmgr_params, root=0)
-    hydro_params = comm.bcast(hydro_params, root=0)
-    # make parameters of different components consistent
-    hydro_params['d50'] = mac_params['d50']
-    if 'alphaA' in mac_params:
-        hydro_params['alphaA'] = mac_params['alphaA']
-    if 'betaA' in mac_params:
-        hydro_params['betaA'] = mac_params['betaA']
-    if 'alphaD' in mac_params:
-        hydro_params['alphaD'] = mac_params['alphaD']
-    if 'betaD' in mac_params:
-        hydro_params['betaD'] = mac_params['betaD']
-    if 'Bmax' in omac_params:
-        mac_params['Bmax'] = omac_params['Bmax']
-    
-    # read site database excel file
-    if master_process:
-        df = pd.read_excel(namelist['SITE_FILE'], sheet_name="diva", header=0, 
-                           usecols="A:AV")
-    else:
-        df = None
-    df = comm.bcast(df, root=0)
-    site_ids = np.array(df['DIVA_ID'], dtype=np.int32)
-    site_coastline = np.array(df['coastline'], dtype=np.float64)    # km
-    site_fetchagl = np.array(df['fetchagl'], dtype=np.float64)      # degree
-    site_trng = np.array(df['mtidalrng'], dtype=np.float64)         # m
-    site_mhws = np.array(df['mhws'], dtype=np.float64)              # m
-    site_mhwn = np.array(df['mhwn'], dtype=np.float64)              # m
-    site_uplift = np.array(df['uplift'], dtype=np.float64)          # mm/yr
-    site_TSM = 1e-3 * np.array(df['TSM'], dtype=np.float64)         # kg/m3
-    site_sal = np.array(df['salinity'], dtype=np.float64)           # PSU
-    nsite = np.size(site_ids)
-    site_n = min(namelist['LAST_ID'], nsite)
+
+def read_forcings(namelist, site_db):
+    """Read the driving data of the simulated sites.
+    Arguments:
+        namelist : MACES namelist
+        site_db : site database
+    Returns : dictionary of forcing arrays (time,site)
+    """
     site_1 = namelist['FIRST_ID'] - 1
-    nrun = site_n - site_1
-    site_ids = site_ids[site_1:site_n]
-    site_coastline = site_coastline[site_1:site_n]
-    site_fetchagl = site_fetchagl[site_1:site_n]
-    site_trng = site_trng[site_1:site_n]
-    site_mhws = site_mhws[site_1:site_n]
-    site_mhwn = site_mhwn[site_1:site_n]
-    site_uplift = site_uplift[site_1:site_n]
-    site_TSM = site_TSM[site_1:site_n]
-    site_sal = site_sal[site_1:site_n]
-    npft = TAIMODSuper.npft
-    npool = TAIMODSuper.npool
-    
-    diva_segments = []
-    pft_segments = []
-    pft_orders = []
-    for ii, site in enumerate(np.arange(site_1,site_n)):
-        area = np.zeros(utils.NTOPSEG, dtype=np.float64)
-        for jj in range(utils.NTOPSEG):
-            code = 'area' + '{:02d}'.format(jj+1)
-            area[jj] = float(df[code][site])
-        segments = area / site_coastline[ii]
-        diva_segments.append(segments)
-        segments = np.zeros(npft, dtype=np.float64)
-        orders = np.zeros(npft, dtype=np.int32)
-        for jj in range(npft):
-            code = 'pft' + '{:d}'.format(jj)
-            segments[jj] = float(df[code][site])
-            code = 'pft' + '{:d}'.format(jj) + '_order'
-            orders[jj] = int(df[code][site])
-            assert (segments[jj]>0)==(orders[jj]>=0), "inconsistent pft segment found"
-        pft_segments.append(segments)
-        pft_orders.append(orders)
-        
-    # read driving data
-    # units: SLR (mm/yr), Tair (K), U10 (m/s), h0 (m), U0 (m/s), 
-    #        Hwav0 (m), Twav (s)
+    site_n = site_1 + len(site_db['DIVA_ID'])
+    site_TSM = 1e-3 * np.array(site_db['TSM'], dtype=np.float64)        # kg/m3
     sid_range = [site_1, site_n]
     date0_str = namelist['RUN_STARTDATE'].split('-')
     date1_str = namelist['RUN_STOPDATE'].split('-')
     run_date0 = date(int(date0_str[0]), int(date0_str[1]), int(date0_str[2]))
     run_date1 = date(int(date1_str[0]), int(date1_str[1]), int(date1_str[2]))
-    if master_process:
-        SLR = utils.read_force_data(namelist['FILE_SLR'], 'SLR', \
-            run_date0, run_date1, namelist['SLR_TSTEP'], 'year', sid_range)
-        Tair = utils.read_force_data(namelist['FILE_Tair'], 'Tair', \
-            run_date0, run_date1, namelist['Tair_TSTEP'], 'hour', sid_range)
-        U10 = utils.read_force_data(namelist['FILE_U10'], 'U10', \
-            run_date0, run_date1, namelist['U10_TSTEP'], 'minute', sid_range)
-        h0 = utils.read_force_data(namelist['FILE_h'], 'h', \
-            run_date0, run_date1, namelist['h_TSTEP'], 'minute', sid_range)
-        Twav = utils.read_force_data(namelist['FILE_Wave'], 'Twav', \
-            run_date0, run_date1, namelist['Wave_TSTEP'], 'minute', sid_range)
-        if len(namelist['FILE_SSC'])>0:
-            SSC = 1e-3 * utils.read_force_data(namelist['FILE_SSC'], 'TSM', \
-                run_date0, run_date1, namelist['SSC_TSTEP'], 'minute', sid_range)
-        else:
-            nt_ssc = np.shape(h0)[0] * int(namelist['SSC_TSTEP']/namelist['h_TSTEP'])
-            nsite_ssc = np.shape(h0)[1]
-            SSC = np.zeros((nt_ssc,nsite_ssc))
-            for ii, site in enumerate(np.arange(site_1,site_n)):
-                SSC[:,ii] = site_TSM[ii]
+    # the platform evolves MORFAC years of sea level rise every run year
+    slr_date1 = utils.get_morphological_date(run_date0, run_date1, 
+                                             namelist['MORFAC'])
+    SLR = utils.read_force_data(namelist['FILE_SLR'], 'SLR', \
+        run_date0, slr_date1, namelist['SLR_TSTEP'], 'year', sid_range)
+    Tair = utils.read_force_data(namelist['FILE_Tair'], 'Tair', \
+        run_date0, run_date1, namelist['Tair_TSTEP'], 'hour', sid_range)
+    U10 = utils.read_force_data(namelist['FILE_U10'], 'U10', \
+        run_date0, run_date1, namelist['U10_TSTEP'], 'minute', sid_range)
+    h0 = utils.read_force_data(namelist['FILE_h'], 'h', \
+        run_date0, run_date1, namelist['h_TSTEP'], 'minute', sid_range)
+    Twav = utils.read_force_data(namelist['FILE_Wave'], 'Twav', \
+        run_date0, run_date1, namelist['Wave_TSTEP'], 'minute', sid_range)
+    if len(namelist['FILE_SSC'])>0:
+        SSC = 1e-3 * utils.read_force_data(namelist['FILE_SSC'], 'TSM', \
+            run_date0, run_date1, namelist['SSC_TSTEP'], 'minute', sid_range)
     else:
-        SLR = None
-        Tair = None
-        U10 = None
-        h0 = None
-        Twav = None
-        SSC = None
-    SLR = comm.bcast(SLR, root=0)
-    Tair = comm.bcast(Tair, root=0)
-    U10 = comm.bcast(U10, root=0)
-    h0 = comm.bcast(h0, root=0)
-    Twav = comm.bcast(Twav, root=0)
-    SSC = comm.bcast(SSC, root=0)
+        nt_ssc = np.shape(h0)[0] * int(namelist['SSC_TSTEP']/namelist['h_TSTEP'])
+        nsite_ssc = np.shape(h0)[1]
+        SSC = np.zeros((nt_ssc,nsite_ssc))
+        for ii, site in enumerate(np.arange(site_1,site_n)):
+            SSC[:,ii] = site_TSM[ii]
+    return {'SLR': SLR, 'Tair': Tair, 'U10': U10, 'h0': h0, 'Twav': Twav, 
+            'SSC': SSC}
         
-    # load ecogeomorphology modules
-    mac_module = importlib.import_module('minac_mod')
-    mac_class = getattr(mac_module, namelist['MINAC_TYPE'])
-    
-    omac_module = importlib.import_module('omac_mod')
-    omac_class = getattr(omac_module, namelist['OMAC_TYPE'])
+def run_sites(rank, numprocs, context):
+    """Simulate the sites scheduled to a process. Sites are assigned to 
+       processes in a round-robin way and a process stops at its first 
+       failed site.
+    Arguments:
+        rank : rank of the process
+        numprocs : number of processes
+        context : dictionary of the run configuration, site data and forcings
+    Returns : dictionary of the elapsed time of phases and the error message
+    """
+    namelist = context['namelist']
+    base_params = context['base_params']
+    ensemble = context['ensemble']
+    ens_columns = context['ens_columns']
+    ens_samples = context['ens_samples']
+    hydro_replay = context['hydro_replay']
+    site_ids = context['site_ids']
+    site_coastline = context['site_coastline']
+    site_fetchagl = context['site_fetchagl']
+    site_trng = context['site_trng']
+    site_mhws = context['site_mhws']
+    site_mhwn = context['site_mhwn']
+    site_uplift = context['site_uplift']
+    site_TSM = context['site_TSM']
+    site_sal = context['site_sal']
+    diva_segments = context['diva_segments']
+    pft_segments = context['pft_segments']
+    pft_codes = context['pft_codes']
+    SLR = context['forcings']['SLR']
+    Tair = context['forcings']['Tair']
+    U10 = context['forcings']['U10']
+    h0 = context['forcings']['h0']
+    Twav = context['forcings']['Twav']
+    SSC = context['forcings']['SSC']
+    mac_class = context['mac_class']
+    omac_class = context['omac_class']
+    wavero_class = context['wavero_class']
+    lndmgr_class = context['lndmgr_class']
+    stats_vars = context['stats_vars']
+    file_prefix = context['file_prefix']
+    aggregate = context['aggregate']
+    nrun = len(site_ids)
+    nmember = np.shape(ens_samples)[0] if ensemble else 1
+    npft = TAIMODSuper.npft
+    npool = TAIMODSuper.npool
     
-    wavero_module = importlib.import_module('wavero_mod')
-    wavero_class = getattr(wavero_module, namelist['WAVERO_TYPE'])
+    timer = utils.PhaseTimer()
+    result = {'elapsed': timer.m_elapsed, 'error': None, 'profiles': []}
     
-    lndmgr_module = importlib.import_module('lndmgr_mod')
-    lndmgr_class = getattr(lndmgr_module, namelist['LNDMGR_TYPE'])
+    # aggregated outputs are first archived into per-process shards
+    if aggregate:
+        shard_hydro = namelist['DOUT_ROOT'] + '/maces_hydro_' + \
+            file_prefix + '_rank' + '{:04d}'.format(rank) + '.nc'
+        shard_ecogeom = namelist['DOUT_ROOT'] + '/maces_ecogeom_' + \
+            file_prefix + '_rank' + '{:04d}'.format(rank) + '.nc'
+        shard_stats = namelist['DOUT_ROOT'] + '/maces_stats_' + \
+            file_prefix + '_rank' + '{:04d}'.format(rank) + '.nc'
+        for shard in [shard_hydro, shard_ecogeom, shard_stats]:
+            if os.path.exists(shard):
+                os.remove(shard)
         
-    # run simulations (in each iteration, a processor tests the sensitivity of 
-    # one site for all parameters)
     niter = int( np.ceil( float(nrun) / float(numprocs) ) )
     for ii in range(niter):
         iid = np.mod( ii*numprocs + rank, nrun )
         site_id = site_ids[iid]
         print( "Simulate site ", site_id )
         sys.stdout.flush()
+        timer.start('simulate sites')
+        if namelist['PROFILE']:
+            profiler = mprof.SiteProfiler(site_id)
+        else:
+            profiler = None
         
         try:
-            # construct site platform
+            # construct site platform and pft distribution
             xres = namelist['CELL_RES']
             xnum = namelist['CELL_NUM']
-            site_x, site_zh, site_fetch = \
-                utils.construct_tai_platform(diva_segments[iid], site_coastline[iid],
-                                             site_fetchagl[iid], xres, xnum)
+            indice = pft_codes[iid]>=0
+            segments = pft_segments[iid][indice]
+            pfts = pft_codes[iid][indice]
+            platform_args = (diva_segments[iid], site_coastline[iid], 
+                             site_fetchagl[iid], xres, xnum, segments, pfts)
+            if namelist['GRID_TYPE']=='adaptive':
+                platform_args += (namelist['CELL_RES_MAX'], site_trng[iid])
+            platform = None
+            if len(namelist['PLATFORM_CACHE_DIR'])>0:
+                platform_signature = \
+                    utils.get_platform_signature(*platform_args)
+                platform = utils.load_platform_cache( \
+                    namelist['PLATFORM_CACHE_DIR'], platform_signature)
+            if platform is None:
+                platform = utils.construct_site_platform(*platform_args)
+                if len(namelist['PLATFORM_CACHE_DIR'])>0:
+                    utils.save_platform_cache(namelist['PLATFORM_CACHE_DIR'], 
+                        platform_signature, platform, 
+                        namelist['PLATFORM_CACHE_SIZE'])
+            site_x = platform['x']
+            site_zh = platform['zh']
+            site_fetch = platform['fetch']
+            site_pft = platform['pft']
             nx = len(site_x)
-            site_dx = np.zeros(nx, dtype=np.float64, order='F')
-            for jj in range(nx):
-                if jj==0:
-                    site_dx[jj] = 0.5*(site_x[jj+1]-site_x[jj])
-                elif jj==nx-1:
-                    site_dx[jj] = 0.5*(site_x[jj]-site_x[jj-1])
-                else:
-                    site_dx[jj] = 0.5*(site_x[jj+1]-site_x[jj-1])
-            coords = {'x': site_x, 'dx': site_dx}
-            
-            # construct pft distribution
-            orders = pft_orders[iid]
-            segments = pft_segments[iid]
-            pfts = np.arange(npft)
-            indice = orders>=0
-            orders = orders[indice]
-            segments = segments[indice]
-            pfts = pfts[indice]
-            indices = sorted(range(len(orders)), key=lambda k: orders[k])
-            segments = segments[indices]
-            pfts = pfts[indices]
-            site_pft = utils.construct_platform_pft(segments, pfts, site_x)
-            
-            # instantiate hydrodynamics model
-            nvar = len(namelist['HYDRO_TOL'])
-            taihydro.inithydromod(site_x, site_zh, site_fetch, site_TSM[iid], 
-                                  nvar, npft)
-            taihydro.setmodelparams(hydro_params['d50'], hydro_params['Cz0'], 
-                                    hydro_params['Kdf'], hydro_params['cbc'], 
-                                    hydro_params['cwc'], hydro_params['fr'], 
-                                    hydro_params['alphaA'], hydro_params['betaA'], 
-                                    hydro_params['alphaD'], hydro_params['betaD'], 
-                                    hydro_params['cD0'], hydro_params['ScD'])
-        
-            # instantiate ecogeomorphology models
-            mac_mod = mac_class(mac_params)
-            omac_mod = omac_class(omac_params)
-            wavero_mod = wavero_class(wavero_params)
-            lndmgr_mod = lndmgr_class(lndmgr_params)
-            
-            models = {'taihydro': taihydro, 'mac_mod': mac_mod, 
-                      'omac_mod': omac_mod, 'wavero_mod': wavero_mod, 
-                      'lndmgr_mod': lndmgr_mod}
-        
-            # first run the spin-up
-            site_Bag = np.zeros(nx, dtype=np.float64, order='F')
-            site_Bbg = np.zeros(nx, dtype=np.float64, order='F')
-            site_OM = np.zeros((nx,npool), dtype=np.float64, order='F')
-            tai_state = {'pft': site_pft, 'zh': site_zh, 'Bag': site_Bag, 
-                         'Bbg': site_Bbg, 'OM': site_OM}
+            coords = {'x': site_x, 'dx': platform['dx'], 'fetch': site_fetch}
+            if namelist['GRID_TYPE']=='adaptive':
+                coords['xbreak'] = platform['xbreak']
+            if profiler is not None:
+                profiler.lap('platform')
             
+            # site forcings shared by all ensemble members
             rslr = SLR[:,iid] - site_uplift[iid]
             sal = site_sal[iid]
             forcings = {'U10': U10[:,iid], 'Tair': Tair[:,iid], 'h0': h0[:,iid],
                         'Twav': Twav[:,iid], 'Cs0': SSC[:,iid], 'sal': sal, 
                         'rslr': rslr, 'trng': site_trng[iid], 'mhws': site_mhws[iid], 
                         'mhwn': site_mhwn[iid], 'refCss': site_TSM[iid]}
+            nvar = len(namelist['HYDRO_TOL'])
+            
+            # ensemble members are archived into per-process files first
+            if ensemble:
+                ens_files = {}
+                for category in ['hydro', 'ecogeom', 'stats']:
+                    filename = namelist['DOUT_ROOT'] + '/maces_' + \
+                        category + '_' + file_prefix + '_' + \
+                        '{:d}'.format(site_id) + '.nc'
+                    tmpfile = filename + '.rank' + '{:04d}'.format(rank)
+                    if os.path.exists(tmpfile):
+                        os.remove(tmpfile)
+                    ens_files[category] = (tmpfile, filename)
             
-            input_data = {'coord': coords, 'state': tai_state, 
-                          'forcings': forcings, 'namelist': namelist}
-            tai_state, __, __ = cpl.run_tai_maces(input_data, models, True)
+            # members that differ only in eco-geomorphology parameters 
+            # replay the hydrodynamic trajectories of the first member
+            if hydro_replay:
+                traj_prefix = namelist['DOUT_ROOT'] + '/maces_replay_' + \
+                    '{:d}'.format(site_id) + '_rank' + '{:04d}'.format(rank)
+                spinup_traj = ens.HydroTrajectory(traj_prefix + '_spinup.bin', 
+                                                  nx)
+                run_traj = ens.HydroTrajectory(traj_prefix + '_run.bin', nx)
             
-            # then do the formal run
-            input_data = {'coord': coords, 'state': tai_state, 
-                          'forcings': forcings, 'namelist': namelist}
-            __, uhydro_out, ecogeom_out = cpl.run_tai_maces(input_data, \
-                models, False)
+            spinup_signature = None
+            spinup_hydro = None
+            for member in range(nmember):
+                if ensemble:
+                    params = ens.get_member_params(base_params, ens_columns, 
+                                                   ens_samples[member])
+                    signature = ens.get_spinup_signature(ens_columns, 
+                                                         ens_samples[member])
+                else:
+                    params = base_params
+                    signature = None
+                hydro_params = params['HYDRO']
+                
+                # instantiate ecogeomorphology models
+                mac_mod = mac_class(params['MINAC'])
+                omac_mod = omac_class(params['OMAC'])
+                wavero_mod = wavero_class(params['WAVERO'])
+                lndmgr_mod = lndmgr_class(params['LNDMGR'])
+                
+                models = {'taihydro': taihydro, 'mac_mod': mac_mod, 
+                          'omac_mod': omac_mod, 'wavero_mod': wavero_mod, 
+                          'lndmgr_mod': lndmgr_mod}
+                
+                if member==0:
+                    ref_params = params
+                replay = hydro_replay and member>0 and \
+                    ens.is_same_params(hydro_params, ref_params['HYDRO']) and \
+                    (not ens.has_hydro_feedback(models, params, ref_params))
+                if hydro_replay and (member==0 or replay):
+                    spinup_args = {'hydro_traj': spinup_traj}
+                    run_args = {'hydro_traj': run_traj}
+                else:
+                    spinup_args = {}
+                    run_args = {}
+                if profiler is not None:
+                    spinup_args['profiler'] = profiler
+                    run_args['profiler'] = profiler
+                
+                # members share the spin-up if the parameters of models 
+                # active in the spin-up are the same
+                if replay:
+                    if signature!=spinup_signature:
+                        # replay the spin-up hydrodynamics of the first member
+                        spinup_traj.rewind()
+                        site_Bag = np.zeros(nx, dtype=np.float64, order='F')
+                        site_Bbg = np.zeros(nx, dtype=np.float64, order='F')
+                        site_OM = np.zeros((nx,npool), dtype=np.float64, 
+                                           order='F')
+                        tai_state = {'pft': np.array(site_pft, order='F'), 
+                                     'zh': np.array(site_zh, order='F'), 
+                                     'Bag': site_Bag, 'Bbg': site_Bbg, 
+                                     'OM': site_OM}
+                        input_data = {'coord': coords, 'state': tai_state, 
+                                      'forcings': forcings, 
+                                      'namelist': namelist}
+                        spinup_state, __, __, __ = cpl.run_tai_maces( \
+                            input_data, models, True, **spinup_args)
+                        spinup_signature = signature
+                        spinup_hydro = None
+                elif member==0 or signature!=spinup_signature or \
+                        spinup_hydro is None:
+                    # instantiate hydrodynamics model
+                    if member>0:
+                        taihydro.finalizehydromod()
+                    taihydro.inithydromod(site_x, site_zh, site_fetch, 
+                                          site_TSM[iid], nvar, npft)
+                    taihydro.setmodelparams(hydro_params['d50'], 
+                        hydro_params['Cz0'], hydro_params['Kdf'], 
+                        hydro_params['cbc'], hydro_params['cwc'], 
+                        hydro_params['fr'], hydro_params['alphaA'], 
+                        hydro_params['betaA'], hydro_params['alphaD'], 
+                        hydro_params['betaD'], hydro_params['cD0'], 
+                        hydro_params['ScD'])
+                    
+                    # first run the spin-up
+                    site_Bag = np.zeros(nx, dtype=np.float64, order='F')
+                    site_Bbg = np.zeros(nx, dtype=np.float64, order='F')
+                    site_OM = np.zeros((nx,npool), dtype=np.float64, order='F')
+                    tai_state = {'pft': np.array(site_pft, order='F'), 
+                                 'zh': np.array(site_zh, order='F'), 
+                                 'Bag': site_Bag, 'Bbg': site_Bbg, 
+                                 'OM': site_OM}
+                    input_data = {'coord': coords, 'state': tai_state, 
+                                  'forcings': forcings, 'namelist': namelist}
+                    spinup_state, __, __, __ = cpl.run_tai_maces(input_data, 
+                        models, True, **spinup_args)
+                    spinup_signature = signature
+                    if ensemble:
+                        spinup_hydro = cpl.get_hydro_state(taihydro, nx, nvar)
+                else:
+                    # restart from the shared spin-up state
+                    taihydro.setmodelparams(hydro_params['d50'], 
+                        hydro_params['Cz0'], hydro_params['Kdf'], 
+                        hydro_params['cbc'], hydro_params['cwc'], 
+                        hydro_params['fr'], hydro_params['alphaA'], 
+                        hydro_params['betaA'], hydro_params['alphaD'], 
+                        hydro_params['betaD'], hydro_params['cD0'], 
+                        hydro_params['ScD'])
+                    if len(taihydro.sim_h)!=nx:
+                        # the previous member ran on a regridded platform
+                        taihydro.regridhydromod(site_x, site_zh, site_fetch, 
+                            spinup_hydro['uhydro'], spinup_hydro['states'])
+                    else:
+                        cpl.set_hydro_state(taihydro, spinup_hydro)
+                
+                # then do the formal run
+                if ensemble:
+                    tai_state = copy.deepcopy(spinup_state)
+                else:
+                    tai_state = spinup_state
+                input_data = {'coord': coords, 'state': tai_state, 
+                              'forcings': forcings, 'namelist': namelist}
+                if replay:
+                    run_traj.rewind()
+                __, uhydro_out, ecogeom_out, stats_out = \
+                    cpl.run_tai_maces(input_data, models, False, **run_args)
+                
+                # archive ensemble member outputs
+                if ensemble:
+                    if namelist['OUTPUT_HYDRO']:
+                        utils.append_site_outputs(ens_files['hydro'][0], 
+                            namelist['HYDRO_TSTEP'], 'hydro', member, 
+                            uhydro_out, record='member')
+                    utils.append_site_outputs(ens_files['ecogeom'][0], 
+                        namelist['ECOGEOM_TSTEP'], 'ecogeom', member, 
+                        ecogeom_out, record='member')
+                    if namelist['OUTPUT_STATS']:
+                        utils.append_site_outputs(ens_files['stats'][0], 
+                            namelist['ECOGEOM_TSTEP'], 'stats', member, 
+                            stats_out, stats_vars, record='member')
             
         except AssertionError as errstr:
-            # print error message and exit the program
+            # print error message and stop the process
             print("Model stops due to that", errstr)
+            sys.stdout.flush()
             taihydro.finalizehydromod()
-            sys.exit()
+            result['error'] = str(errstr)
+            break
             
         # deallocate
         taihydro.finalizehydromod()
+        if hydro_replay:
+            spinup_traj.close()
+            run_traj.close()
             
         # archive outputs
-        if namelist['OUTPUT_HYDRO']:
-            filename_hydro = namelist['DOUT_ROOT'] + '/maces_hydro_' + \
-                namelist['RUN_STARTDATE'] + '_' + namelist['RUN_STOPDATE'] + \
-                '_' + '{:d}'.format(site_id) + '.nc'
-            utils.write_hydro_outputs(filename_hydro, namelist['HYDRO_TSTEP'], 
-                                      uhydro_out)
-        filename_ecogeom = namelist['DOUT_ROOT'] + '/maces_ecogeom_' + \
-            namelist['RUN_STARTDATE'] + '_' + namelist['RUN_STOPDATE'] + \
-            '_' + '{:d}'.format(site_id) + '.nc'
-        utils.write_ecogeom_outputs(filename_ecogeom, namelist['ECOGEOM_TSTEP'], 
-                                    ecogeom_out)
+        timer.start('write outputs')
+        if profiler is not None:
+            profiler.set_stage('site')
+        if ensemble:
+            for tmpfile, filename in ens_files.values():
+                if os.path.exists(tmpfile):
+                    utils.write_ensemble_params(tmpfile, ens_columns, 
+                                                ens_samples)
+                    os.replace(tmpfile, filename)
+        elif aggregate:
+            if namelist['OUTPUT_HYDRO']:
+                utils.append_site_outputs(shard_hydro, namelist['HYDRO_TSTEP'], 
+                                          'hydro', site_id, uhydro_out)
+            utils.append_site_outputs(shard_ecogeom, namelist['ECOGEOM_TSTEP'], 
+                                      'ecogeom', site_id, ecogeom_out)
+            if namelist['OUTPUT_STATS']:
+                utils.append_site_outputs(shard_stats, 
+                    namelist['ECOGEOM_TSTEP'], 'stats', site_id, stats_out, 
+                    stats_vars)
+        else:
+            if namelist['OUTPUT_HYDRO']:
+                filename_hydro = namelist['DOUT_ROOT'] + '/maces_hydro_' + \
+                    file_prefix + '_' + '{:d}'.format(site_id) + '.nc'
+                utils.write_hydro_outputs(filename_hydro, 
+                                          namelist['HYDRO_TSTEP'], uhydro_out)
+            filename_ecogeom = namelist['DOUT_ROOT'] + '/maces_ecogeom_' + \
+                file_prefix + '_' + '{:d}'.format(site_id) + '.nc'
+            utils.write_ecogeom_outputs(filename_ecogeom, 
+                                        namelist['ECOGEOM_TSTEP'], ecogeom_out)
+            if namelist['OUTPUT_STATS']:
+                filename_stats = namelist['DOUT_ROOT'] + '/maces_stats_' + \
+                    file_prefix + '_' + '{:d}'.format(site_id) + '.nc'
+                utils.write_stats_outputs(filename_stats, 
+                    namelist['ECOGEOM_TSTEP'], stats_out, stats_vars)
+
+        # write the site profile
+        if profiler is not None:
+            profiler.lap('write_outputs')
+            site_profile = profiler.get_summary()
+            mprof.write_profile(namelist['DOUT_ROOT'] + '/maces_profile_' + \
+                file_prefix + '_' + '{:d}'.format(site_id) + '.json', 
+                site_profile)
+            result['profiles'].append(site_profile)
+    
+    timer.stop()
+    return result
+        
+if __name__=='__main__':
+    
+    # use the OptionParser to parse the command line options
+    parser = OptionParser()
+    parser.add_option("-f", "--file", type="string", dest="filename", 
+                      default='namelist.maces.xml')
+    parser.add_option("-e", "--executor", type="string", dest="executor", 
+                      default='auto')
+    parser.add_option("-n", "--nworker", type="int", dest="nworker", 
+                      default=0)
+    (options, args) = parser.parse_args()
+    
+    # executor of the site loop (MPI, process pool or serial)
+    executor = mexe.get_executor(options.executor, options.nworker)
+    master_process = executor.is_master()
+        
+    # set how the run status is shown
+    #np.set_printoptions(precision=3, suppress=True)
+    np.set_printoptions(precision=3, suppress=False)
+        
+    # the master process reads the configuration, site database and 
+    # driving data, and then broadcasts the small objects in one collective
+    # and the forcing arrays with buffer-based collectives
+    timer = utils.PhaseTimer()
+    if master_process:
+        # MACES namelist xml file and parameter xml files
+        timer.start('read configuration')
+        config = mcfg.load_config(options.filename)
+        namelist = config.get_namelist()
+        # parameter sample table of ensemble runs
+        if len(namelist['ENSEMBLE_FILE'])>0:
+            ens_columns, ens_samples = \
+                ens.read_ensemble_samples(namelist['ENSEMBLE_FILE'])
+        else:
+            ens_columns = None
+            ens_samples = None
+        # site database
+        timer.start('read site database')
+        site_db = utils.read_site_database(namelist['SITE_FILE'], 
+            namelist['FIRST_ID'], namelist['LAST_ID'], 
+            namelist['SITE_CACHE_DIR'])
+        # driving data
+        # units: SLR (mm/yr), Tair (K), U10 (m/s), h0 (m), U0 (m/s), 
+        #        Hwav0 (m), Twav (s)
+        timer.start('read forcings')
+        forcing_data = read_forcings(namelist, site_db)
+        forcing_meta = utils.get_array_meta(forcing_data)
+        startup = {'config': config, 'ens_columns': ens_columns, 
+                   'ens_samples': ens_samples, 'site_db': site_db, 
+                   'forcing_meta': forcing_meta}
+    else:
+        startup = None
+        forcing_data = None
+    timer.start('broadcast inputs')
+    startup = executor.bcast(startup)
+    # processes on the same node can share one copy of the forcings
+    forcing_data, forcing_windows = executor.bcast_arrays(forcing_data, 
+        startup['forcing_meta'], 
+        startup['config'].get_namelist()['FORCING_SHMEM'])
+    try:
+        timer.start('setup sites')
+        config = startup['config']
+        namelist = config.get_namelist()
+        # make parameters of different components consistent
+        base_params = config.get_params()
+        ens.link_model_params(base_params)
+    
+        ensemble = len(namelist['ENSEMBLE_FILE'])>0
+        ens_columns = startup['ens_columns']
+        ens_samples = startup['ens_samples']
+        if ensemble:
+            assert namelist['OUTPUT_MODE']=='site', \
+                "ensemble runs only support the site output mode"
+        hydro_replay = ensemble and namelist['HYDRO_REPLAY']
+        if hydro_replay:
+            assert namelist['GRID_TYPE']=='uniform', \
+                "hydrodynamic replay only supports the uniform grid"
+    
+        site_db = startup['site_db']
+        site_ids = np.array(site_db['DIVA_ID'], dtype=np.int32)
+        site_coastline = np.array(site_db['coastline'], dtype=np.float64)   # km
+        site_fetchagl = np.array(site_db['fetchagl'], dtype=np.float64)     # degree
+        site_trng = np.array(site_db['mtidalrng'], dtype=np.float64)        # m
+        site_mhws = np.array(site_db['mhws'], dtype=np.float64)             # m
+        site_mhwn = np.array(site_db['mhwn'], dtype=np.float64)             # m
+        site_uplift = np.array(site_db['uplift'], dtype=np.float64)         # mm/yr
+        site_TSM = 1e-3 * np.array(site_db['TSM'], dtype=np.float64)        # kg/m3
+        site_sal = np.array(site_db['salinity'], dtype=np.float64)          # PSU
+        npft = TAIMODSuper.npft
+    
+        diva_segments, pft_segments, pft_codes, site_masks = \
+            utils.build_platform_segments(site_db, npft)
+        for key, mask in site_masks.items():
+            assert np.all(mask), "invalid " + key + " data found at sites " + \
+                ', '.join(str(site_id) for site_id in site_ids[~mask])
+    
+        # load ecogeomorphology modules
+        mac_module = importlib.import_module('minac_mod')
+        mac_class = getattr(mac_module, namelist['MINAC_TYPE'])
+    
+        omac_module = importlib.import_module('omac_mod')
+        omac_class = getattr(omac_module, namelist['OMAC_TYPE'])
+    
+        wavero_module = importlib.import_module('wavero_mod')
+        wavero_class = getattr(wavero_module, namelist['WAVERO_TYPE'])
+    
+        lndmgr_module = importlib.import_module('lndmgr_mod')
+        lndmgr_class = getattr(lndmgr_module, namelist['LNDMGR_TYPE'])
+        stats_vars = archive.get_stats_output_vars(namelist['STATS_QUANTILE'])
+    
+        # run simulations (in each iteration, a processor tests the sensitivity of 
+        # one site for all parameters)
+        file_prefix = namelist['RUN_STARTDATE'] + '_' + namelist['RUN_STOPDATE']
+        aggregate = namelist['OUTPUT_MODE']=='aggregate'
+        context = {'namelist': namelist, 'base_params': base_params, 
+                   'ensemble': ensemble, 'ens_columns': ens_columns, 
+                   'ens_samples': ens_samples, 'hydro_replay': hydro_replay, 
+                   'site_ids': site_ids, 'site_coastline': site_coastline, 
+                   'site_fetchagl': site_fetchagl, 'site_trng': site_trng, 
+                   'site_mhws': site_mhws, 'site_mhwn': site_mhwn, 
+                   'site_uplift': site_uplift, 'site_TSM': site_TSM, 
+                   'site_sal': site_sal, 'diva_segments': diva_segments, 
+                   'pft_segments': pft_segments, 'pft_codes': pft_codes, 
+                   'forcings': forcing_data, 'mac_class': mac_class, 
+                   'omac_class': omac_class, 'wavero_class': wavero_class, 
+                   'lndmgr_class': lndmgr_class, 'stats_vars': stats_vars, 
+                   'file_prefix': file_prefix, 'aggregate': aggregate}
+        timer.stop()
+        results = executor.run_workers(run_sites, context, ntask=len(site_ids))
+        if master_process:
+            errors = [result['error'] for result in results 
+                      if result['error'] is not None]
+        else:
+            errors = None
+        errors = executor.bcast(errors)
+        if len(errors)>0:
+            # exit the program if any process stops
+            sys.exit(1)
+    
+        # merge the aggregated output shards of all processes
+        if aggregate:
+            timer.start('merge outputs')
+            executor.barrier()
+            if master_process:
+                for category in ['hydro', 'ecogeom', 'stats']:
+                    shards = [namelist['DOUT_ROOT'] + '/maces_' + category + '_' + \
+                              file_prefix + '_rank' + '{:04d}'.format(rr) + '.nc' \
+                              for rr in range(len(results))]
+                    filename = namelist['DOUT_ROOT'] + '/maces_' + category + \
+                        '_' + file_prefix + '.nc'
+                    utils.merge_output_shards(shards, filename)
+    
+        # aggregate the site profiles of all processes
+        if namelist['PROFILE'] and master_process:
+            profiles = []
+            for result in results:
+                profiles += result['profiles']
+            mprof.write_profile(namelist['DOUT_ROOT'] + '/maces_profile_' + \
+                file_prefix + '.json', mprof.merge_profiles(profiles))
+    finally:
+        # release the shared memory forcings
+        executor.free_arrays(forcing_windows)
+        
+    # print the wall-clock time of program phases
+    if namelist['TIMING']:
+        timer.stop()
+        elapsed = executor.gather(timer.m_elapsed)
+        if master_process:
+            timer.report(elapsed + [result['elapsed'] for result in results])
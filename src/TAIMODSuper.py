@@ -36,10 +36,12 @@ class MACMODSuper(object):
     Attributes:
         m_params : model calibration parameters
         m_update_Css : control whether update suspended sediment concentration
+        m_hydro_feedback : whether model outputs drive the hydrodynamics
     """
     
     m_params = {}
     m_update_Css = True
+    m_hydro_feedback = True
     
     __metaclass__ = ABCMeta
     
@@ -115,10 +117,12 @@ class OMACMODSuper(object):
 
     Attributes:
         m_params : model parameters
+        m_hydro_feedback : whether model outputs drive the hydrodynamics
 
     """
     
     m_params = {}
+    m_hydro_feedback = True
     
     __metaclass__ = ABCMeta    
     
@@ -178,10 +182,12 @@ class WAVEROMODSuper(object):
 
     Attributes:
         m_params : model parameters
+        m_hydro_feedback : whether model outputs drive the hydrodynamics
 
     """
     
     m_params = {}
+    m_hydro_feedback = True
     
     __metaclass__ = ABCMeta
 
@@ -205,10 +211,12 @@ class LNDMGMODSuper(object):
 
     Attributes:
         m_params : model parameters
+        m_hydro_feedback : whether model outputs drive the hydrodynamics
 
     """
     
     m_params = {}
+    m_hydro_feedback = True
     
     __metaclass__ = ABCMeta
     
@@ -220,8 +228,12 @@ class LNDMGMODSuper(object):
             inputs['x']      : platform coordinate (m)
             inputs['zh']     : platform elevation relative to MSL (m)
             inputs['pft']    : platform vegetation cover pft
-            inputs['h_hist'] : daily water depth (m) of the last five years
-            inputs['Cj_hist']: daily water salinity (PSU) of the last five years
+            inputs['Bag']    : aboveground biomass (kg m-2)
+            inputs['sal']    : water salinity (PSU)
+            inputs['inund_period'] : inundation accumulation period (hr)
+            inputs['inund_hours']  : flooded hours of the period (hr)
+            inputs['inund_maxdur'] : longest continuous flooding (hr)
+            inputs['inund_events'] : number of flooding events
         Returns: the new pft on the coastal platform
         """
         pass
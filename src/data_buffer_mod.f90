@@ -42,6 +42,12 @@ module data_buffer_mod
    real(kind=8), allocatable, dimension(:)   :: m_Sbrk
    ! sediment and constituents
    real(kind=8), allocatable, dimension(:)   :: m_Cs
+   ! active cell window: the hydrodynamic equations are evaluated on the 
+   ! leading m_nact cells, landward cells beyond are dry and at rest
+   integer :: m_nact
+   ! bottom friction and sediment sinks are integrated implicitly (IMEX) 
+   ! after the explicit step of the other terms
+   logical :: m_imex = .False.
    ! temporary variables
    real(kind=8), allocatable, dimension(:,:) :: tmp_uhydro
    real(kind=8), allocatable, dimension(:,:) :: tmp_uhydroL
@@ -21,6 +21,11 @@ module hydro_utilities_mod
    real(kind=8), parameter :: TOL_REL = 1.d-6
    real(kind=8), parameter :: INFTSML = 1.d-30
    real(kind=8), parameter :: INFNT = 1.d+30
+   ! number of trial steps of the last Runge-Kutta-Fehlberg call
+   integer :: rk4_ntrial = 0
+   ! halo of the active cell window, i.e. the stencil radius of the KT 
+   ! scheme (2 cells) times the number of Runge-Kutta-Fehlberg stages (6)
+   integer, parameter :: NACT_HALO = 12
    ! physical constants 
    real(kind=8), parameter :: PI = 3.14159265d+0
    real(kind=8), parameter :: e = 2.71828183d+0
@@ -245,16 +250,17 @@ contains
    !          Tadmor (KT) central scheme.
    !
    !------------------------------------------------------------------------------
-   subroutine FVSKT_Superbee(uhydro, phi, n, m)
+   subroutine FVSKT_Superbee(uhydro, phi, n, m, nw)
       implicit none
       real(kind=8), intent(in) :: uhydro(n,m)
       real(kind=8), intent(out) :: phi(n,m)
       integer, intent(in) :: n, m
+      integer, intent(in) :: nw     ! number of leading cells to evaluate
       real(kind=8) :: rr(m)
       real(kind=8) :: r0, r1
       integer :: ii, jj
 
-      do ii = 1, n, 1
+      do ii = 1, nw, 1
          if (ii==1 .or. ii==n) then
             phi(ii,:) = 0.0d0
          else
@@ -279,17 +285,18 @@ contains
    ! Purpose: Calculate cell edge state variables.
    !
    !------------------------------------------------------------------------------
-   subroutine FVSKT_celledge(uhydro, phi, uhydroL, uhydroR, n, m)
+   subroutine FVSKT_celledge(uhydro, phi, uhydroL, uhydroR, n, m, nw)
       implicit none
       real(kind=8), intent(in) :: uhydro(n,m)
       real(kind=8), intent(in) :: phi(n,m)
       real(kind=8), intent(out) :: uhydroL(n,m)
       real(kind=8), intent(out) :: uhydroR(n,m)
       integer, intent(in) :: n, m
+      integer, intent(in) :: nw     ! number of leading cells to evaluate
       real(kind=8) :: duhydro(m)
       integer :: ii
 
-      do ii = 1, n, 1
+      do ii = 1, nw, 1
          if (ii==1 .or. ii==n) then
             uhydroL(ii,:) = uhydro(ii,:)
             uhydroR(ii,:) = uhydro(ii,:)
@@ -900,6 +907,7 @@ contains
       do while (isLargeErr .or. isConstrainBroken)
          if (iter>MAXITER) then
             outerr = 1
+            rk4_ntrial = MAXITER
             return
          end if
          curstep = step
@@ -918,6 +926,7 @@ contains
          if (mode==fixed_mode) then
             nextstep = step
             outvars = rk4_nxt4th
+            rk4_ntrial = iter
             return
          end if
          rk4_interim = invars + step*(-0.29630*rk4_K1+2.0*rk4_K2- &
@@ -960,6 +969,7 @@ contains
       end do
       nextstep = step
       outvars = rk4_nxt4th
+      rk4_ntrial = iter - 1
    end subroutine
 
 end module hydro_utilities_mod
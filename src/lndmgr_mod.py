@@ -57,6 +57,7 @@ class R20MOD(LNDMGMODSuper):
     # constructor
     def __init__(self, params):
         self.m_params = params
+        self.m_hydro_feedback = False
     
     def landward_migration(self, inputs):
         """"Calculate coastal wetland landward migration at the end of each year.
@@ -70,9 +71,11 @@ class R20MOD(LNDMGMODSuper):
 ###############################################################################
 class S18MOD(LNDMGMODSuper):
     """Realization of the Schuerch et al. (2018) landward migration model.
+    Wetlands colonize the regularly flooded accommodation space landward of
+    the wetland and drown where the continuous flooding becomes too long.
 
     Attributes:
-
+        parameters : finund_min, maxdur_max
     Constants:
         
     """ 
@@ -87,5 +90,22 @@ class S18MOD(LNDMGMODSuper):
             inputs : driving data for landward migration calculation
         Returns: the new pft on the coastal platform
         """
+        finund_min = self.m_params['finund_min']    # minimum flooded fraction
+        maxdur_max = self.m_params['maxdur_max']    # maximum flooding (hr)
         pft = inputs['pft']
-        return pft     
\ No newline at end of file
+        period = inputs['inund_period']
+        if period<=0:
+            return pft
+        finund = inputs['inund_hours'] / period
+        
+        wtlnd_indice = np.logical_and(pft>=2,pft<=5)
+        if np.size(pft[wtlnd_indice])>0:
+            iland = np.nonzero(wtlnd_indice)[0][-1]
+            ref_pft = pft[iland]
+            indice = np.logical_and(wtlnd_indice, 
+                                    inputs['inund_maxdur']>maxdur_max)
+            pft[indice] = 1
+            indice = np.zeros(np.size(pft), dtype=bool)
+            indice[iland+1:] = finund[iland+1:]>=finund_min
+            pft[indice] = ref_pft
+        return pft
\ No newline at end of file
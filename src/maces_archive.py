@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Online archive accumulators of the MACES coupler
+"""
+
+import numpy as np
+import maces_utilities as utils
+
+# hydrodynamic variables of the online statistics
+# (key, long name, units, lower bound and upper bound of histogram sketches)
+STATS_VARS = [
+    ('h', r'water depth', 'm', 1e-3, 50.0),
+    ('tau', r'bottom shear stress', 'Pa', 1e-4, 100.0),
+    ('Hwav', r'significant wave height', 'm', 1e-3, 20.0),
+    ('Css', r'suspended sediment concentration', 'kg/m3', 1e-5, 10.0),
+]
+# period-mean eco-geomorphology variables
+ECOGEOM_MEAN_VARS = ['Esed', 'Dsed', 'Lbed', 'DepOM', 'Bag', 'Bbg']
+STATS_NBIN = 256    # number of log-spaced bins of histogram sketches
+INUND_DEPTH = 1e-3  # minimum water depth (m) of an inundated cell
+# state variables of the spin-up convergence test
+CYCLE_VARS = ['h', 'U', 'Css', 'Bag']
+
+def get_stats_output_vars(quantiles):
+    """Get the archived variables of hydrodynamic statistics outputs.
+    Arguments:
+        quantiles : percentiles (0-1) of the outputs
+    Returns : variable list of (key, long name, units, nc data type, 
+              fill value, nc dimensions)
+    """
+    output_vars = []
+    for key, long_name, units, __, __ in STATS_VARS:
+        output_vars += [
+            (key+'_mean', 'mean '+long_name, units, 'f4', 1e20, ('time','x')),
+            (key+'_min', 'minimum '+long_name, units, 'f4', 1e20, 
+             ('time','x')),
+            (key+'_max', 'maximum '+long_name, units, 'f4', 1e20, 
+             ('time','x')),
+            (key+'_var', 'variance of '+long_name, '('+units+')^2', 'f4', 
+             1e20, ('time','x'))]
+        for q in quantiles:
+            output_vars.append((key+'_p'+'{:g}'.format(100*q), 
+                '{:g}'.format(100*q)+'th percentile '+long_name, units, 'f4', 
+                1e20, ('time','x')))
+    output_vars.append(('hydroperiod', r'fraction of inundated time', 'none', 
+                        'f4', 1e20, ('time','x')))
+    return output_vars
+
+###############################################################################
+class HydroStatistics(object):
+    """Online time-weighted statistics of hydrodynamic state variables over
+       each ecogeomorphology output period. Mean and variance are updated
+       with the weighted incremental algorithm of West (1979) and percentiles
+       are estimated from per-cell log-spaced histogram sketches, so memory
+       does not grow with the number of sub-steps.
+
+    Attributes:
+        m_quantiles : percentiles (0-1) of the outputs
+        m_stats_out : statistics outputs
+    """
+
+    # constructor
+    def __init__(self, x, nt, quantiles):
+        nx = len(x)
+        self.m_quantiles = np.array(quantiles, dtype=np.float64)
+        self.m_indx = -1
+        # accumulators of the current output period
+        nvar = len(STATS_VARS)
+        self.m_wsum = 0.0
+        self.m_wwet = np.zeros(nx, dtype=np.float64)
+        self.m_mean = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_M2 = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_min = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_max = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_hist = np.zeros((nvar,STATS_NBIN*nx), dtype=np.float64)
+        self.m_offset = np.arange(nx)
+        self.m_logmin = np.log([lower for __, __, __, lower, __ in STATS_VARS])
+        self.m_dlog = (np.log([upper for __, __, __, __, upper in STATS_VARS]) \
+                       - self.m_logmin) / (STATS_NBIN - 1)
+        self.reset()
+        # outputs
+        self.m_stats_out = {'x': np.float32(x)}
+        for key, __, __, __, __, __ in get_stats_output_vars(quantiles):
+            self.m_stats_out[key] = 1e20 * np.ones((nt,nx), dtype=np.float32)
+
+    def reset(self):
+        """Reset the accumulators of the current output period.
+        Arguments:
+        Returns :
+        """
+        self.m_wsum = 0.0
+        self.m_wwet[:] = 0.0
+        self.m_mean[:] = 0.0
+        self.m_M2[:] = 0.0
+        self.m_min[:] = np.inf
+        self.m_max[:] = -np.inf
+        self.m_hist[:] = 0.0
+
+    def update(self, indx, dt, uhydro):
+        """Accumulate the hydrodynamic state of a sub-step.
+        Arguments:
+            indx : output period index
+            dt : sub-step length (s)
+            uhydro : hydrodynamic state variables of the sub-step
+        Returns :
+        """
+        if indx!=self.m_indx:
+            self.flush()
+            self.m_indx = indx
+        if dt<=0:
+            return
+        values = np.array([uhydro[key] for key, __, __, __, __ in STATS_VARS])
+        wsum = self.m_wsum + dt
+        delta = values - self.m_mean
+        R = delta * (dt / wsum)
+        self.m_mean += R
+        self.m_M2 += self.m_wsum * delta * R
+        self.m_wsum = wsum
+        np.minimum(self.m_min, values, out=self.m_min)
+        np.maximum(self.m_max, values, out=self.m_max)
+        self.m_wwet[uhydro['h']>INUND_DEPTH] += dt
+        # bin 0 collects all values below the lower bound
+        with np.errstate(divide='ignore'):
+            logval = np.log(values)
+        bins = np.floor((logval - self.m_logmin[:,None]) / \
+                        self.m_dlog[:,None]) + 1
+        bins = np.clip(np.nan_to_num(bins, neginf=0.0), 0, STATS_NBIN-1)
+        nx = len(self.m_offset)
+        for ii in range(len(STATS_VARS)):
+            self.m_hist[ii, bins[ii].astype(np.int64)*nx+self.m_offset] += dt
+
+    def flush(self):
+        """Archive the statistics of the current output period.
+        Arguments:
+        Returns :
+        """
+        if self.m_indx<0 or self.m_wsum<=0:
+            return
+        indx = self.m_indx
+        nx = len(self.m_offset)
+        for ii, (key, __, __, __, __) in enumerate(STATS_VARS):
+            self.m_stats_out[key+'_mean'][indx] = self.m_mean[ii]
+            self.m_stats_out[key+'_min'][indx] = self.m_min[ii]
+            self.m_stats_out[key+'_max'][indx] = self.m_max[ii]
+            self.m_stats_out[key+'_var'][indx] = self.m_M2[ii] / self.m_wsum
+            cdf = np.cumsum(np.reshape(self.m_hist[ii], (STATS_NBIN,nx)),
+                            axis=0) / self.m_wsum
+            for q in self.m_quantiles:
+                # bin center of the first bin reaching the percentile
+                ibin = np.argmax(cdf>=q-1e-12, axis=0)
+                value = np.exp(self.m_logmin[ii] + (ibin-0.5)*self.m_dlog[ii])
+                value[ibin==0] = 0.0
+                value = np.minimum(np.maximum(value, self.m_min[ii]),
+                                   self.m_max[ii])
+                key_q = key + '_p' + '{:g}'.format(100*q)
+                self.m_stats_out[key_q][indx] = value
+        self.m_stats_out['hydroperiod'][indx] = self.m_wwet / self.m_wsum
+        self.reset()
+
+    def finalize(self):
+        """Archive the last output period and return the outputs.
+        Arguments:
+        Returns : statistics outputs
+        """
+        self.flush()
+        self.m_indx = -1
+        return self.m_stats_out
+
+###############################################################################
+class HydroArchive(object):
+    """Archive of short-term hydrodynamic outputs. The hydrodynamic state 
+       is taken as linear between the start and the end of each sub-step.
+       snapshot : the state of the first sub-step within each output interval
+       average : the time-weighted average over each output interval
+       interpolate : the state interpolated to the exact output times
+
+    Attributes:
+        m_mode : archive mode
+        m_uhydro_out : hydrodynamic outputs
+    """
+
+    # constructor
+    def __init__(self, x, nt, tstep, mode):
+        nx = len(x)
+        nvar = len(utils.HYDRO_OUTPUT_VARS)
+        assert mode in ('snapshot','average','interpolate'), \
+            "unknown hydrodynamic archive mode " + mode
+        self.m_mode = mode
+        self.m_nt = nt
+        self.m_tstep = tstep
+        self.m_dt = utils.get_shr_output_step(tstep)
+        self.m_indx = -1
+        self.m_sum = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_wsum = 0.0
+        self.m_prev = None
+        self.m_uhydro_out = {'x': np.float32(x)}
+        for key, __, __, __, __, __ in utils.HYDRO_OUTPUT_VARS:
+            self.m_uhydro_out[key] = 1e20 * np.ones((nt,nx), dtype=np.float32)
+
+    def set_initial_state(self, uhydro):
+        """Set the hydrodynamic state at the start of the first sub-step.
+        Arguments:
+            uhydro : hydrodynamic state variables
+        Returns :
+        """
+        self.m_prev = np.array([uhydro[key] for key, __, __, __, __, __ in \
+                                utils.HYDRO_OUTPUT_VARS])
+
+    def update(self, t, dt, uhydro):
+        """Archive the hydrodynamic state at the end of a sub-step.
+        Arguments:
+            t : sub-step start time (s)
+            dt : sub-step length (s)
+            uhydro : hydrodynamic state variables at the end of the sub-step
+        Returns :
+        """
+        if self.m_mode=='snapshot':
+            indx = utils.get_shr_output_index(t, self.m_tstep)
+            if indx>self.m_indx and indx<self.m_nt:
+                self.m_indx = indx
+                for key, __, __, __, __, __ in utils.HYDRO_OUTPUT_VARS:
+                    self.m_uhydro_out[key][indx] = uhydro[key]
+            return
+        values = np.array([uhydro[key] for key, __, __, __, __, __ in \
+                           utils.HYDRO_OUTPUT_VARS])
+        if self.m_prev is None:
+            self.m_prev = np.array(values)
+        prev = self.m_prev
+        if self.m_mode=='average':
+            t0 = t
+            t1 = t + dt
+            while t0<t1:
+                indx = int(t0/self.m_dt)
+                if indx>=self.m_nt:
+                    break
+                tb = min((indx+1)*self.m_dt, t1)
+                if tb<=t0:
+                    # guard against round-off at interval boundaries
+                    tb = min(t0 + self.m_dt, t1)
+                if indx!=self.m_indx:
+                    self.flush()
+                    self.m_indx = indx
+                # average of the linear state over [t0, tb]
+                rt = (0.5*(t0+tb) - t) / dt if dt>0 else 1.0
+                self.m_sum += (tb-t0) * (prev + rt*(values-prev))
+                self.m_wsum += tb - t0
+                t0 = tb
+        else:
+            # output times within [t, t+dt]
+            indx0 = int(np.ceil(t/self.m_dt))
+            indx1 = min(int((t+dt)/self.m_dt), self.m_nt-1)
+            for indx in range(indx0, indx1+1):
+                rt = (indx*self.m_dt - t) / dt if dt>0 else 1.0
+                state = prev + rt*(values-prev)
+                for ii, (key, __, __, __, __, __) in \
+                        enumerate(utils.HYDRO_OUTPUT_VARS):
+                    self.m_uhydro_out[key][indx] = state[ii]
+        self.m_prev[:] = values
+
+    def flush(self):
+        """Archive the average of the current output interval.
+        Arguments:
+        Returns :
+        """
+        if self.m_indx<0 or self.m_wsum<=0:
+            return
+        values = self.m_sum / self.m_wsum
+        for ii, (key, __, __, __, __, __) in enumerate(utils.HYDRO_OUTPUT_VARS):
+            self.m_uhydro_out[key][self.m_indx] = values[ii]
+        self.m_sum[:] = 0.0
+        self.m_wsum = 0.0
+
+    def finalize(self):
+        """Archive the last output interval and return the outputs.
+        Arguments:
+        Returns : hydrodynamic outputs
+        """
+        if self.m_mode=='average':
+            self.flush()
+        return self.m_uhydro_out
+
+###############################################################################
+class EcogeomArchive(object):
+    """Archive of long-term eco-geomorphology outputs. Period-mean rates 
+       and biomass are accumulated in a stacked float64 buffer and platform
+       elevation, soil OM and pft are taken at the first sub-step of each 
+       output period.
+
+    Attributes:
+        m_ecogeom_out : eco-geomorphology outputs
+    """
+
+    # constructor
+    def __init__(self, x, nt, npool):
+        nx = len(x)
+        nvar = len(ECOGEOM_MEAN_VARS)
+        self.m_indx = -1
+        self.m_rates = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_sum = np.zeros((nvar,nx), dtype=np.float64)
+        self.m_wsum = 0.0
+        self.m_mean_out = 1e20 * np.ones((nvar,nt,nx), dtype=np.float32)
+        self.m_ecogeom_out = {'x': np.float32(x)}
+        self.m_ecogeom_out['pft'] = -1 * np.ones((nt,nx), dtype=np.int8)
+        self.m_ecogeom_out['zh'] = 1e20 * np.ones((nt,nx), dtype=np.float32)
+        for ii, key in enumerate(ECOGEOM_MEAN_VARS):
+            self.m_ecogeom_out[key] = self.m_mean_out[ii]
+        self.m_ecogeom_out['OM'] = 1e20 * np.ones((nt,nx,npool), 
+                                                  dtype=np.float32)
+
+    def update(self, indx, dt, ecogeom):
+        """Accumulate the eco-geomorphology state of a sub-step.
+        Arguments:
+            indx : output period index
+            dt : sub-step length (s)
+            ecogeom : eco-geomorphology state variables of the sub-step
+        Returns :
+        """
+        if indx!=self.m_indx:
+            self.flush()
+            self.m_indx = indx
+            self.m_ecogeom_out['zh'][indx] = ecogeom['zh']
+            self.m_ecogeom_out['OM'][indx] = ecogeom['OM']
+            self.m_ecogeom_out['pft'][indx] = ecogeom['pft']
+        self.m_rates[:] = [ecogeom[key] for key in ECOGEOM_MEAN_VARS]
+        self.m_rates *= dt
+        self.m_sum += self.m_rates
+        self.m_wsum += dt
+
+    def flush(self):
+        """Archive the means of the current output period.
+        Arguments:
+        Returns :
+        """
+        if self.m_indx<0 or self.m_wsum<=0:
+            return
+        self.m_mean_out[:,self.m_indx] = self.m_sum / self.m_wsum
+        self.m_sum[:] = 0.0
+        self.m_wsum = 0.0
+
+    def finalize(self):
+        """Archive the last output period and return the outputs.
+        Arguments:
+        Returns : eco-geomorphology outputs
+        """
+        self.flush()
+        self.m_indx = -1
+        return self.m_ecogeom_out
+
+###############################################################################
+class InundationAccumulator(object):
+    """Streaming inundation regime of platform cells between two landward 
+       migration events. Flooded hours, the longest continuous flooding 
+       and the number of flooding events are updated every sub-step so 
+       memory is O(nx) regardless of the accumulation period.
+
+    Attributes:
+        m_wet : inundation flag of the last sub-step
+        m_period : accumulation period (hr)
+        m_hours : flooded hours (hr)
+        m_curdur : duration of the ongoing flooding (hr)
+        m_maxdur : longest continuous flooding (hr)
+        m_events : number of flooding events
+    """
+
+    # constructor
+    def __init__(self, nx):
+        self.m_wet = np.zeros(nx, dtype=bool)
+        self.m_period = 0.0
+        self.m_hours = np.zeros(nx, dtype=np.float64)
+        self.m_curdur = np.zeros(nx, dtype=np.float64)
+        self.m_maxdur = np.zeros(nx, dtype=np.float64)
+        self.m_events = np.zeros(nx, dtype=np.int32)
+
+    def reset(self):
+        """Start a new accumulation period. A flooding event ongoing at the 
+           reset keeps its duration and is counted as an event of the new 
+           period, so events crossing the reset are not split.
+        Arguments:
+        Returns :
+        """
+        self.m_period = 0.0
+        self.m_hours[:] = 0.0
+        self.m_maxdur[:] = self.m_curdur
+        self.m_events[:] = self.m_wet
+
+    def set_wet(self, h):
+        """Set the inundation flag of the last sub-step, e.g. after the 
+           platform is regridded.
+        Arguments:
+            h : water depth (m)
+        Returns :
+        """
+        self.m_wet[:] = h > INUND_DEPTH
+
+    def remap(self, x, x_new, h, operator=None):
+        """Move the accumulated inundation regime onto a new platform grid. 
+           Each new cell takes the regime of the old cell containing it and 
+           ongoing flooding events end in new cells that are dry.
+        Arguments:
+            x : platform grid coordinate (m)
+            x_new : new platform grid coordinate (m)
+            h : water depth (m) on the new grid
+            operator : remapping operator of get_remap_operator (optional)
+        Returns :
+        """
+        self.m_hours = utils.remap_categorical(x, self.m_hours, x_new, 
+                                               operator)
+        self.m_curdur = utils.remap_categorical(x, self.m_curdur, x_new, 
+                                                operator)
+        self.m_maxdur = utils.remap_categorical(x, self.m_maxdur, x_new, 
+                                                operator)
+        self.m_events = utils.remap_categorical(x, self.m_events, x_new, 
+                                                operator)
+        self.m_wet = np.zeros(len(x_new), dtype=bool)
+        self.set_wet(h)
+        self.m_curdur[~self.m_wet] = 0.0
+
+    def update(self, dt, h):
+        """Accumulate the inundation of a sub-step.
+        Arguments:
+            dt : sub-step length (s)
+            h : water depth (m)
+        Returns :
+        """
+        dthr = dt / 3.6e3
+        wet = h > INUND_DEPTH
+        self.m_events += np.logical_and(wet, ~self.m_wet)
+        self.m_curdur[~wet] = 0.0
+        self.m_curdur[wet] += dthr
+        self.m_hours[wet] += dthr
+        np.maximum(self.m_maxdur, self.m_curdur, out=self.m_maxdur)
+        self.m_period += dthr
+        self.m_wet[:] = wet
+
+    def get_inundation(self):
+        """Get the inundation regime of the current accumulation period.
+        Arguments:
+        Returns : dictionary of the accumulated inundation regime
+            'inund_period' : accumulation period (hr)
+            'inund_hours'  : flooded hours (hr)
+            'inund_maxdur' : longest continuous flooding (hr)
+            'inund_events' : number of flooding events
+        """
+        return {'inund_period': self.m_period, 'inund_hours': self.m_hours, 
+                'inund_maxdur': self.m_maxdur, 'inund_events': self.m_events}
+
+###############################################################################
+class CycleConvergence(object):
+    """Convergence of the tidal-cycle mean states during the spin-up. The 
+       states are averaged over each tidal cycle and the metric of a cycle
+       is the largest change of the cycle means relative to the previous
+       cycle, i.e. max|mean_k - mean_k-1| / max|mean_k| of all variables.
+       Current velocity is averaged as speed because the cycle mean flow
+       is close to zero.
+
+    Attributes:
+        m_period : tidal cycle length (s)
+        m_time : accumulated time (s) of the ongoing cycle
+        m_sums : time integrals of the ongoing cycle
+        m_means : means of the last completed cycle
+        m_ncycle : number of completed cycles
+        m_metric : convergence metric of the last completed cycle
+    """
+
+    # constructor
+    def __init__(self, nx, period):
+        self.m_period = period
+        self.m_time = 0.0
+        self.m_sums = {}
+        for key in CYCLE_VARS:
+            self.m_sums[key] = np.zeros(nx, dtype=np.float64)
+        self.m_means = None
+        self.m_ncycle = 0
+        self.m_metric = np.inf
+
+    def update(self, t, dt, states):
+        """Accumulate the states of a sub-step and close the tidal cycle 
+           if the sub-step ends it.
+        Arguments:
+            t : time (s) at the end of the sub-step
+            dt : sub-step length (s)
+            states : dictionary of h (m), U (m/s), Css (kg/m3) and 
+                     Bag (kg/m2)
+        Returns : True if a tidal cycle is completed
+        """
+        for key in CYCLE_VARS:
+            if key=='U':
+                self.m_sums[key] += dt * np.abs(states[key])
+            else:
+                self.m_sums[key] += dt * states[key]
+        self.m_time += dt
+        if t < self.m_period*(self.m_ncycle+1):
+            return False
+        means = {}
+        for key in CYCLE_VARS:
+            means[key] = self.m_sums[key] / self.m_time
+            self.m_sums[key][:] = 0.0
+        if self.m_means is not None:
+            self.m_metric = 0.0
+            for key in CYCLE_VARS:
+                scale = np.max(np.abs(means[key]))
+                if scale>0:
+                    change = np.max(np.abs(means[key] - self.m_means[key]))
+                    self.m_metric = max(self.m_metric, change/scale)
+        self.m_means = means
+        self.m_time = 0.0
+        self.m_ncycle = self.m_ncycle + 1
+        return True
+
+###############################################################################
+class HydroEmulator(object):
+    """Emulator of the hydrodynamics by a representative tidal cycle. The 
+       sub-step states of a fully simulated tidal cycle are averaged into 
+       phase bins, which stand for the hydrodynamics at the same phase of 
+       the following cycles. A new representative cycle is simulated from 
+       the first cycle end at which the platform elevation departs from 
+       that of the recorded cycle by more than a threshold, or from the 
+       first sub-step at which a forcing departs from its bin mean of the 
+       recorded cycle by more than a fraction of its recorded magnitude, 
+       e.g. over the spring-neap cycle or a change of wind.
+
+    Attributes:
+        m_period : tidal cycle length (s)
+        m_nbin : number of phase bins
+        m_dbin : phase bin length (s)
+        m_dz : platform elevation change (m) of a new representative cycle
+        m_ftol : relative forcing departure of a new representative cycle
+        m_t0 : start time (s) of the representative cycle
+        m_zh : platform elevation (msl) at the start of the cycle
+        m_sum : time integrals (means after recording) of the phase bins
+        m_wsum : accumulated time (s) of the phase bins
+        m_fsum : forcing time integrals (means after recording) of the 
+                 phase bins
+        m_fscale : maximum magnitude of the recorded forcing bin means
+        m_recording : True while the representative cycle is simulated
+        m_ncycle : number of cycles since m_t0 checked for elevation change
+    """
+
+    # constructor
+    def __init__(self, nx, period, step, dz, ftol):
+        nvar = len(utils.HYDRO_OUTPUT_VARS)
+        self.m_period = period
+        self.m_nbin = max(int(round(period/step)), 1)
+        self.m_dbin = period / self.m_nbin
+        self.m_dz = dz
+        self.m_ftol = ftol
+        self.m_t0 = 0.0
+        self.m_zh = None
+        self.m_sum = np.zeros((self.m_nbin,nvar,nx), dtype=np.float64)
+        self.m_wsum = np.zeros(self.m_nbin, dtype=np.float64)
+        self.m_fsum = None
+        self.m_fscale = None
+        self.m_recording = False
+        self.m_ncycle = 0
+
+    def start(self, t, zh):
+        """Start simulating a representative tidal cycle.
+        Arguments:
+            t : start time (s)
+            zh : platform surface elevation (msl)
+        Returns :
+        """
+        self.m_t0 = t
+        self.m_zh = np.array(zh)
+        self.m_sum[:] = 0.0
+        self.m_wsum[:] = 0.0
+        self.m_fsum = None
+        self.m_recording = True
+        self.m_ncycle = 0
+
+    def record(self, t, dt, uhydro, forcings):
+        """Accumulate a simulated sub-step of the representative cycle.
+        Arguments:
+            t : sub-step start time (s)
+            dt : sub-step length (s)
+            uhydro : hydrodynamic state variables at the end of the sub-step
+            forcings : boundary forcings of the sub-step
+        Returns : True if the representative cycle is completed
+        """
+        values = np.array([uhydro[key] for key, __, __, __, __, __ in \
+                           utils.HYDRO_OUTPUT_VARS])
+        forcings = np.asarray(forcings, dtype=np.float64)
+        if self.m_fsum is None:
+            self.m_fsum = np.zeros((self.m_nbin,len(forcings)), 
+                                   dtype=np.float64)
+        t0 = t - self.m_t0
+        t1 = min(t0 + dt, self.m_period)
+        while t0<t1:
+            indx = min(int(t0/self.m_dbin), self.m_nbin-1)
+            tb = min((indx+1)*self.m_dbin, t1)
+            if tb<=t0:
+                # guard against round-off at bin boundaries
+                tb = min(t0 + self.m_dbin, t1)
+            self.m_sum[indx] += (tb-t0) * values
+            self.m_fsum[indx] += (tb-t0) * forcings
+            self.m_wsum[indx] += tb - t0
+            t0 = tb
+        if t + dt - self.m_t0 < self.m_period:
+            return False
+        self.m_sum /= self.m_wsum[:,None,None]
+        self.m_fsum /= self.m_wsum[:,None]
+        self.m_fscale = np.max(np.abs(self.m_fsum), axis=0)
+        self.m_recording = False
+        self.m_ncycle = 1
+        return True
+
+    def get_bin(self, t):
+        """Get the phase bin of a time.
+        Arguments:
+            t : time (s)
+        Returns : number of phase bins since the start of the cycle
+        """
+        # times at bin boundaries belong to the following bin
+        return int(np.floor((t - self.m_t0)/self.m_dbin + 1e-6))
+
+    def is_emulating(self, t, zh, forcings):
+        """Check whether the sub-step from a time is emulated.
+        Arguments:
+            t : sub-step start time (s)
+            zh : platform surface elevation (msl)
+            forcings : boundary forcings of the sub-step
+        Returns : True if the sub-step is emulated
+        """
+        if self.m_recording:
+            return False
+        ncycle = self.get_bin(t) // self.m_nbin
+        if ncycle>self.m_ncycle:
+            self.m_ncycle = ncycle
+            if np.max(np.abs(zh - self.m_zh))>self.m_dz:
+                self.start(t, zh)
+                return False
+        indx = np.mod(self.get_bin(t), self.m_nbin)
+        departure = np.abs(np.asarray(forcings) - self.m_fsum[indx])
+        if np.any(departure>self.m_ftol*self.m_fscale):
+            self.start(t, zh)
+            return False
+        return True
+
+    def get_step(self, t):
+        """Get the emulated sub-step length from a time to the end of its 
+           phase bin.
+        Arguments:
+            t : sub-step start time (s)
+        Returns : sub-step length (s)
+        """
+        step = self.m_t0 + (self.get_bin(t)+1)*self.m_dbin - t
+        if step<1.0:
+            step = step + self.m_dbin
+        return step
+
+    def get_state(self, t):
+        """Get the emulated hydrodynamic state of a sub-step.
+        Arguments:
+            t : sub-step start time (s)
+        Returns : hydrodynamic state variables
+        """
+        indx = np.mod(self.get_bin(t), self.m_nbin)
+        uhydro = {}
+        for ii, (key, __, __, __, __, __) in \
+                enumerate(utils.HYDRO_OUTPUT_VARS):
+            uhydro[key] = self.m_sum[indx,ii]
+        return uhydro
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loading and batch editing of the MACES namelist and model parameter files
+of a case
+
+Edits are keyed as COMPONENT[:GROUP]:parameter[index], where COMPONENT is
+NAMELIST or one of HYDRO, MINAC, OMAC, WAVERO and LNDMGR (optpar_*.xml).
+The GROUP of model parameters defaults to the model selected in the
+namelist and the index selects one value of a list entry by its pft,
+variable or position. For example,
+
+    NAMELIST:RUN_STOPDATE   : 2010-01-01
+    MINAC:E0                : 6.12e-6
+    OMAC:DA07MOD:Bmax[2]    : 1.2
+    NAMELIST:HYDRO_TOL[h]   : 1e-4
+
+A case is loaded once into a typed and read-only MacesConfig object. Scalar
+and list values keep their xml types (logical values are bool, integer
+lists are int32 arrays and real lists are float64 arrays) and $VAR
+references of char values are resolved in one topological pass.
+
+Usage:
+    python maces_config.py -c case_dir -e edits.yaml
+    python maces_config.py -c template_dir -e sweep.csv -o sweep_root
+"""
+
+import os
+import re
+import sys
+import csv
+import copy
+import shutil
+import pickle
+import numpy as np
+import xml.etree.ElementTree as ET
+from optparse import OptionParser
+
+NAMELIST_FILE = 'namelist.maces.xml'
+# parameter files of model components
+COMPONENT_FILES = {'HYDRO': 'optpar_hydro.xml', 'MINAC': 'optpar_minac.xml',
+                   'OMAC': 'optpar_omac.xml', 'WAVERO': 'optpar_wavero.xml',
+                   'LNDMGR': 'optpar_lndmgr.xml'}
+# array data types of list values
+LIST_DTYPES = {'integer': np.int32, 'real': np.float64, 'logical': np.bool_}
+# loaded configurations keyed by the namelist file
+_CONFIG_CACHE = {}
+
+def parse_edit_key(key):
+    """Parse an edit key.
+    Arguments:
+        key : COMPONENT[:GROUP]:parameter[index]
+    Returns : component, group (None for default), parameter and index
+              (None for all values)
+    """
+    match = re.match(r'^\s*(\w+)(:(\w+))?:(\w+)(\[(\w+)\])?\s*$', key)
+    assert match is not None, "invalid edit key " + key
+    component = match.group(1).upper()
+    assert component=='NAMELIST' or component in COMPONENT_FILES, \
+        "unknown component of edit key " + key
+    return component, match.group(3), match.group(4), match.group(6)
+
+def load_case(case_dir):
+    """Parse the namelist and model parameter files of a case once.
+    Arguments:
+        case_dir : case directory
+    Returns : dictionary of parsed xml trees keyed by file name
+    """
+    trees = {}
+    for filename in [NAMELIST_FILE] + list(COMPONENT_FILES.values()):
+        path = os.path.join(case_dir, filename)
+        if os.path.isfile(path):
+            trees[filename] = ET.parse(path)
+    assert NAMELIST_FILE in trees, "no " + NAMELIST_FILE + " in " + case_dir
+    return trees
+
+def find_entry(trees, key):
+    """Find the xml entry of an edit key.
+    Arguments:
+        trees : dictionary of parsed xml trees
+        key : edit key
+    Returns : file name and xml entry
+    """
+    component, group, parameter, __ = parse_edit_key(key)
+    if component=='NAMELIST':
+        filename = NAMELIST_FILE
+        findstr = "./group/entry[@id='" + parameter + "']"
+    else:
+        filename = COMPONENT_FILES[component]
+        assert filename in trees, filename + " is not found in the case"
+        if component=='HYDRO':
+            findstr = "./entry[@id='" + parameter + "']"
+        else:
+            if group is None:
+                findstr = "./group/entry[@id='" + component + "_TYPE']"
+                group = trees[NAMELIST_FILE].getroot().find(findstr).get('value')
+            findstr = "./group[@id='" + group + "']/entry[@id='" + \
+                parameter + "']"
+    entry = trees[filename].getroot().find(findstr)
+    assert entry is not None, "parameter of " + key + " is not found in " + \
+        filename
+    return filename, entry
+
+def check_value(entry, value):
+    """Check a value against the type and valid values of an xml entry.
+    Arguments:
+        entry : xml entry
+        value : value string
+    Returns : normalized value string
+    """
+    dtype = entry.find('type').text
+    value = str(value).strip()
+    if dtype=='integer':
+        int(value)
+    elif dtype=='real':
+        float(value)
+    elif dtype=='logical':
+        value = value.upper()
+        assert value in ('TRUE', 'FALSE'), "logical value must be TRUE or FALSE"
+    valid_values = entry.find('valid_values')
+    if valid_values is not None and valid_values.text is not None:
+        valids = [item.strip() for item in valid_values.text.split(',')]
+        assert any(is_valid_value(value, valid) for valid in valids), \
+            "value must be one of " + ','.join(valids)
+    return value
+
+def is_valid_value(value, valid):
+    """Check a value string against one item of the valid values of an xml 
+       entry. An item a...b is an inclusive numeric range.
+    Arguments:
+        value : value string
+        valid : valid value item
+    Returns : True if the value matches the item
+    """
+    bounds = valid.split('...')
+    if len(bounds)!=2:
+        return value==valid
+    try:
+        return float(bounds[0])<=float(value)<=float(bounds[1])
+    except ValueError:
+        return False
+
+def set_entry(entry, index, value):
+    """Set the value of an xml entry.
+    Arguments:
+        entry : xml entry
+        index : pft, variable or position of a list value (None for all)
+        value : value or list of values
+    Returns :
+    """
+    items = entry.findall('values/value')
+    if len(items)==0:
+        assert index is None, "entry " + entry.get('id') + " is not a list"
+        assert not isinstance(value, (list,tuple)), \
+            "entry " + entry.get('id') + " takes a single value"
+        entry.set('value', check_value(entry, value))
+        return
+    if index is not None:
+        selected = [item for item in items if index in
+                    (item.get('pft'), item.get('variable'))]
+        if len(selected)==0 and index.isdigit() and int(index)<len(items):
+            selected = [items[int(index)]]
+        assert len(selected)>0, "index " + index + " is not found in " + \
+            entry.get('id')
+        items = selected
+    if isinstance(value, (list,tuple)):
+        assert len(value)==len(items), "entry " + entry.get('id') + \
+            " takes " + str(len(items)) + " values"
+        values = value
+    else:
+        values = [value] * len(items)
+    for item, val in zip(items, values):
+        item.text = check_value(entry, val)
+
+def apply_edits(trees, edits):
+    """Apply a batch of edits to parsed case files. All invalid edits are
+       reported together.
+    Arguments:
+        trees : dictionary of parsed xml trees
+        edits : dictionary of edit values keyed by edit keys
+    Returns : names of the modified files
+    """
+    modified = set()
+    errors = []
+    for key, value in edits.items():
+        try:
+            filename, entry = find_entry(trees, key)
+            set_entry(entry, parse_edit_key(key)[3], value)
+            modified.add(filename)
+        except (AssertionError, ValueError) as errstr:
+            errors.append(key + ": " + str(errstr))
+    assert len(errors)==0, "invalid edits\n" + '\n'.join(errors)
+    return modified
+
+def write_case(trees, case_dir, filenames=None):
+    """Write parsed case files.
+    Arguments:
+        trees : dictionary of parsed xml trees
+        case_dir : case directory
+        filenames : names of the files to write (None for all)
+    Returns :
+    """
+    if filenames is None:
+        filenames = trees.keys()
+    for filename in filenames:
+        trees[filename].write(os.path.join(case_dir, filename))
+
+def read_edits(filename):
+    """Read edit sets from a YAML or CSV file. A YAML file holds a mapping
+       of edits, a list of mappings or a mapping with a 'cases' list. A CSV
+       file has a header of edit keys and one edit set per row.
+    Arguments:
+        filename : edit file
+    Returns : list of edit dictionaries
+    """
+    if os.path.splitext(filename)[1].lower() in ('.yaml', '.yml'):
+        import yaml
+        with open(filename, 'r') as f:
+            data = yaml.safe_load(f)
+        if isinstance(data, dict) and 'cases' in data:
+            data = data['cases']
+        if isinstance(data, dict):
+            data = [data]
+        assert isinstance(data, list), "invalid edit file " + filename
+        return [dict(edits) for edits in data]
+    with open(filename, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        return [{key.strip(): value for key, value in row.items()}
+                for row in reader]
+
+def edit_case(case_dir, edits):
+    """Apply a batch of edits to a case in one parse and write pass.
+    Arguments:
+        case_dir : case directory
+        edits : dictionary of edit values keyed by edit keys
+    Returns :
+    """
+    trees = load_case(case_dir)
+    modified = apply_edits(trees, edits)
+    write_case(trees, case_dir, modified)
+
+def create_sweep(template_dir, sweep_root, edit_sets,
+                 name_format='case{:04d}'):
+    """Generate case directories of a parameter sweep from a template case.
+       The template files are parsed once and RUNROOT of each case is set
+       to its directory unless it is edited.
+    Arguments:
+        template_dir : template case directory
+        sweep_root : directory of the generated cases
+        edit_sets : list of edit dictionaries
+        name_format : case directory name format
+    Returns : list of case directories
+    """
+    template = load_case(template_dir)
+    # validate all edit sets before any case is generated
+    errors = []
+    for ii, edits in enumerate(edit_sets):
+        try:
+            apply_edits(copy.deepcopy(template), edits)
+        except AssertionError as errstr:
+            errors.append(name_format.format(ii) + ": " + str(errstr))
+    assert len(errors)==0, '\n'.join(errors)
+    # the sweep directory is not copied if it is inside the template
+    sweep_path = os.path.abspath(sweep_root)
+    def ignore_sweep(src, names):
+        return [name for name in names if
+                os.path.abspath(os.path.join(src,name))==sweep_path]
+    case_dirs = []
+    for ii, edits in enumerate(edit_sets):
+        case_dir = os.path.join(sweep_root, name_format.format(ii))
+        shutil.copytree(template_dir, case_dir, ignore=ignore_sweep)
+        trees = copy.deepcopy(template)
+        edits = dict(edits)
+        if 'NAMELIST:RUNROOT' not in edits:
+            edits['NAMELIST:RUNROOT'] = os.path.abspath(case_dir)
+        apply_edits(trees, edits)
+        write_case(trees, case_dir)
+        case_dirs.append(case_dir)
+    return case_dirs
+
+###############################################################################
+class FrozenDict(dict):
+    """Read-only dictionary of configuration values. Array values are 
+       flagged read-only as well and copy.deepcopy gives a mutable copy.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("configuration values are read-only")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+def parse_value(dtype, text):
+    """Convert an xml value string to its typed value.
+    Arguments:
+        dtype : xml data type (integer, real, logical or char)
+        text : value string
+    Returns : typed value
+    """
+    if dtype=='integer':
+        return int(text)
+    elif dtype=='real':
+        return float(text)
+    elif dtype=='logical':
+        value = text.strip().upper()
+        assert value in ('TRUE', 'FALSE'), "invalid logical value " + text
+        return value=='TRUE'
+    return text
+
+def parse_entries(entries):
+    """Parse xml entries into typed values.
+    Arguments:
+        entries : list of xml entries
+    Returns : dictionary of typed values and list of char keys
+    """
+    values = {}
+    keys_str = []
+    for entry in entries:
+        key = entry.get('id')
+        dtype = entry.find('type').text
+        if 'value' in entry.keys():
+            # single value setting
+            values[key] = parse_value(dtype, entry.get('value'))
+            if dtype=='char':
+                keys_str.append(key)
+        else:
+            # list value setting
+            items = [parse_value(dtype, value.text) for value in 
+                     entry.findall('values/value')]
+            if dtype in LIST_DTYPES:
+                values[key] = np.array(items, dtype=LIST_DTYPES[dtype], 
+                                       order='F')
+            else:
+                values[key] = items
+    return values, keys_str
+
+def resolve_references(values, keys_str):
+    """Resolve $VAR references among char values in topological order.
+    Arguments:
+        values : dictionary of typed values (updated in place)
+        keys_str : list of char keys
+    Returns :
+    """
+    pattern = re.compile(r'\$(\w+)')
+    keys_set = set(keys_str)
+    depends = {}
+    for key in keys_str:
+        depends[key] = [name for name in pattern.findall(values[key]) 
+                        if name in keys_set and name!=key]
+    state = {}
+    def resolve(key, path):
+        if state.get(key)=='done':
+            return
+        assert state.get(key)!='active', "circular reference " + \
+            ' -> '.join(path + [key])
+        state[key] = 'active'
+        for name in depends[key]:
+            resolve(name, path + [key])
+        values[key] = pattern.sub(lambda match: values[match.group(1)] 
+            if match.group(1) in depends and match.group(1)!=key 
+            else match.group(0), values[key])
+        state[key] = 'done'
+    for key in keys_str:
+        resolve(key, [])
+
+def freeze_values(values):
+    """Make a dictionary of typed values read-only.
+    Arguments:
+        values : dictionary of typed values
+    Returns : FrozenDict of the values
+    """
+    for key, value in values.items():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(value, list):
+            values[key] = tuple(value)
+    return FrozenDict(values)
+
+def get_file_stamp(filename):
+    """Get the modification stamp of a file.
+    Arguments:
+        filename : file name
+    Returns : tuple of absolute path, modification time (ns) and size
+    """
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+
+###############################################################################
+class MacesConfig(object):
+    """Typed and read-only configuration of a MACES case, i.e. the namelist
+       and the parameters of the selected model of each component.
+
+    Attributes:
+        m_namelist : namelist values
+        m_params : parameter values keyed by component (HYDRO, MINAC, OMAC,
+                   WAVERO and LNDMGR)
+        m_stamps : modification stamps of the parsed files
+    """
+
+    # constructor
+    def __init__(self, namelist, params, stamps):
+        self.m_namelist = namelist
+        self.m_params = FrozenDict(params)
+        self.m_stamps = stamps
+
+    def __setstate__(self, state):
+        # arrays are unpickled writable
+        self.__dict__.update(state)
+        for values in [self.m_namelist] + list(self.m_params.values()):
+            for value in values.values():
+                if isinstance(value, np.ndarray):
+                    value.flags.writeable = False
+
+    @classmethod
+    def from_xml(cls, filename):
+        """Parse the namelist file and its model parameter files.
+        Arguments:
+            filename : namelist file
+        Returns : MacesConfig object
+        """
+        stamps = [get_file_stamp(filename)]
+        root = ET.parse(filename).getroot()
+        namelist, keys_str = parse_entries(root.findall('./group/entry'))
+        resolve_references(namelist, keys_str)
+        params = {}
+        for component, __ in COMPONENT_FILES.items():
+            xmlfile = namelist[component + '_FILE']
+            stamps.append(get_file_stamp(xmlfile))
+            root = ET.parse(xmlfile).getroot()
+            if component=='HYDRO':
+                findstr = "./entry"
+            else:
+                findstr = "./group/[@id='" + namelist[component + '_TYPE'] + \
+                    "']/entry"
+            params[component] = freeze_values(
+                parse_entries(root.findall(findstr))[0])
+        return cls(freeze_values(namelist), params, tuple(stamps))
+
+    def is_current(self):
+        """Check whether the parsed files are unchanged.
+        Arguments:
+        Returns : True if no parsed file is modified
+        """
+        try:
+            return all(get_file_stamp(stamp[0])==stamp 
+                       for stamp in self.m_stamps)
+        except OSError:
+            return False
+
+    def get_namelist(self):
+        """Get the namelist values.
+        Arguments:
+        Returns : read-only namelist dictionary
+        """
+        return self.m_namelist
+
+    def get_params(self, component=None):
+        """Get mutable copies of model parameters.
+        Arguments:
+            component : model component (None for all)
+        Returns : parameter dictionary (keyed by component if None)
+        """
+        if component is None:
+            return copy.deepcopy(self.m_params)
+        return copy.deepcopy(self.m_params[component])
+
+    def dumps(self):
+        """Serialize the configuration.
+        Arguments:
+        Returns : pickled bytes
+        """
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        """Deserialize a configuration.
+        Arguments:
+            data : pickled bytes
+        Returns : MacesConfig object
+        """
+        return pickle.loads(data)
+
+def load_config(filename):
+    """Load the configuration of a case. A configuration is parsed once per
+       process and reused until any of its files is modified.
+    Arguments:
+        filename : namelist file
+    Returns : MacesConfig object
+    """
+    key = os.path.abspath(filename)
+    config = _CONFIG_CACHE.get(key)
+    if config is None or not config.is_current():
+        config = MacesConfig.from_xml(filename)
+        _CONFIG_CACHE[key] = config
+    return config
+
+if __name__=='__main__':
+
+    # use the OptionParser to parse the command line options
+    parser = OptionParser()
+    parser.add_option("-c", "--case", type="string", dest="case_dir",
+                      default='.')
+    parser.add_option("-e", "--edits", type="string", dest="edit_file")
+    parser.add_option("-o", "--output", type="string", dest="sweep_root",
+                      default=None)
+    (options, args) = parser.parse_args()
+
+    try:
+        assert options.edit_file is not None, "no edit file is given"
+        edit_sets = read_edits(options.edit_file)
+        if options.sweep_root is None:
+            assert len(edit_sets)==1, \
+                "multiple edit sets need a sweep output directory (-o)"
+            edit_case(options.case_dir, edit_sets[0])
+        else:
+            case_dirs = create_sweep(options.case_dir, options.sweep_root,
+                                     edit_sets)
+            print(len(case_dirs), "cases are created in", options.sweep_root)
+    except AssertionError as errstr:
+        # print error message and exit the program
+        print("maces_config fails due to that", errstr)
+        sys.exit(1)
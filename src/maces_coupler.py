@@ -11,27 +11,72 @@ Simulation coupler
 import sys
 import numpy as np
 import maces_utilities as utils
+import maces_archive as archive
 from datetime import date
 
 MAX_OF_STEP = 1800  # maximum simulation time step (s)
 rk4_mode = 101      # Runge-kutta iteration mode
+NHYDRO_STATE = 20   # number of saved hydrodynamic state columns
+DRY_DEPTH = 1e-6    # water depth (m) of dry cells (TOL_REL of TAIHydroMOD)
+TIDAL_DAY = 89424.0 # tidal cycle (s) of spin-up convergence and emulator
+EMULATOR_STEP = 600 # phase bin length (s) of the tidal-cycle emulator
+EMULATOR_FTOL = 0.1 # relative forcing departure of a new emulator cycle
 
-def run_tai_maces(input_data, models, spinup):
+def get_hydro_state(taihydro, nx, nvar):
+    """Save the hydrodynamic model state, e.g. at the end of spin-up.
+    Arguments:
+        taihydro : hydrodynamic model object
+        nx : number of platform cells
+        nvar : number of hydrodynamic state variables
+    Returns : hydrodynamic model state
+    """
+    uhydro = np.zeros((nx,nvar), dtype=np.float64, order='F')
+    states = np.zeros((nx,NHYDRO_STATE), dtype=np.float64, order='F')
+    taihydro.getmodelstate(uhydro, states)
+    return {'uhydro': uhydro, 'states': states}
+
+def set_hydro_state(taihydro, hydro_state):
+    """Restore a hydrodynamic model state saved by get_hydro_state.
+    Arguments:
+        taihydro : hydrodynamic model object
+        hydro_state : hydrodynamic model state
+    Returns : 
+    """
+    taihydro.setmodelstate(hydro_state['uhydro'], hydro_state['states'])
+
+def run_tai_maces(input_data, models, spinup, hydro_traj=None, profiler=None):
     """Write model outputs into a nc file.
     Arguments:
         input_data : various input data
         models : model objects
         spinup : True = spinup, otherwise regular
+        hydro_traj : hydrodynamic trajectory to record or replay (optional)
+        profiler : site profiler of loop phases and step counters (optional)
     Returns : 
         tai_state : model state variables
         uhydro_out : hydrodynamic archives
         ecogeom_out : eco-geomorphology archives
+        stats_out : hydrodynamic statistics archives
     """
     # namelist settings
     namelist = input_data['namelist']
     verbose = namelist['Verbose']
     uhydro_tol = namelist['HYDRO_TOL']
     dyncheck = namelist['DYN_CHECK']
+    imex = namelist['HYDRO_SCHEME']=='imex'
+    # steps are capped by the CFL condition if cfl>0
+    cfl = namelist['HYDRO_CFL']
+    # steps are truncated at forcing records and output times, the step 
+    # after a truncated step resumes the step before truncation
+    step_events = namelist['STEP_EVENTS']
+    event_periods = [60.0*namelist[key] for key in ['U10_TSTEP', 
+        'h_TSTEP', 'Wave_TSTEP', 'SSC_TSTEP']] + \
+        [3600.0*namelist['Tair_TSTEP'], 3600.0]
+    if utils.get_shr_output_step(namelist['HYDRO_TSTEP'])>0:
+        event_periods.append(utils.get_shr_output_step( \
+            namelist['HYDRO_TSTEP']))
+    # hydrodynamics are skipped to the next event if the platform is dry
+    quiet_skip = namelist['QUIET_SKIP']
     date0_str = namelist['RUN_STARTDATE'].split('-')
     date1_str = namelist['RUN_STOPDATE'].split('-')
     date0 = date(int(date0_str[0]), int(date0_str[1]), int(date0_str[2]))
@@ -40,10 +85,13 @@ def run_tai_maces(input_data, models, spinup):
     else:
         date1 = utils.get_spinup_stop_date(date0, namelist['SPINUP_OPTION'], 
                                            namelist['SPINUP_N'])
+    # the spin-up stops early once the tidal-cycle mean states converge
+    converge = spinup and namelist['SPINUP_TYPE']=='converge'
     
     # input settings
     x = input_data['coord']['x']
     #site_dx = input_data['coord']['dx']
+    fetch = input_data['coord']['fetch']
     pft = input_data['state']['pft']
     zh = input_data['state']['zh']
     Bag = input_data['state']['Bag']
@@ -73,8 +121,30 @@ def run_tai_maces(input_data, models, spinup):
     porSed = mac_mod.m_params['porSed']
     rhoOM = omac_mod.m_params['rhoOM']
     wave_mod = namelist['WAVE_TYPE']
+    replay = (hydro_traj is not None) and hydro_traj.m_mode=='replay'
+    # the platform elevation and soil OM evolve morfac times faster than 
+    # the hydrodynamics in regular runs
+    morfac = 1.0 if spinup else namelist['MORFAC']
+    assert morfac>0, "MORFAC must be positive"
+    # the hydrodynamics of a representative tidal cycle are reused until 
+    # the platform elevation changes by more than MORFAC_DZ
+    emulate = (not spinup) and (not replay) and namelist['MORFAC_DZ']>0
+    # the adaptive platform grid is regenerated every year in regular runs
+    adaptive = (not spinup) and namelist['GRID_TYPE']=='adaptive'
+    assert not (adaptive and hydro_traj is not None), \
+        "hydrodynamic trajectories only support the uniform grid"
+    if replay:
+        uhydro = hydro_traj.get_initial_state()
+    else:
+        uhydro = {'h': taihydro.sim_h, 'U': taihydro.sim_u, 
+                  'Hwav': taihydro.sim_hwav, 'Uwav': taihydro.sim_uwav, 
+                  'tau': taihydro.sim_tau, 'Css': taihydro.sim_css}
+        if hydro_traj is not None:
+            hydro_traj.set_initial_state(uhydro)
     
-    # output variables
+    # output variables are archived on the initial grid
+    x_out = x
+    regridded = False
     jdn = utils.get_julian_from_date(date0.year, date0.month, date0.day)
     nday = (date1 - date0).days
     nhour = 24 * nday
@@ -82,26 +152,17 @@ def run_tai_maces(input_data, models, spinup):
     nt_ecogeom = utils.get_lng_output_num(date0, date1, namelist['ECOGEOM_TSTEP'])
     uhydro_out = {}
     if (not spinup) and (nt_hydro>0) and namelist['OUTPUT_HYDRO']:
-        uhydro_out['x'] = np.float32(x)
-        uhydro_out['h'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
-        uhydro_out['U'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
-        uhydro_out['Hwav'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
-        uhydro_out['Uwav'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
-        uhydro_out['tau'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
-        uhydro_out['Css'] = 1e20 * np.ones((nt_hydro,nx), dtype=np.float32)
+        hydro_archive = archive.HydroArchive(x, nt_hydro, 
+            namelist['HYDRO_TSTEP'], namelist['HYDRO_ARCHIVE'])
+        # the regular run starts from the spin-up hydrodynamic state
+        hydro_archive.set_initial_state(uhydro)
     ecogeom_out = {}
-    ecogeom_tot = np.zeros(nt_ecogeom, dtype=np.float32)
     if (not spinup) and (nt_ecogeom>0):
-        ecogeom_out['x'] = np.float32(x)
-        ecogeom_out['pft'] = -1 * np.ones((nt_ecogeom,nx), dtype=np.int8)
-        ecogeom_out['zh'] = 1e20 * np.ones((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['Esed'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['Dsed'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['Lbed'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['DepOM'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['Bag'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['Bbg'] = np.zeros((nt_ecogeom,nx), dtype=np.float32)
-        ecogeom_out['OM'] = 1e20 * np.ones((nt_ecogeom,nx,npool), dtype=np.float32)
+        ecogeom_archive = archive.EcogeomArchive(x, nt_ecogeom, npool)
+    stats_out = {}
+    if (not spinup) and (nt_ecogeom>0) and namelist['OUTPUT_STATS']:
+        hydro_stats = archive.HydroStatistics(x, nt_ecogeom, 
+                                              namelist['STATS_QUANTILE'])
         
     # temporal variables
     Esed = np.zeros(nx, dtype=np.float64, order='F')
@@ -114,7 +175,19 @@ def run_tai_maces(input_data, models, spinup):
     tau_old = np.zeros(nx, dtype=np.float64, order='F')
     
     # temporal variables for landward migration
-    inund = -1 * np.ones((8760,nx), dtype=np.int8)
+    inund = archive.InundationAccumulator(nx)
+    nvar = len(uhydro_tol)
+    if converge:
+        cycles = archive.CycleConvergence(nx, TIDAL_DAY)
+    if emulate:
+        emulator = archive.HydroEmulator(nx, TIDAL_DAY, EMULATOR_STEP, 
+                                         namelist['MORFAC_DZ'], EMULATOR_FTOL)
+        emulator.start(0.0, zh)
+    
+    # profile the loop phases if a profiler is given
+    profile = profiler is not None
+    if profile:
+        profiler.set_stage('spinup' if spinup else 'run')
     
     # start simulation
     t = 0.0
@@ -123,11 +196,13 @@ def run_tai_maces(input_data, models, spinup):
     dindx = -1
     ncount = 0
     curstep = 50.0
-    nextstep = MAX_OF_STEP
-    hydro_indx = -1
-    ecogeom_indx = -1
+    nextstep = curstep
     lndmgr_indx = -1
-    while t <= tf:
+    regrid_indx = -1
+    # steps capped by the CFL condition, truncated at events, skipped while 
+    # dry or emulated can end exactly at tf, where forcings end
+    exact_stop = cfl>0 or step_events or quiet_skip or emulate
+    while t<tf or (t==tf and not exact_stop):
         if t>=3.6e3*(hindx+1) and hindx+1<=nhour:
             hindx = hindx + 1
             if verbose and spinup:
@@ -139,8 +214,11 @@ def run_tai_maces(input_data, models, spinup):
             if np.mod(hindx,24)==0:
                 dindx = dindx + 1
                 lndmgr_indx = dindx
+                regrid_indx = dindx
                 year, month, day = utils.get_date_from_julian(jdn+dindx)
                 date_cur = date(year, month, day)
+                slr_year = utils.get_morphological_date(date0, date_cur, 
+                                                        morfac).year
                 doy = min(date_cur.timetuple().tm_yday, 365)
                 slope = utils.get_platform_slope(x, zh)
                         
@@ -155,8 +233,11 @@ def run_tai_maces(input_data, models, spinup):
         Twav_inst = Twav[indx]
         indx = utils.get_forcing_index(t, 'minute', namelist['SSC_TSTEP'])
         Cs0_inst = Cs0[indx]
-        indx = int( (year-date0.year)/namelist['SLR_TSTEP'] )
+        indx = int( (slr_year-date0.year)/namelist['SLR_TSTEP'] )
         rslr_inst = rslr[indx]
+        forcings_inst = [h0_inst, U10_inst, Twav_inst, Cs0_inst]
+        if profile:
+            profiler.lap('forcings')
         
         # simulate hydrodynamics
         if mac_mod.m_update_Css:
@@ -166,31 +247,93 @@ def run_tai_maces(input_data, models, spinup):
             sources[:] = 0.0
             sinks[:] = 0.0
           
-        taihydro.modelsetup(sources, sinks, zh, pft, Bag, xref, Twav_inst,
-                            h0_inst, U10_inst, Cs0_inst)
-        curstep, nextstep, error = taihydro.modelrun(rk4_mode, uhydro_tol, 
-                                                     dyncheck, curstep)
-        assert error==0, "runge-Kutta iteration is more than MAXITER"
-        taihydro.modelcallback(wave_mod)
-        assert np.all(np.isfinite(taihydro.sim_h)), "NaN h found"
-        assert np.all(np.isfinite(taihydro.sim_u)), "NaN U found"
-        assert np.all(np.isfinite(taihydro.sim_uwav)), "NaN Uwav found"
-        assert np.all(np.isfinite(taihydro.sim_hwav)), "NaN Hwav found"
-        assert np.all(np.isfinite(taihydro.sim_tau)), "NaN tau found"
-        assert np.all(np.isfinite(taihydro.sim_css)), "NaN Css found"
-        dtau = taihydro.sim_tau - tau_old
-        tau_old[:] = taihydro.sim_tau
+        tevent = np.inf
+        if replay:
+            curstep, nextstep, uhydro = hydro_traj.replay()
+            if profile:
+                profiler.lap('hydro_replay')
+        elif emulate and emulator.is_emulating(t, zh, forcings_inst):
+            # the hydrodynamic core resumes from its last simulated state 
+            # at the same phase of a later tidal cycle, with the step its 
+            # controller proposed last
+            curstep = emulator.get_step(t)
+            uhydro = emulator.get_state(t)
+            if hydro_traj is not None:
+                hydro_traj.record(curstep, nextstep, uhydro)
+            if profile:
+                profiler.lap('hydro_emulate')
+                profiler.count('emulated_steps')
+        elif quiet_skip and h0_inst<=0 and (not np.any(sources)) and \
+                np.all(uhydro['h']<=DRY_DEPTH):
+            # the dry platform stays at rest until forcings change or the 
+            # tide rises above the seaward cell
+            nextstep = curstep
+            tevent = utils.get_next_event_time(t, event_periods)
+            tevent = utils.get_flooding_time(t, min(tevent, t+MAX_OF_STEP), 
+                                             h0, zh[0], namelist['h_TSTEP'])
+            curstep = tevent - t
+            if hydro_traj is not None:
+                hydro_traj.record(curstep, nextstep, uhydro)
+            if profile:
+                profiler.lap('hydro_skip')
+                profiler.count('quiet_steps')
+        else:
+            if cfl>0:
+                maxstep = taihydro.getcflstep(cfl)
+                if maxstep<curstep:
+                    curstep = maxstep
+                    if profile:
+                        profiler.count('capped_steps')
+            natstep = curstep
+            if step_events:
+                tevent = utils.get_next_event_time(t, event_periods)
+                curstep = min(curstep, tevent - t)
+                if profile and curstep<natstep:
+                    profiler.count('event_steps')
+            trystep = curstep
+            taihydro.modelsetup(sources, sinks, zh, pft, Bag, xref, 
+                                Twav_inst, h0_inst, U10_inst, Cs0_inst)
+            curstep, nextstep, error = taihydro.modelrun(rk4_mode, imex, 
+                uhydro_tol, dyncheck, curstep)
+            if curstep==trystep and trystep<natstep:
+                # the truncated step was accepted
+                nextstep = max(nextstep, natstep)
+            if profile:
+                profiler.lap('hydro_run')
+                profiler.count('rk_rejects', taihydro.sim_nreject)
+            assert error==0, "runge-Kutta iteration is more than MAXITER"
+            taihydro.modelcallback(wave_mod)
+            assert np.all(np.isfinite(taihydro.sim_h)), "NaN h found"
+            assert np.all(np.isfinite(taihydro.sim_u)), "NaN U found"
+            assert np.all(np.isfinite(taihydro.sim_uwav)), "NaN Uwav found"
+            assert np.all(np.isfinite(taihydro.sim_hwav)), "NaN Hwav found"
+            assert np.all(np.isfinite(taihydro.sim_tau)), "NaN tau found"
+            assert np.all(np.isfinite(taihydro.sim_css)), "NaN Css found"
+            uhydro = {'h': taihydro.sim_h, 'U': taihydro.sim_u, 
+                      'Hwav': taihydro.sim_hwav, 'Uwav': taihydro.sim_uwav, 
+                      'tau': taihydro.sim_tau, 'Css': taihydro.sim_css}
+            if hydro_traj is not None:
+                hydro_traj.record(curstep, nextstep, uhydro)
+            if profile:
+                profiler.lap('hydro_callback')
+        if emulate and emulator.m_recording:
+            if emulator.record(t, curstep, uhydro, forcings_inst) and profile:
+                profiler.count('emulator_cycles')
+        dtau = uhydro['tau'] - tau_old
+        tau_old[:] = uhydro['tau']
         
         # simulate mineral accretion
         mac_inputs = {'x': x, 'xref': xref, 'pft': pft, 'zh': zh, 
-                      'Css': taihydro.sim_css, 'tau': taihydro.sim_tau, 
-                      'U': taihydro.sim_u, 'h': taihydro.sim_h, 
+                      'Css': uhydro['Css'], 'tau': uhydro['tau'], 
+                      'U': uhydro['U'], 'h': uhydro['h'], 
                       'Bag': Bag, 'Esed': Esed, 'Dsed': Dsed, 'Lbed': Lbed, 
                       'S': slope, 'dtau': dtau, 'TR': trng, 'dt': curstep, 
                       'refCss': refCss}
         Esed = mac_mod.mineral_suspension(mac_inputs)
         Dsed = mac_mod.mineral_deposition(mac_inputs)
         Lbed = mac_mod.bed_loading(mac_inputs)
+        if profile:
+            profiler.lap('minac')
         
         # simulate organic matter accretion
         omac_inputs = {'x': x, 'zh': zh, 'S': slope, 'pft': pft, 'OM': OM, 
@@ -205,84 +348,156 @@ def run_tai_maces(input_data, models, spinup):
         DepOM_pools = np.zeros((nx,npool), dtype=np.float64, order='F')
         DepOM_pools[:,0] = 0.158 * DepOM
         DepOM_pools[:,1] = 0.842 * DepOM
-        OM += (DepOM_pools - DecayOM) * curstep
+        OM += (DepOM_pools - DecayOM) * curstep * morfac
+        if profile:
+            profiler.lap('omac')
         
         # simulate wave-driven lateral erosion
         wavero_inputs = {'x': x}
         x = wavero_mod.wave_erosion(wavero_inputs)
+        if profile:
+            profiler.lap('wavero')
         
         # simulate landward migration on the 1st day of each year
         if not spinup:
-            indx = 24*(doy-1) + np.mod(hindx,24)
-            inund[indx] = np.int8(1) * (taihydro.sim_h>1e-3)
+            inund.update(curstep, uhydro['h'])
             if doy==1 and lndmgr_indx==dindx:
-                lndmgr_inputs = {'pft': pft, 'Bag': Bag, 'sal': sal, 
-                                 'inund': inund}
+                lndmgr_inputs = {'pft': pft, 'Bag': Bag, 'sal': sal}
+                lndmgr_inputs.update(inund.get_inundation())
                 pft = lndmgr_mod.landward_migration(lndmgr_inputs)
-                inund[:] = np.int8(-1)
+                inund.reset()
                 lndmgr_indx = lndmgr_indx + 1
+            if profile:
+                profiler.lap('lndmgr')
+        
+        # regenerate the adaptive grid on the 1st day of each year
+        if adaptive and doy==1 and regrid_indx==dindx:
+            regrid_indx = regrid_indx + 1
+            x_new = utils.generate_adaptive_grid(x, zh, trng, 
+                namelist['CELL_RES'], namelist['CELL_RES_MAX'], 
+                breaks=input_data['coord']['xbreak'], 
+                nmax=namelist['CELL_NUM'])
+            if dindx>0 and (len(x_new)!=nx or not np.allclose(x_new, x)):
+                # water depth, momentum and sediment are remapped 
+                # conservatively and diagnostic states by cell
+                hydro_state = get_hydro_state(taihydro, nx, nvar)
+                uhydro_new = utils.remap_conservative(x, 
+                    hydro_state['uhydro'], x_new)
+                states_new = utils.remap_categorical(x, 
+                    hydro_state['states'], x_new)
+                state_new = utils.remap_platform_state(x, x_new, {'zh': zh, 
+                    'pft': pft, 'Bag': Bag, 'Bbg': Bbg, 'OM': OM, 
+                    'Esed': Esed, 'Dsed': Dsed, 'Lbed': Lbed, 
+                    'DepOM': DepOM, 'DecayOM': DecayOM, 'tau_old': tau_old})
+                fetch = np.array(np.interp(x_new, x, fetch), order='F')
+                taihydro.regridhydromod(x_new, state_new['zh'], fetch, 
+                                        uhydro_new, states_new)
+                inund.remap(x, x_new, taihydro.sim_h)
+                x = x_new
+                nx = len(x)
+                zh = state_new['zh']
+                pft = state_new['pft']
+                Bag = state_new['Bag']
+                Bbg = state_new['Bbg']
+                OM = state_new['OM']
+                Esed = state_new['Esed']
+                Dsed = state_new['Dsed']
+                Lbed = state_new['Lbed']
+                DepOM = state_new['DepOM']
+                DecayOM = state_new['DecayOM']
+                tau_old = state_new['tau_old']
+                sources = np.zeros(nx, dtype=np.float64, order='F')
+                sinks = np.zeros(nx, dtype=np.float64, order='F')
+                slope = utils.get_platform_slope(x, zh)
+                xref = utils.get_refshore_coordinate(x, zh)
+                uhydro = {'h': taihydro.sim_h, 'U': taihydro.sim_u, 
+                          'Hwav': taihydro.sim_hwav, 
+                          'Uwav': taihydro.sim_uwav, 
+                          'tau': taihydro.sim_tau, 'Css': taihydro.sim_css}
+                if emulate:
+                    emulator = archive.HydroEmulator(nx, TIDAL_DAY, 
+                        EMULATOR_STEP, namelist['MORFAC_DZ'], EMULATOR_FTOL)
+                    emulator.start(t+curstep, zh)
+                out_operator = utils.get_remap_operator(x, x_out)
+                regridded = True
+                if profile:
+                    profiler.count('regrids')
+            if profile:
+                profiler.lap('regrid')
         
         # update platform elevation
         if not spinup:
             zh = utils.update_platform_elev(zh, Esed, Dsed, Lbed, DepOM, \
-                      rhoSed, rhoOM, porSed, rslr_inst, curstep)
+                      rhoSed, rhoOM, porSed, rslr_inst, curstep*morfac)
             xref = utils.get_refshore_coordinate(x, zh)
+            if profile:
+                profiler.lap('platform')
              
         # archive short-term hydrodynamic state variables
+        if regridded:
+            uhydro_arch = utils.remap_platform_state(x, x_out, uhydro, 
+                                                     out_operator)
+        else:
+            uhydro_arch = uhydro
         if (not spinup) and (nt_hydro>0) and namelist['OUTPUT_HYDRO']:
-            indx = utils.get_shr_output_index(t, namelist['HYDRO_TSTEP'])
-            if indx>hydro_indx:
-                hydro_indx = indx
-                uhydro_out['h'][indx] = taihydro.sim_h
-                uhydro_out['U'][indx] = taihydro.sim_u
-                uhydro_out['Hwav'][indx] = taihydro.sim_hwav
-                uhydro_out['Uwav'][indx] = taihydro.sim_uwav
-                uhydro_out['tau'][indx] = taihydro.sim_tau
-                uhydro_out['Css'][indx] = taihydro.sim_css
+            hydro_archive.update(t, curstep, uhydro_arch)
         
         # archive long-term mean eco-geomorphology variables
         if (not spinup) and (nt_ecogeom>0):
             indx = utils.get_lng_output_index(date0, date_cur, \
                 namelist['ECOGEOM_TSTEP'])
-            ecogeom_tot[indx] = ecogeom_tot[indx] + curstep
-            ecogeom_out['Esed'][indx] = ecogeom_out['Esed'][indx] + \
-                Esed * curstep
-            ecogeom_out['Dsed'][indx] = ecogeom_out['Dsed'][indx] + \
-                Dsed * curstep
-            ecogeom_out['Lbed'][indx] = ecogeom_out['Lbed'][indx] + \
-                Lbed * curstep
-            ecogeom_out['DepOM'][indx] = ecogeom_out['DepOM'][indx] + \
-                DepOM * curstep
-            ecogeom_out['Bag'][indx] = ecogeom_out['Bag'][indx] + \
-                Bag * curstep
-            ecogeom_out['Bbg'][indx] = ecogeom_out['Bbg'][indx] + \
-                Bbg * curstep
-            if indx>ecogeom_indx:
-                ecogeom_indx = indx
-                ecogeom_out['zh'][indx] = zh
-                ecogeom_out['OM'][indx] = OM
-                ecogeom_out['pft'][indx] = pft
+            ecogeom_vars = {'zh': zh, 'OM': OM, 'pft': pft, 'Esed': Esed, 
+                            'Dsed': Dsed, 'Lbed': Lbed, 'DepOM': DepOM, 
+                            'Bag': Bag, 'Bbg': Bbg}
+            if regridded:
+                ecogeom_vars = utils.remap_platform_state(x, x_out, 
+                    ecogeom_vars, out_operator)
+            ecogeom_archive.update(indx, curstep, ecogeom_vars)
+            if namelist['OUTPUT_STATS']:
+                hydro_stats.update(indx, curstep, uhydro_arch)
+        if profile:
+            profiler.lap('archive')
+            profiler.count('steps')
+            if curstep<0.1:
+                profiler.count('small_steps')
             
         # check small time step
         if curstep<0.1:
             ncount = ncount + 1
             err_msg = 'run diverge at step ' + '{:d}'.format(hindx)
             assert ncount<=100, err_msg
-            nextstep = 50.0
         else:
             ncount = 0
-        t = t + curstep
+        if curstep==tevent-t:
+            # steps truncated at an event end exactly at the event
+            t = tevent
+        else:
+            t = t + curstep
+        
+        # check the convergence of the spin-up at the end of tidal cycles
+        if converge and cycles.update(t, curstep, {'h': uhydro['h'], 
+                'U': uhydro['U'], 'Css': uhydro['Css'], 'Bag': Bag}):
+            if profile:
+                profiler.count('cycles')
+            # replayed spin-ups stop where the recorded spin-up stopped
+            if (not replay) and cycles.m_metric<namelist['SPINUP_TOL']:
+                break
+        if replay and converge and hydro_traj.is_replayed():
+            break
         curstep = nextstep
-        nextstep = MAX_OF_STEP
+    
+    if converge:
+        print('spin-up stops at day {:.2f} after {:d} tidal cycles with '
+              'convergence metric {:.3e}'.format(t/8.64e4, cycles.m_ncycle, 
+              cycles.m_metric))
+        sys.stdout.flush()
     
     # returns
+    if (not spinup) and (nt_hydro>0) and namelist['OUTPUT_HYDRO']:
+        uhydro_out = hydro_archive.finalize()
     if (not spinup) and (nt_ecogeom>0):
-        for jj in range(nx):
-            ecogeom_out['Esed'][:,jj] = ecogeom_out['Esed'][:,jj]/ecogeom_tot
-            ecogeom_out['Dsed'][:,jj] = ecogeom_out['Dsed'][:,jj]/ecogeom_tot
-            ecogeom_out['Lbed'][:,jj] = ecogeom_out['Lbed'][:,jj]/ecogeom_tot
-            ecogeom_out['DepOM'][:,jj] = ecogeom_out['DepOM'][:,jj]/ecogeom_tot
-            ecogeom_out['Bag'][:,jj] = ecogeom_out['Bag'][:,jj]/ecogeom_tot
-            ecogeom_out['Bbg'][:,jj] = ecogeom_out['Bbg'][:,jj]/ecogeom_tot
+        ecogeom_out = ecogeom_archive.finalize()
+        if namelist['OUTPUT_STATS']:
+            stats_out = hydro_stats.finalize()
     tai_state = {'pft': pft, 'zh': zh, 'Bag': Bag, 'Bbg': Bbg, 'OM': OM}
-    return tai_state, uhydro_out, ecogeom_out
+    return tai_state, uhydro_out, ecogeom_out, stats_out
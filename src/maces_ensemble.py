@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter ensemble utilities of the MACES
+"""
+
+import os
+import re
+import csv
+import copy
+import numpy as np
+
+# model components whose parameters can be perturbed
+ENSEMBLE_COMPONENTS = ['HYDRO', 'MINAC', 'OMAC', 'WAVERO', 'LNDMGR']
+# model components that are active during the spin-up
+SPINUP_COMPONENTS = ['HYDRO', 'MINAC', 'OMAC', 'WAVERO']
+# eco-geomorphology model components and their model keys
+MODEL_COMPONENTS = {'MINAC': 'mac_mod', 'OMAC': 'omac_mod', 
+                    'WAVERO': 'wavero_mod', 'LNDMGR': 'lndmgr_mod'}
+# hydrodynamic state variables of recorded trajectories
+TRAJECTORY_VARS = ['h', 'U', 'Hwav', 'Uwav', 'tau', 'Css']
+TRAJECTORY_CHUNK = 4096     # number of sub-steps of each file extension
+
+def parse_param_column(column):
+    """Parse a parameter column name of the ensemble sample table. Columns
+       are named COMPONENT:param for scalar parameters (or all pfts of a pft
+       parameter) and COMPONENT:param[pft] for one pft of a pft parameter.
+    Arguments:
+        column : parameter column name
+    Returns : component, parameter name and pft index (-1 for all)
+    """
+    match = re.match(r'^\s*(\w+):(\w+)(\[(\d+)\])?\s*$', column)
+    assert match is not None, "invalid ensemble parameter " + column
+    component = match.group(1).upper()
+    assert component in ENSEMBLE_COMPONENTS, \
+        "unknown model component of ensemble parameter " + column
+    if match.group(4) is None:
+        return component, match.group(2), -1
+    return component, match.group(2), int(match.group(4))
+
+def read_ensemble_samples(filename):
+    """Read the parameter sample table of an ensemble run. The table is a
+       CSV file with a header of parameter columns and one row per member.
+    Arguments:
+        filename : parameter sample table file
+    Returns : parameter column names and sample array (nmember,nparam)
+    """
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        columns = [column.strip() for column in next(reader)]
+        rows = [[float(value) for value in row] for row in reader
+                if len(row)>0]
+    for column in columns:
+        parse_param_column(column)
+    samples = np.array(rows, dtype=np.float64).reshape((-1,len(columns)))
+    assert np.shape(samples)[0]>0, "no ensemble member found in " + filename
+    return columns, samples
+
+def write_lhs_samples(filename, param_ranges, nmember, seed=None):
+    """Generate a Latin hypercube parameter sample table. Each parameter
+       range is divided into nmember equal strata and each stratum is
+       sampled once.
+    Arguments:
+        filename : parameter sample table file
+        param_ranges : list of (parameter column, lower bound, upper bound)
+        nmember : number of ensemble members
+        seed : random seed
+    Returns : parameter column names and sample array (nmember,nparam)
+    """
+    rng = np.random.default_rng(seed)
+    columns = [column for column, __, __ in param_ranges]
+    for column in columns:
+        parse_param_column(column)
+    samples = np.zeros((nmember,len(columns)), dtype=np.float64)
+    for jj, (__, lower, upper) in enumerate(param_ranges):
+        strata = (rng.permutation(nmember) + rng.random(nmember)) / nmember
+        samples[:,jj] = lower + (upper - lower) * strata
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in samples:
+            writer.writerow(['{:.10g}'.format(value) for value in row])
+    return columns, samples
+
+def link_model_params(params):
+    """Make parameters shared by different model components consistent.
+       The mineral accretion model provides the sediment and vegetation
+       drag parameters of the hydrodynamic model and the OM accretion model
+       provides the maximum biomass of the mineral accretion model.
+    Arguments:
+        params : dictionary of component parameters
+    Returns :
+    """
+    hydro_params = params['HYDRO']
+    mac_params = params['MINAC']
+    omac_params = params['OMAC']
+    hydro_params['d50'] = mac_params['d50']
+    for key in ['alphaA', 'betaA', 'alphaD', 'betaD']:
+        if key in mac_params:
+            hydro_params[key] = mac_params[key]
+    if 'Bmax' in omac_params:
+        mac_params['Bmax'] = omac_params['Bmax']
+
+def get_member_params(base_params, columns, values):
+    """Get the parameters of an ensemble member.
+    Arguments:
+        base_params : dictionary of component parameters of the base run
+        columns : parameter column names
+        values : parameter values of the member
+    Returns : dictionary of component parameters
+    """
+    params = copy.deepcopy(base_params)
+    for column, value in zip(columns, values):
+        component, key, pft = parse_param_column(column)
+        assert key in params[component], "parameter " + key + \
+            " is not found in the " + component + " model"
+        if np.issubdtype(np.asarray(params[component][key]).dtype, 
+                         np.integer):
+            # samples of integer parameters are not truncated
+            assert float(value)==np.round(value), "non-integral sample " + \
+                str(value) + " of integer parameter " + column
+            value = int(np.round(value))
+        else:
+            value = float(value)
+        if pft<0 and np.ndim(params[component][key])==0:
+            params[component][key] = value
+        elif pft<0:
+            params[component][key][:] = value
+        else:
+            params[component][key][pft] = value
+    link_model_params(params)
+    return params
+
+def get_spinup_signature(columns, values):
+    """Get the signature of the perturbed parameters that affect the
+       spin-up. Members with the same signature share one spin-up.
+    Arguments:
+        columns : parameter column names
+        values : parameter values of the member
+    Returns : tuple of (parameter column, value)
+    """
+    signature = []
+    for column, value in zip(columns, values):
+        if parse_param_column(column)[0] in SPINUP_COMPONENTS:
+            signature.append((column, float(value)))
+    return tuple(signature)
+
+def is_same_params(params1, params2):
+    """Check whether two model parameter dictionaries are the same.
+    Arguments:
+        params1, params2 : model parameter dictionaries
+    Returns : True if all parameters are equal
+    """
+    if set(params1.keys())!=set(params2.keys()):
+        return False
+    return all(np.array_equal(params1[key], params2[key]) for key in params1)
+
+def has_hydro_feedback(models, params, ref_params):
+    """Check whether the eco-geomorphology models of a member feed back 
+       differently to the hydrodynamics than those of the recording member, 
+       so that the recorded hydrodynamic trajectory can not be replayed. 
+       Models declaring a feedback must have the same parameters as the 
+       recording member and only the parameters of the other models may 
+       differ.
+    Arguments:
+        models : model objects of the member
+        params : model parameters of the member
+        ref_params : model parameters of the recording member
+    Returns : True if the member hydrodynamics may differ from the record
+    """
+    return any(models[key].m_hydro_feedback and (not is_same_params( \
+        params[component], ref_params[component])) 
+        for component, key in MODEL_COMPONENTS.items())
+
+###############################################################################
+class HydroTrajectory(object):
+    """Sub-step hydrodynamic trajectory of a run kept in a memory-mapped 
+       file. A trajectory recorded by one ensemble member is replayed to the 
+       members that differ only in eco-geomorphology parameters, so that 
+       they skip the hydrodynamic solver. State variables are stored in 
+       single precision and the file grows by TRAJECTORY_CHUNK sub-steps.
+
+    Attributes:
+        m_mode : 'record' or 'replay'
+        m_steps : current and next sub-step length (s) of each sub-step
+        m_initial : hydrodynamic state at the start of the run
+    """
+
+    # constructor
+    def __init__(self, filename, nx):
+        self.m_filename = filename
+        self.m_nx = nx
+        self.m_mode = 'record'
+        self.m_steps = []
+        self.m_initial = None
+        self.m_indx = 0
+        self.m_capacity = 0
+        self.m_data = None
+        with open(self.m_filename, 'wb'):
+            pass
+
+    def _extend(self):
+        nvar = len(TRAJECTORY_VARS)
+        self.m_data = None
+        self.m_capacity = self.m_capacity + TRAJECTORY_CHUNK
+        with open(self.m_filename, 'r+b') as f:
+            f.truncate(4 * self.m_capacity * nvar * self.m_nx)
+        self.m_data = np.memmap(self.m_filename, dtype=np.float32, mode='r+', 
+                                shape=(self.m_capacity,nvar,self.m_nx))
+
+    def set_initial_state(self, uhydro):
+        """Record the hydrodynamic state at the start of the run.
+        Arguments:
+            uhydro : hydrodynamic state variables
+        Returns :
+        """
+        self.m_initial = {}
+        for key in TRAJECTORY_VARS:
+            self.m_initial[key] = np.array(uhydro[key], dtype=np.float64)
+
+    def get_initial_state(self):
+        """Get the hydrodynamic state at the start of the run.
+        Arguments:
+        Returns : hydrodynamic state variables
+        """
+        return self.m_initial
+
+    def record(self, curstep, nextstep, uhydro):
+        """Record the hydrodynamic state of a sub-step.
+        Arguments:
+            curstep : sub-step length (s)
+            nextstep : next sub-step length (s)
+            uhydro : hydrodynamic state variables
+        Returns :
+        """
+        assert self.m_mode=='record', "hydrodynamic trajectory is read-only"
+        indx = len(self.m_steps)
+        if indx>=self.m_capacity:
+            self._extend()
+        for ii, key in enumerate(TRAJECTORY_VARS):
+            self.m_data[indx,ii] = uhydro[key]
+        self.m_steps.append((curstep, nextstep))
+
+    def rewind(self):
+        """Finish the recording (or a replay) and start a new replay.
+        Arguments:
+        Returns :
+        """
+        if self.m_mode=='record' and self.m_data is not None:
+            self.m_data.flush()
+            self.m_data = None
+            nstep = max(len(self.m_steps), 1)
+            self.m_data = np.memmap(self.m_filename, dtype=np.float32, 
+                mode='r', shape=(nstep,len(TRAJECTORY_VARS),self.m_nx))
+        self.m_mode = 'replay'
+        self.m_indx = 0
+
+    def replay(self):
+        """Replay the hydrodynamic state of the next sub-step.
+        Arguments:
+        Returns : sub-step length (s), next sub-step length (s) and 
+                  hydrodynamic state variables
+        """
+        assert self.m_indx<len(self.m_steps), \
+            "hydrodynamic trajectory is shorter than the run"
+        curstep, nextstep = self.m_steps[self.m_indx]
+        data = np.array(self.m_data[self.m_indx], dtype=np.float64)
+        uhydro = {}
+        for ii, key in enumerate(TRAJECTORY_VARS):
+            uhydro[key] = data[ii]
+        self.m_indx = self.m_indx + 1
+        return curstep, nextstep, uhydro
+
+    def is_replayed(self):
+        """Check whether all recorded sub-steps are replayed.
+        Arguments:
+        Returns : True if no recorded sub-step is left
+        """
+        return self.m_indx>=len(self.m_steps)
+
+    def close(self):
+        """Release and remove the trajectory file.
+        Arguments:
+        Returns :
+        """
+        self.m_data = None
+        if os.path.exists(self.m_filename):
+            os.remove(self.m_filename)
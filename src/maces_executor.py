@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Executors of the MACES site loop
+
+The site loop is run by MPI processes (mpi4py), by a process pool of
+concurrent.futures or serially. All executors call the same worker function
+with a process rank and the number of processes, so that site scheduling,
+error handling and output archiving do not depend on the executor. mpi4py is
+only imported when the MPI executor is created.
+"""
+
+import os
+import multiprocessing
+import maces_utilities as utils
+from concurrent.futures import ProcessPoolExecutor
+
+EXECUTOR_TYPES = ['auto', 'mpi', 'pool', 'serial']
+# environment variables set by MPI launchers (OpenMPI, MPICH and Intel MPI)
+MPI_LAUNCHER_VARS = ['OMPI_COMM_WORLD_SIZE', 'PMI_SIZE', 'PMIX_RANK']
+# worker arguments inherited by forked pool processes
+_POOL_ARGS = None
+
+def is_mpi_launched():
+    """Check whether the program is started by an MPI launcher.
+    Arguments:
+    Returns : True if any MPI launcher environment variable is set
+    """
+    return any(key in os.environ for key in MPI_LAUNCHER_VARS)
+
+def get_executor(name='auto', nworker=0):
+    """Create the executor of the site loop. The auto executor uses MPI
+       when the program is started by an MPI launcher and runs serially
+       otherwise.
+    Arguments:
+        name : executor type (auto, mpi, pool or serial)
+        nworker : number of pool processes (0 for the number of cpus)
+    Returns : executor object
+    """
+    assert name in EXECUTOR_TYPES, "unknown executor " + name
+    if name=='auto':
+        name = 'mpi' if is_mpi_launched() else 'serial'
+    if name=='mpi':
+        return MPIExecutor()
+    elif name=='pool':
+        return PoolExecutor(nworker)
+    return SerialExecutor()
+
+def _run_pool_worker(worker, rank, nworker):
+    return worker(rank, nworker, *_POOL_ARGS)
+
+###############################################################################
+class SerialExecutor(object):
+    """Run the site loop in the current process.
+
+    Attributes:
+        m_rank : rank of the current process
+        m_size : number of worker processes
+    """
+
+    # constructor
+    def __init__(self):
+        self.m_rank = 0
+        self.m_size = 1
+
+    def is_master(self):
+        """Check whether the current process reads and merges data.
+        Arguments:
+        Returns : True for the master process
+        """
+        return self.m_rank==0
+
+    def bcast(self, obj):
+        """Broadcast a python object from the master process.
+        Arguments:
+            obj : python object (master) or None
+        Returns : python object
+        """
+        return obj
+
+    def bcast_arrays(self, arrays, meta, shared=False):
+        """Broadcast numpy arrays from the master process.
+        Arguments:
+            arrays : dictionary of numpy arrays (master) or None
+            meta : list of (key, shape, data type string)
+            shared : True to share the arrays among processes of a node
+        Returns : dictionary of numpy arrays and list of shared memory
+                  windows
+        """
+        return arrays, []
+
+    def gather(self, obj):
+        """Gather python objects of all processes to the master process.
+        Arguments:
+            obj : python object
+        Returns : list of python objects (master) or None
+        """
+        return [obj]
+
+    def run_workers(self, worker, *args, ntask=0):
+        """Run the site loop worker.
+        Arguments:
+            worker : function of (rank, number of processes, *args)
+            args : worker arguments
+            ntask : number of sites of the loop (0 if unknown)
+        Returns : list of worker results (master) or None
+        """
+        return [worker(0, 1, *args)]
+
+    def barrier(self):
+        """Synchronize all processes.
+        Arguments:
+        Returns :
+        """
+        pass
+
+    def free_arrays(self, windows):
+        """Release broadcast shared memory arrays.
+        Arguments:
+            windows : list of shared memory windows
+        Returns :
+        """
+        pass
+
+###############################################################################
+class PoolExecutor(SerialExecutor):
+    """Run the site loop in a pool of local processes. The broadcast data
+       stay in the master process and are inherited by forked workers
+       (or pickled to each worker if fork is not available).
+
+    Attributes:
+        m_nworker : maximum number of pool processes
+    """
+
+    # constructor
+    def __init__(self, nworker):
+        super(PoolExecutor, self).__init__()
+        if nworker<=0:
+            nworker = os.cpu_count()
+        self.m_nworker = nworker
+
+    def run_workers(self, worker, *args, ntask=0):
+        global _POOL_ARGS
+        # round-robin workers beyond the number of sites would repeat sites
+        nworker = self.m_nworker if ntask<=0 else min(self.m_nworker, ntask)
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+        if fork:
+            _POOL_ARGS = args
+            mp_context = multiprocessing.get_context('fork')
+        else:
+            mp_context = None
+        try:
+            with ProcessPoolExecutor(max_workers=nworker,
+                                     mp_context=mp_context) as pool:
+                if fork:
+                    futures = [pool.submit(_run_pool_worker, worker, rank,
+                               nworker) for rank in range(nworker)]
+                else:
+                    futures = [pool.submit(worker, rank, nworker, *args)
+                               for rank in range(nworker)]
+                return [future.result() for future in futures]
+        finally:
+            _POOL_ARGS = None
+
+###############################################################################
+class MPIExecutor(SerialExecutor):
+    """Run the site loop on MPI processes.
+
+    Attributes:
+        m_comm : MPI communicator
+    """
+
+    # constructor
+    def __init__(self):
+        from mpi4py import MPI
+        self.m_comm = MPI.COMM_WORLD
+        self.m_rank = self.m_comm.Get_rank()
+        self.m_size = self.m_comm.Get_size()
+
+    def bcast(self, obj):
+        return self.m_comm.bcast(obj, root=0)
+
+    def bcast_arrays(self, arrays, meta, shared=False):
+        if shared:
+            # processes on the same node share one copy of the arrays
+            return utils.bcast_arrays_shared(self.m_comm, arrays, meta,
+                                             root=0)
+        return utils.bcast_arrays(self.m_comm, arrays, meta, root=0), []
+
+    def gather(self, obj):
+        return self.m_comm.gather(obj, root=0)
+
+    def run_workers(self, worker, *args, ntask=0):
+        result = worker(self.m_rank, self.m_size, *args)
+        return self.m_comm.gather(result, root=0)
+
+    def barrier(self):
+        self.m_comm.Barrier()
+
+    def free_arrays(self, windows):
+        if len(windows)>0:
+            self.m_comm.Barrier()
+            utils.free_shared_windows(windows)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-site profiling of MACES simulations
+
+The coupler records the wall-clock time of its loop phases, step counters
+and the memory high-water mark of the process into a SiteProfiler. Nothing
+is recorded when no profiler is given to the coupler.
+"""
+
+import sys
+import json
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def get_memory_highwater():
+    """Get the memory high-water mark of the current process.
+    Arguments:
+    Returns : maximum resident set size (MB) or -1 if unknown
+    """
+    if resource is None:
+        return -1.0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform=='darwin':
+        return maxrss / 1048576.0
+    return maxrss / 1024.0
+
+def write_profile(filename, profile):
+    """Write a profile summary into a json file.
+    Arguments:
+        filename : output file name
+        profile : profile summary dictionary
+    Returns :
+    """
+    with open(filename, 'w') as f:
+        json.dump(profile, f, indent=1)
+
+def merge_profiles(profiles):
+    """Aggregate the profile summaries of sites.
+    Arguments:
+        profiles : list of profile summary dictionaries
+    Returns : dictionary of the summed phase times and counters, the maximum
+              memory high-water mark and the site summaries
+    """
+    phases = {}
+    counters = {}
+    for profile in profiles:
+        for key, value in profile['phases'].items():
+            phases[key] = phases.get(key, 0.0) + value
+        for key, value in profile['counters'].items():
+            counters[key] = counters.get(key, 0) + value
+    memory = [profile['memory_mb'] for profile in profiles]
+    return {'nsite': len(profiles), 'phases': phases, 'counters': counters,
+            'memory_mb': float(np.max(memory)) if len(memory)>0 else -1.0,
+            'sites': profiles}
+
+###############################################################################
+class SiteProfiler(object):
+    """Cumulative phase timers and step counters of a site simulation.
+       Phases are timed as laps, i.e. each call of lap() charges the time
+       since the previous lap to a phase of the current stage.
+
+    Attributes:
+        m_site_id : site id
+        m_stage : current stage (site, spinup or run)
+        m_phases : cumulative wall-clock time (s) of stage/phase keys
+        m_counters : step counters of stage/counter keys
+    """
+
+    # constructor
+    def __init__(self, site_id):
+        self.m_site_id = int(site_id)
+        self.m_stage = 'site'
+        self.m_phases = {}
+        self.m_counters = {}
+        self.m_last = time.perf_counter()
+
+    def set_stage(self, stage):
+        """Set the stage of the following phases and counters and restart
+           the lap clock.
+        Arguments:
+            stage : stage name
+        Returns :
+        """
+        self.m_stage = stage
+        self.m_last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to a phase.
+        Arguments:
+            phase : phase name
+        Returns :
+        """
+        now = time.perf_counter()
+        key = self.m_stage + '/' + phase
+        self.m_phases[key] = self.m_phases.get(key, 0.0) + now - self.m_last
+        self.m_last = now
+
+    def count(self, counter, value=1):
+        """Increase a step counter.
+        Arguments:
+            counter : counter name
+            value : increment
+        Returns :
+        """
+        key = self.m_stage + '/' + counter
+        self.m_counters[key] = self.m_counters.get(key, 0) + int(value)
+
+    def get_summary(self):
+        """Get the profile summary of the site.
+        Arguments:
+        Returns : profile summary dictionary
+        """
+        return {'site': self.m_site_id, 'phases': dict(self.m_phases),
+                'counters': dict(self.m_counters),
+                'memory_mb': get_memory_highwater()}
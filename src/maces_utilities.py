@@ -8,20 +8,64 @@ Utility functions for the MACES
 @author: Zeli Tan
 """
 
+import os
+import sys
+import time
+import hashlib
+import zipfile
 import numpy as np
 import xml.etree.ElementTree as ET
 from scipy import constants
 from netCDF4 import Dataset
-from datetime import date
-from mpi4py import MPI
+from datetime import date, timedelta
 
 NTOPSEG = 17
+# elevation (msl) of DIVA segment nodes
+DIVA_ELEVATIONS = [-12.5, -8.5, -5.5, -4.5, -3.5, -2.5, -1.5, -0.5, 0, 0.5, 
+                   1.5, 2.5, 3.5, 4.5, 5.5, 8.5, 12.5, 16.5]
+SITE_SHEET = 'diva'         # sheet name of the site database excel file
+SITE_COLUMNS = 'A:AV'       # columns of the site database excel file
 
 G = constants.g
 Karman = 0.42
 Roul = 1028.0
 visc = 1e-6     # kinematic viscosity of seawater (m2/s)
 TOL = 1e-6      # tolerance for near-zero state variable
+GRID_GROWTH = 0.2   # growth of adaptive cell length per meter away from the 
+                    # refined zone, i.e. the maximum length ratio of 
+                    # neighboring cells minus one
+
+# archived variables of the aggregated multi-site output files
+# (key, long name, units, nc data type, fill value, nc dimensions)
+HYDRO_OUTPUT_VARS = [
+    ('h', r'water depth', 'm', 'f4', 1e20, ('time','x')),
+    ('U', r'tide signed flow velocity', 'm/s', 'f4', 1e20, ('time','x')),
+    ('Hwav', r'significant wave height', 'm', 'f4', 1e20, ('time','x')),
+    ('Uwav', r'wave velocity', 'm/s', 'f4', 1e20, ('time','x')),
+    ('tau', r'bottom shear stress', 'Pa', 'f4', 1e20, ('time','x')),
+    ('Css', r'suspended sediment concentration', 'kg/m3', 'f4', 1e20, 
+     ('time','x')),
+]
+ECOGEOM_OUTPUT_VARS = [
+    ('pft', r'platform plant function type', '0 to 8', 'i1', -1, ('time','x')),
+    ('zh', r'platform surface elevation', 'msl', 'f4', 1e20, ('time','x')),
+    ('Esed', r'sediment erosion rate', 'kg/m2/s', 'f4', 1e20, ('time','x')),
+    ('Dsed', r'suspended sediment deposition rate', 'kg/m2/s', 'f4', 1e20, 
+     ('time','x')),
+    ('Lbed', r'sand bed load rate', 'kg/m2/s', 'f4', 1e20, ('time','x')),
+    ('DepOM', r'Organic matter deposition rate', 'kg/m2/s', 'f4', 1e20, 
+     ('time','x')),
+    ('Bag', r'platform aboveground biomass', 'kg/m2', 'f4', 1e20, 
+     ('time','x')),
+    ('Bbg', r'platform belowground biomass', 'kg/m2', 'f4', 1e20, 
+     ('time','x')),
+    ('OM', r'platform column-integrated soil organic matter', 'kg/m2', 'f4', 
+     1e20, ('time','x','pool')),
+]
+OUTPUT_VARS = {'hydro': HYDRO_OUTPUT_VARS, 'ecogeom': ECOGEOM_OUTPUT_VARS}
+OUTPUT_DESC = {'hydro': 'hydrodynamics', 'ecogeom': 'eco-geomorphology', 
+               'stats': 'hydrodynamic statistics'}
+RECORD_DESC = {'site': r'DIVA site id', 'member': r'ensemble member index'}
 
 def get_date_from_julian(julian):
     """Get date from Julian day number
@@ -75,6 +119,18 @@ def get_spinup_stop_date(date0, tstep, nstep):
         month = date0.month
         year = date0.year + nstep
     return date(year, month, day)
+
+def get_morphological_date(date0, date1, morfac):
+    """Get the date reached by the platform evolution, i.e. the start date 
+       plus morfac times the elapsed days, at most the last valid date.
+    Arguments:
+        date0 : start date object
+        date1 : date object
+        morfac : morphological acceleration factor
+    Returns : date object
+    """
+    nday = min(morfac*(date1 - date0).days, (date.max - date0).days)
+    return date0 + timedelta(days=int(nday))
         
 def construct_tai_platform(diva_segments, coastline, fetchagl, xRes, nmax):
     """Construct the MACES TAI platform.
@@ -91,8 +147,7 @@ def construct_tai_platform(diva_segments, coastline, fetchagl, xRes, nmax):
         zh_tai  : platform grid elevation (m)
         fetch_tai : platform grid fetch (m)
     """
-    zhs = [-12.5, -8.5, -5.5, -4.5, -3.5, -2.5, -1.5, -0.5, 0, 0.5, 1.5, 
-           2.5, 3.5, 4.5, 5.5, 8.5, 12.5, 16.5]
+    zhs = DIVA_ELEVATIONS
     assert len(zhs)-1 == len(diva_segments), \
         "DIVA segments do not match with elevation nodes"
     Nx = 0
@@ -118,13 +173,282 @@ def construct_tai_platform(diva_segments, coastline, fetchagl, xRes, nmax):
             # the end node
             x_tai[-1] = x0
             zh_tai[-1] = zhs[ii+1]
-    fetch_tai[0] = 1e3 * coastline
+    fetch_tai[:] = get_platform_fetch(x_tai, coastline, fetchagl)
+    return x_tai, zh_tai, fetch_tai
+
+def get_platform_fetch(x, coastline, fetchagl):
+    """Get the fetch of platform nodes, which narrows landward with the 
+       coast fetch angle.
+    Arguments:
+        x : platform grid coordinate (m)
+        coastline : coastline length (km)
+        fetchagl: coast fetch angle (degree)
+    Returns : platform grid fetch (m)
+    """
+    Nx = len(x)
+    fetch = np.zeros(Nx, dtype=np.float64, order='F')
+    fetch[0] = 1e3 * coastline
     for ii in np.arange(1,Nx):
-        fetch_tai[ii] = fetch_tai[ii-1] - 2.0*(x_tai[ii]-x_tai[ii-1])* \
+        fetch[ii] = fetch[ii-1] - 2.0*(x[ii]-x[ii-1])* \
             np.tan((90-fetchagl)/180*np.pi)
-        fetch_tai[ii] = max(fetch_tai[ii], 0.01*fetch_tai[0])
+        fetch[ii] = max(fetch[ii], 0.01*fetch[0])
+    return fetch
+
+def get_refined_zone(x, zh, zband):
+    """Get the intervals of a piecewise linear platform profile within an 
+       elevation band around msl.
+    Arguments:
+        x : profile node coordinate (m)
+        zh : profile node elevation (msl)
+        zband : half width of the elevation band (m)
+    Returns : list of (start, end) coordinates (m) of the intervals
+    """
+    zone = []
+    def add_interval(x0, x1):
+        # merge with the previous interval if they are connected
+        if len(zone)>0 and x0<=zone[-1][1]:
+            zone[-1] = (zone[-1][0], max(x1, zone[-1][1]))
+        else:
+            zone.append((x0, x1))
+    for ii in range(len(x)-1):
+        x0, x1 = x[ii], x[ii+1]
+        z0, z1 = zh[ii], zh[ii+1]
+        if z1==z0:
+            if abs(z0)<=zband:
+                add_interval(x0, x1)
+            continue
+        ta = (-zband - z0) / (z1 - z0)
+        tb = (zband - z0) / (z1 - z0)
+        tlo = max(0.0, min(ta, tb))
+        thi = min(1.0, max(ta, tb))
+        if tlo<=thi:
+            add_interval(x0 + tlo*(x1-x0), x0 + thi*(x1-x0))
+    return zone
+
+def generate_adaptive_grid(x, zh, zband, xRes, xResMax, breaks=None, 
+                           nmax=None):
+    """Generate a non-uniform platform grid that resolves the intertidal 
+       zone with the reference cell length. Cells are xRes long where the 
+       profile elevation is within the band and grow with the distance 
+       to the band up to xResMax. Cells are evenly spaced between two 
+       breaks when they would exceed nmax.
+    Arguments:
+        x : profile node coordinate (m)
+        zh : profile node elevation (msl)
+        zband : half width of the refined elevation band (m)
+        xRes : reference node cell length (m)
+        xResMax : maximum node cell length (m)
+        breaks : coordinates (m) kept as grid nodes (None for the profile 
+                 ends)
+        nmax : maximum cell number between two breaks (None for no limit)
+    Returns : platform grid coordinate (m)
+    """
+    zone = get_refined_zone(x, zh, zband)
+    def get_cell_length(xc):
+        if len(zone)==0:
+            return xResMax
+        dist = min(max(0.0, x0-xc, xc-x1) for x0, x1 in zone)
+        return min(xResMax, xRes + GRID_GROWTH*dist)
+    if breaks is None:
+        breaks = [x[0], x[-1]]
+    nodes = [np.array([breaks[0]])]
+    for x0, x1 in zip(breaks[:-1], breaks[1:]):
+        # march with the cell length at the cell center
+        pos = [x0]
+        while pos[-1]<x1:
+            length = get_cell_length(pos[-1])
+            length = get_cell_length(pos[-1] + 0.5*length)
+            pos.append(pos[-1] + length)
+        if len(pos)>2 and pos[-1]-x1>0.5*(pos[-1]-pos[-2]):
+            pos.pop()
+        ncell = max(len(pos)-1, 2)
+        if nmax is not None and ncell>nmax:
+            pos = x0 + (x1-x0)*np.arange(nmax+1)/nmax
+        elif ncell>len(pos)-1:
+            pos = x0 + (x1-x0)*np.arange(ncell+1)/ncell
+        else:
+            pos = np.array(pos)
+            pos = x0 + (pos-x0)*(x1-x0)/(pos[-1]-x0)
+        nodes.append(pos[1:])
+    nodes = np.concatenate(nodes)
+    nodes[-1] = breaks[-1]
+    return np.array(nodes, dtype=np.float64, order='F')
+
+def construct_adaptive_platform(diva_segments, coastline, fetchagl, xRes, 
+                                xResMax, nmax, trng):
+    """Construct the MACES TAI platform on a non-uniform grid refined 
+       within the tidal range around msl.
+    Arguments:
+        diva_segments : DIVA segment length (km)
+        coastline : coastline length (km)
+        fetchagl: coast fetch angle (degree)
+        xRes : reference node cell length (m)
+        xResMax : maximum node cell length (m)
+        nmax : maximum cell number in a segment
+        trng : tidal range (m)
+    Returns :
+        x_tai   : platform grid coordinate (m)
+        zh_tai  : platform grid elevation (msl)
+        fetch_tai : platform grid fetch (m)
+    """
+    x_prof, zh_prof = get_diva_profile(diva_segments)
+    x_tai = generate_adaptive_grid(x_prof, zh_prof, trng, xRes, xResMax, 
+                                   breaks=x_prof, nmax=nmax)
+    zh_tai = np.array(np.interp(x_tai, x_prof, zh_prof), dtype=np.float64, 
+                      order='F')
+    fetch_tai = get_platform_fetch(x_tai, coastline, fetchagl)
     return x_tai, zh_tai, fetch_tai
 
+def get_diva_profile(diva_segments):
+    """Get the nodes of the piecewise linear DIVA platform profile.
+    Arguments:
+        diva_segments : DIVA segment length (km)
+    Returns :
+        x_prof : profile node coordinate (m) of non-empty segments
+        zh_prof : profile node elevation (msl)
+    """
+    assert len(DIVA_ELEVATIONS)-1 == len(diva_segments), \
+        "DIVA segments do not match with elevation nodes"
+    x_prof = [0.0]
+    zh_prof = []
+    for ii, length in enumerate(diva_segments):
+        if length>TOL:
+            if len(zh_prof)==0:
+                zh_prof.append(DIVA_ELEVATIONS[ii])
+            x_prof.append(x_prof[-1] + 1e3*length)
+            zh_prof.append(DIVA_ELEVATIONS[ii+1])
+    return np.array(x_prof), np.array(zh_prof)
+
+def get_cell_edges(x):
+    """Get the edges of platform cells centered at grid nodes.
+    Arguments:
+        x : platform grid coordinate (m)
+    Returns : cell edge coordinate (m)
+    """
+    return np.concatenate(([x[0]], 0.5*(x[1:]+x[:-1]), [x[-1]]))
+
+def get_remap_operator(x, x_new):
+    """Get the remapping operator between two grids, which is reused when 
+       the same grids are remapped repeatedly. The conservative remapping 
+       sums the overlaps of old and new cells.
+    Arguments:
+        x : platform grid coordinate (m)
+        x_new : new platform grid coordinate (m) with the same ends
+    Returns : dictionary of the overlap old cell 'src', new cell 'dst' and 
+              weight 'weights', and the categorical remapping cell 'indice'
+    """
+    edges = get_cell_edges(x)
+    edges_new = get_cell_edges(x_new)
+    pieces = np.union1d(edges, edges_new)
+    center = 0.5 * (pieces[1:] + pieces[:-1])
+    src = np.clip(np.searchsorted(edges, center, side='right')-1, 0, 
+                  len(x)-1)
+    dst = np.clip(np.searchsorted(edges_new, center, side='right')-1, 0, 
+                  len(x_new)-1)
+    weights = np.diff(pieces) / np.diff(edges_new)[dst]
+    indice = np.searchsorted(edges[1:-1], x_new, side='right')
+    return {'src': src, 'dst': dst, 'weights': weights, 'indice': indice, 
+            'nx': len(x_new)}
+
+def remap_conservative(x, values, x_new, operator=None):
+    """Remap cell values to a new grid conserving their transect integral.
+    Arguments:
+        x : platform grid coordinate (m)
+        values : cell values (nx) or (nx,k)
+        x_new : new platform grid coordinate (m) with the same ends
+        operator : remapping operator of get_remap_operator (optional)
+    Returns : cell values on the new grid
+    """
+    if operator is None:
+        operator = get_remap_operator(x, x_new)
+    src = operator['src']
+    dst = operator['dst']
+    weights = operator['weights']
+    nx_new = operator['nx']
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim==1:
+        return np.bincount(dst, weights=values[src]*weights, 
+                           minlength=nx_new)
+    values_new = np.zeros((nx_new,)+values.shape[1:], dtype=np.float64, 
+                          order='F')
+    for jj in range(values.shape[1]):
+        values_new[:,jj] = np.bincount(dst, weights=values[src,jj]*weights, 
+                                       minlength=nx_new)
+    return values_new
+
+def remap_categorical(x, values, x_new, operator=None):
+    """Remap cell values to a new grid by taking the value of the old cell
+       that contains each new node.
+    Arguments:
+        x : platform grid coordinate (m)
+        values : cell values (nx) or (nx,k)
+        x_new : new platform grid coordinate (m)
+        operator : remapping operator of get_remap_operator (optional)
+    Returns : cell values on the new grid
+    """
+    if operator is None:
+        indice = np.searchsorted(get_cell_edges(x)[1:-1], x_new, 
+                                 side='right')
+    else:
+        indice = operator['indice']
+    return np.array(np.asarray(values)[indice], order='F')
+
+def remap_platform_state(x, x_new, state, operator=None):
+    """Remap platform state variables to a new grid. Integer variables 
+       (e.g. pft) are remapped categorically and real variables (e.g. zh, 
+       biomass, OM pools and rates) conservatively.
+    Arguments:
+        x : platform grid coordinate (m)
+        x_new : new platform grid coordinate (m) with the same ends
+        state : dictionary of cell variables
+        operator : remapping operator of get_remap_operator (optional)
+    Returns : dictionary of cell variables on the new grid
+    """
+    if operator is None:
+        operator = get_remap_operator(x, x_new)
+    state_new = {}
+    for key, values in state.items():
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.integer) or values.dtype==bool:
+            state_new[key] = remap_categorical(x, values, x_new, operator)
+        else:
+            state_new[key] = remap_conservative(x, values, x_new, operator)
+    return state_new
+
+def build_platform_segments(site_db, npft):
+    """Build the DIVA segments and ordered pft segments of all sites.
+    Arguments:
+        site_db : dictionary of site database columns
+        npft : number of pfts
+    Returns :
+        diva_segments : DIVA segment length per coastline length (nsite,NTOPSEG)
+        pft_segments : pft segment length (km) in platform order (nsite,npft)
+        pft_codes : pft in platform order, -1 for absent pfts (nsite,npft)
+        masks : validation masks of sites
+            masks['coastline'] : positive coastline length
+            masks['pft'] : pft segment lengths consistent with pft orders
+    """
+    coastline = np.array(site_db['coastline'], dtype=np.float64)
+    area = np.column_stack([site_db['area{:02d}'.format(jj+1)] 
+        for jj in range(NTOPSEG)]).astype(np.float64)
+    segments = np.column_stack([site_db['pft{:d}'.format(jj)] 
+        for jj in range(npft)]).astype(np.float64)
+    orders = np.column_stack([site_db['pft{:d}_order'.format(jj)] 
+        for jj in range(npft)]).astype(np.int32)
+    masks = {}
+    masks['coastline'] = coastline>0
+    masks['pft'] = np.all((segments>0)==(orders>=0), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diva_segments = area / coastline[:,None]
+    # absent pfts are moved to the end with a stable sort
+    sort_key = np.where(orders>=0, orders, np.iinfo(np.int32).max)
+    indices = np.argsort(sort_key, axis=1, kind='stable')
+    present = np.take_along_axis(orders>=0, indices, axis=1)
+    pft_segments = np.where(present, 
+        np.take_along_axis(segments, indices, axis=1), 0.0)
+    pft_codes = np.where(present, indices, -1).astype(np.int32)
+    return diva_segments, pft_segments, pft_codes, masks
+
 def construct_platform_pft(segments, pfts, x_tai):
     """Construct the pft on the MACES platform.
     Arguments:
@@ -144,6 +468,112 @@ def construct_platform_pft(segments, pfts, x_tai):
     pft_tai[indice] = 0
     return pft_tai
             
+def construct_site_platform(diva_segments, coastline, fetchagl, xRes, nmax, 
+                            pft_segments, pfts, xResMax=None, trng=None):
+    """Construct the MACES TAI platform grid and pft of a site.
+    Arguments:
+        diva_segments : DIVA segment length (km)
+        coastline : coastline length (km)
+        fetchagl: coast fetch angle (degree)
+        xRes : reference node cell length (m)
+        nmax : maximum cell number in a segment
+        pft_segments : pft segment length (km)
+        pfts : pft on each segment
+        xResMax : maximum node cell length (m) of the adaptive grid (None 
+                  for the uniform grid of segments)
+        trng : tidal range (m) of the adaptive grid refinement
+    Returns : dictionary of the platform grid coordinate 'x' (m), cell length 
+              'dx' (m), elevation 'zh' (msl), fetch 'fetch' (m) and 'pft', 
+              and the segment nodes 'xbreak' (m) of the adaptive grid
+    """
+    if xResMax is None:
+        x, zh, fetch = construct_tai_platform(diva_segments, coastline, 
+                                              fetchagl, xRes, nmax)
+    else:
+        x, zh, fetch = construct_adaptive_platform(diva_segments, coastline, 
+            fetchagl, xRes, xResMax, nmax, trng)
+    dx = np.zeros_like(x, dtype=np.float64, order='F')
+    dx[0] = 0.5*(x[1]-x[0])
+    dx[1:-1] = 0.5*(x[2:]-x[:-2])
+    dx[-1] = 0.5*(x[-1]-x[-2])
+    pft = construct_platform_pft(pft_segments, pfts, x)
+    platform = {'x': x, 'dx': dx, 'zh': zh, 'fetch': fetch, 'pft': pft}
+    if xResMax is not None:
+        platform['xbreak'], __ = get_diva_profile(diva_segments)
+    return platform
+
+def get_platform_signature(diva_segments, coastline, fetchagl, xRes, nmax, 
+                           pft_segments, pfts, xResMax=None, trng=None):
+    """Get the content signature of a site platform construction.
+    Arguments:
+        same as construct_site_platform
+    Returns : hexadecimal sha1 digest
+    """
+    sha1 = hashlib.sha1()
+    sha1.update(np.array(diva_segments, dtype=np.float64).tobytes())
+    sha1.update(np.array([coastline, fetchagl, xRes, nmax], 
+                         dtype=np.float64).tobytes())
+    sha1.update(np.array(pft_segments, dtype=np.float64).tobytes())
+    sha1.update(np.array(pfts, dtype=np.int64).tobytes())
+    if xResMax is not None:
+        sha1.update(np.array([xResMax, trng], dtype=np.float64).tobytes())
+    return sha1.hexdigest()
+
+def load_platform_cache(cache_dir, signature):
+    """Load a site platform from the platform cache. The cache file is 
+       touched on hits so that eviction removes the least recently used.
+    Arguments:
+        cache_dir : platform cache directory
+        signature : content signature of the platform
+    Returns : platform dictionary or None if not cached
+    """
+    filename = os.path.join(cache_dir, 'platform_' + signature + '.npz')
+    try:
+        with np.load(filename) as data:
+            platform = {'x': np.array(data['x'], dtype=np.float64, order='F'),
+                'dx': np.array(data['dx'], dtype=np.float64, order='F'), 
+                'zh': np.array(data['zh'], dtype=np.float64, order='F'), 
+                'fetch': np.array(data['fetch'], dtype=np.float64, order='F'), 
+                'pft': np.array(data['pft'], dtype=np.int8, order='F')}
+            if 'xbreak' in data:
+                platform['xbreak'] = np.array(data['xbreak'], 
+                                              dtype=np.float64)
+        os.utime(filename)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        # missing or corrupt cache files are constructed again
+        return None
+    return platform
+
+def save_platform_cache(cache_dir, signature, platform, max_size):
+    """Save a site platform to the platform cache and evict the least 
+       recently used platforms beyond the cache size.
+    Arguments:
+        cache_dir : platform cache directory
+        signature : content signature of the platform
+        platform : platform dictionary
+        max_size : maximum number of cached platforms
+    Returns :
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = os.path.join(cache_dir, 'platform_' + signature + '.npz')
+    tmpfile = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(tmpfile, 'wb') as f:
+        np.savez(f, **platform)
+    os.replace(tmpfile, filename)
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.startswith('platform_') and entry.name.endswith('.npz'):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+    entries.sort()
+    for __, path in entries[:max(len(entries)-max_size,0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
 def get_refshore_coordinate(x, zh):
     """Get the coordinate of the shore at msl.
     Arguments:
@@ -209,53 +639,11 @@ def parseXML_namelist(xmlfile):
         xmlfile : the file name string
     Returns : a model setting dictionary
     """
-    tree = ET.parse(xmlfile)
-    root = tree.getroot()
-    namelist = {}
-    keys_str = []
-    for entry in root.findall('./group/entry'):
-        key = entry.get('id')
-        dtype = entry.find('type').text
-        if dtype=='char':
-            keys_str.append(key)
-        if 'value' in entry.keys():
-            # single value setting
-            if dtype=='integer':
-                value = int(entry.get('value'))
-            elif dtype=='real':
-                value = float(entry.get('value'))
-            elif dtype=='logical':
-                if entry.get('value')=='TRUE':
-                    value = True
-                else:
-                    value = False
-            else:
-                value = entry.get('value')
-            namelist[key] = value
-        else:
-            # list value setting
-            values = []
-            for value in entry.findall('values/value'):
-                if dtype=='integer':
-                    values.append(int(value.text))
-                elif dtype=='real':
-                    values.append(float(value.text))
-                elif dtype=='logical':
-                    if value.text=='TRUE':
-                        values.append(True)
-                    else:
-                        values.append(False)
-                else:
-                    values.append(value.text)
-            namelist[key] = np.array(values, dtype=np.float64, order='F')
+    import maces_config as mcfg
+    root = ET.parse(xmlfile).getroot()
+    namelist, keys_str = mcfg.parse_entries(root.findall('./group/entry'))
     # fill environment variable values
-    for key in keys_str:
-        keys_str_iter = list(set(keys_str)-set([key]))
-        for okey in keys_str_iter:
-            string = namelist[okey]
-            if string.find('$'+key)>=0:
-                new_string = string.replace('$'+key, namelist[key])
-                namelist[okey] = new_string
+    mcfg.resolve_references(namelist, keys_str)
     return namelist
     
 def parseXML_params(xmlfile, model):
@@ -266,38 +654,10 @@ def parseXML_params(xmlfile, model):
         model : model name string
     Returns : a model parameter dictionary
     """
-    tree = ET.parse(xmlfile)
-    root = tree.getroot()
-    param_dict = {}
+    import maces_config as mcfg
+    root = ET.parse(xmlfile).getroot()
     findstr = "./group/[@id='" + model + "']/entry"
-    for entry in root.findall(findstr):
-        key = entry.get('id')
-        dtype = entry.find('type').text
-        if 'value' in entry.keys():
-            # single value setting
-            if dtype=='integer':
-                value = int(entry.get('value'))
-            elif dtype=='real':
-                value = float(entry.get('value'))
-            elif dtype=='logical':
-                value = bool(entry.get('value'))
-            else:
-                value = entry.get('value')
-            param_dict[key] = value
-        else:
-            # list value setting
-            values = []
-            for value in entry.findall('values/value'):
-                if dtype=='integer':
-                    values.append(int(value.text))
-                elif dtype=='real':
-                    values.append(float(value.text))
-                elif dtype=='logical':
-                    values.append(bool(value.text))
-                else:
-                    values.append(value.text)
-            param_dict[key] = np.array(values, dtype=np.float64, order='F')
-    return param_dict
+    return mcfg.parse_entries(root.findall(findstr))[0]
 
 def parseXML_hydro_params(xmlfile):
     """Read model parameters from a xml file.
@@ -306,37 +666,9 @@ def parseXML_hydro_params(xmlfile):
         xmlfile : the file name string
     Returns : a model parameter dictionary
     """
-    tree = ET.parse(xmlfile)
-    root = tree.getroot()
-    param_dict = {}
-    for entry in root.findall("./entry"):
-        key = entry.get('id')
-        dtype = entry.find('type').text
-        if 'value' in entry.keys():
-            # single value setting
-            if dtype=='integer':
-                value = int(entry.get('value'))
-            elif dtype=='real':
-                value = float(entry.get('value'))
-            elif dtype=='logical':
-                value = bool(entry.get('value'))
-            else:
-                value = entry.get('value')
-            param_dict[key] = value
-        else:
-            # list value setting
-            values = []
-            for value in entry.findall('values/value'):
-                if dtype=='integer':
-                    values.append(int(value.text))
-                elif dtype=='real':
-                    values.append(float(value.text))
-                elif dtype=='logical':
-                    values.append(bool(value.text))
-                else:
-                    values.append(value.text)
-            param_dict[key] = np.array(values, dtype=np.float64, order='F')
-    return param_dict
+    import maces_config as mcfg
+    root = ET.parse(xmlfile).getroot()
+    return mcfg.parse_entries(root.findall("./entry"))[0]
 
 def get_forcing_index(t, tstep, ntstep):
     """Get the time index of forcing.
@@ -354,6 +686,43 @@ def get_forcing_index(t, tstep, ntstep):
         index = -1
     return index
 
+def get_next_event_time(t, periods, mingap=1.0):
+    """Get the time of the next periodic event, e.g. the start of a forcing 
+       record or an output time, skipping events within a minimum gap.
+    Arguments:
+        t : time in seconds
+        periods : event periods (s)
+        mingap : minimum gap (s) to the next event
+    Returns : time (s) of the next event
+    """
+    tnext = []
+    for period in periods:
+        t1 = (int(t/period) + 1) * period
+        if t1 - t < mingap:
+            t1 = t1 + period
+        tnext.append(t1)
+    return min(tnext)
+
+def get_flooding_time(t, tend, h0, zh0, ntstep):
+    """Get the start of the first tide record above the seaward cell within 
+       a time interval of piecewise constant tide records.
+    Arguments:
+        t : interval start (s)
+        tend : interval end (s)
+        h0 : tide level records (msl)
+        zh0 : seaward cell elevation (msl)
+        ntstep : number of minutes of a tide record
+    Returns : start time (s) of the first flooding record, or tend if the 
+              tide stays below the seaward cell
+    """
+    period = 60.0 * ntstep
+    indx0 = get_forcing_index(t, 'minute', ntstep)
+    indx1 = min(int(np.ceil(tend/period)), len(h0))
+    flooding = np.nonzero(h0[indx0:indx1]>zh0)[0]
+    if len(flooding)>0:
+        return max(t, (indx0 + flooding[0])*period)
+    return tend
+
 def read_force_data(filename, varname, date0, date1, ntstep, 
                     tstep, id_range):
     """Read forcing data from a nc file.
@@ -394,6 +763,119 @@ def read_force_data(filename, varname, date0, date1, ntstep,
         nc.close()
     return data
 
+def get_file_md5(filename):
+    """Get the md5 checksum of a file.
+    Arguments:
+        filename : the file name string
+    Returns : hexadecimal md5 checksum
+    """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1048576), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def get_site_cache_file(filename, cache_dir):
+    """Get the columnar cache file of a site database excel file.
+    Arguments:
+        filename : site database excel file
+        cache_dir : cache directory ('' for the excel file directory)
+    Returns : cache file name
+    """
+    if len(cache_dir)==0:
+        cache_dir = os.path.dirname(os.path.abspath(filename))
+    basename = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, basename + '.cache.nc')
+
+def is_valid_site_cache(filename, cachefile):
+    """Check whether a site database cache is up to date with the excel file.
+       The cache is valid if the excel file has the recorded size and either
+       the recorded modification time or the recorded md5 checksum.
+    Arguments:
+        filename : site database excel file
+        cachefile : site database cache file
+    Returns : True if the cache can be used
+    """
+    if not os.path.isfile(cachefile):
+        return False
+    stat = os.stat(filename)
+    try:
+        nc = Dataset(cachefile, 'r')
+    except OSError:
+        return False
+    try:
+        attrs = nc.ncattrs()
+        if not all(key in attrs for key in ['source_size', 'source_mtime',
+                                           'source_md5']):
+            return False
+        src_size = int(nc.getncattr('source_size'))
+        src_mtime = float(nc.getncattr('source_mtime'))
+        src_md5 = nc.getncattr('source_md5')
+    finally:
+        nc.close()
+    if src_size!=stat.st_size:
+        return False
+    if src_mtime==stat.st_mtime:
+        return True
+    return src_md5==get_file_md5(filename)
+
+def convert_site_database(filename, cachefile):
+    """Convert a site database excel file to a columnar nc cache file.
+    Arguments:
+        filename : site database excel file
+        cachefile : site database cache file
+    Returns :
+    """
+    import pandas as pd
+    df = pd.read_excel(filename, sheet_name=SITE_SHEET, header=0, 
+                       usecols=SITE_COLUMNS)
+    stat = os.stat(filename)
+    tmpfile = cachefile + '.' + str(os.getpid()) + '.tmp'
+    try:
+        nc = Dataset(tmpfile, 'w', format='NETCDF4')
+        nc.source_file = os.path.abspath(filename)
+        nc.source_size = np.int64(stat.st_size)
+        nc.source_mtime = np.float64(stat.st_mtime)
+        nc.source_md5 = get_file_md5(filename)
+        nc.createDimension('site', len(df))
+        for key in df.columns:
+            data = np.array(df[key])
+            if np.issubdtype(data.dtype, np.integer):
+                data = np.int64(data)
+            else:
+                data = np.float64(data)
+            var = nc.createVariable(key, data.dtype, ('site',))
+            var[:] = data
+    finally:
+        nc.close()
+    os.replace(tmpfile, cachefile)
+
+def read_site_database(filename, first_id, last_id, cache_dir=''):
+    """Read the selected sites of a site database. The excel file is 
+       converted once to a columnar nc cache, which is rebuilt when the 
+       excel file changes, and only rows first_id to last_id are read.
+    Arguments:
+        filename : site database excel file
+        first_id : first site index (1-based)
+        last_id : last site index (1-based, clipped to the database size)
+        cache_dir : cache directory ('' for the excel file directory)
+    Returns : dictionary of site database columns
+    """
+    cachefile = get_site_cache_file(filename, cache_dir)
+    if not is_valid_site_cache(filename, cachefile):
+        convert_site_database(filename, cachefile)
+    site_db = {}
+    try:
+        nc = Dataset(cachefile, 'r')
+        nsite = len(nc.dimensions['site'])
+        site_1 = first_id - 1
+        site_n = min(last_id, nsite)
+        for key, var in nc.variables.items():
+            site_db[key] = np.array(var[site_1:site_n])
+    finally:
+        nc.close()
+    return site_db
+
 def get_shr_output_index(t, tstep):
     """Get the time index of short term outputs.
     Arguments:
@@ -409,6 +891,20 @@ def get_shr_output_index(t, tstep):
         index = -1
     return index
 
+def get_shr_output_step(tstep):
+    """Get the time step of short term outputs.
+    Arguments:
+        tstep : time step string
+    Returns : time step in seconds
+    """
+    if tstep=='minute':
+        step = 60.0
+    elif tstep=='hour':
+        step = 3600.0
+    else:
+        step = -1.0
+    return step
+
 def get_shr_output_num(date0, date1, tstep):
     """Get the total number of short term outputs.
     Arguments:
@@ -477,6 +973,7 @@ def get_mpi_dtype(dtype):
         dtype : numpy array data type
     Returns : mpi data type
     """
+    from mpi4py import MPI
     if dtype==np.dtype('float64'):
         return MPI.DOUBLE
     elif dtype==np.dtype('float32'):
@@ -485,6 +982,42 @@ def get_mpi_dtype(dtype):
         return MPI.INT
     elif dtype==np.dtype('int8'):
         return MPI.BYTE
+    elif dtype==np.dtype('bool'):
+        return MPI.BOOL
+
+def get_array_meta(arrays):
+    """Get the shapes and data types of numpy arrays to be broadcast.
+    Arguments:
+        arrays : dictionary of numpy arrays
+    Returns : list of (key, shape, data type string)
+    """
+    return [(key, np.shape(value), np.asarray(value).dtype.str) 
+            for key, value in arrays.items()]
+
+def bcast_arrays(comm, arrays, meta, root=0):
+    """Broadcast numpy arrays with buffer-based collectives so that they 
+       are not pickled. Non-root processes allocate the arrays from the 
+       metadata, which is broadcast beforehand.
+    Arguments:
+        comm : mpi communicator
+        arrays : dictionary of numpy arrays (root) or None
+        meta : list of (key, shape, data type string)
+        root : root process
+    Returns : dictionary of numpy arrays
+    """
+    outputs = {}
+    for key, shape, dtype in meta:
+        if comm.Get_rank()==root:
+            buf = np.ascontiguousarray(arrays[key], dtype=dtype)
+        else:
+            buf = np.empty(shape, dtype=dtype)
+        mpi_dtype = get_mpi_dtype(buf.dtype)
+        if mpi_dtype is None:
+            comm.Bcast(buf.view(np.uint8), root=root)
+        else:
+            comm.Bcast([buf, mpi_dtype], root=root)
+        outputs[key] = buf
+    return outputs
 
 def write_hydro_outputs(filename, tstep, uhydro_out):
     """Write model hydrodynamics outputs into a nc file.
@@ -611,4 +1144,361 @@ def write_ecogeom_outputs(filename, tstep, ecogeom_out):
         OM_var.units = 'kg/m2'
         OM_var[:] = ecogeom_out['OM']
     finally:
-        nc.close()
\ No newline at end of file
+        nc.close()
+
+def write_stats_outputs(filename, tstep, stats_out, output_vars):
+    """Write hydrodynamic statistics outputs into a nc file.
+    Arguments:
+        filename : output file name
+        tstep : time step type string
+        stats_out : hydrodynamic statistics outputs
+        output_vars : archived variable list (see HYDRO_OUTPUT_VARS)
+    Returns : 
+    """
+    nx = len(stats_out['x'])
+    try:
+        nc = Dataset(filename, 'w', format='NETCDF4_CLASSIC')
+        nc.history = 'MACES simulated ' + tstep + ' hydrodynamic statistics'
+        nc.contact = r'Please contact zeli.tan@pnnl.gov for more information'
+        nc.createDimension('time', None)
+        nc.createDimension('x', nx)
+        # create and write variables
+        x_var = nc.createVariable('x', 'f4', ('x',))
+        x_var.long_name = r'platform transect coordinate'
+        x_var.units = 'm'
+        x_var[:] = stats_out['x']
+        for key, long_name, units, dtype, fill, dims in output_vars:
+            var = nc.createVariable(key, dtype, dims, fill_value=fill)
+            var.long_name = long_name
+            var.units = units
+            var[:] = stats_out[key]
+    finally:
+        nc.close()
+
+def get_output_chunksizes(dims, shape):
+    """Get the chunk sizes of an aggregated output variable so that a site 
+       transect is read in as few chunks as possible.
+    Arguments:
+        dims : variable dimension names
+        shape : expected variable dimension sizes
+    Returns : chunk size list
+    """
+    chunksizes = []
+    for dim, size in zip(dims, shape):
+        if dim in ('site','member'):
+            chunksizes.append(1)
+        elif dim=='time':
+            chunksizes.append(max(min(size, 1024), 1))
+        elif dim=='x':
+            chunksizes.append(max(min(size, 512), 1))
+        else:
+            chunksizes.append(max(size, 1))
+    return chunksizes
+
+def create_aggregate_outputs(filename, tstep, category, output_vars, sizes, 
+                             record='site'):
+    """Create an aggregated multi-site output nc file. Sites are stacked 
+       along the site dimension and transects are padded along the x 
+       dimension.
+    Arguments:
+        filename : output file name
+        tstep : time step type string
+        category : 'hydro', 'ecogeom' or 'stats'
+        output_vars : archived variable list (see HYDRO_OUTPUT_VARS)
+        sizes : dimension sizes (None = unlimited)
+        record : stacking dimension, 'site' or ensemble 'member'
+    Returns : nc file handle
+    """
+    nc = Dataset(filename, 'w', format='NETCDF4')
+    nc.history = 'MACES simulated ' + tstep + ' ' + OUTPUT_DESC[category]
+    nc.contact = r'Please contact zeli.tan@pnnl.gov for more information'
+    nc.time_step = tstep
+    nc.category = category
+    for dim, size in sizes.items():
+        nc.createDimension(dim, size)
+    # unlimited dimensions are chunked with their typical sizes
+    chunk_sizes = {record: 1, 'x': 512}
+    for dim, size in sizes.items():
+        if size is not None:
+            chunk_sizes[dim] = size
+    record_var = nc.createVariable(record, 'i4', (record,))
+    record_var.long_name = RECORD_DESC[record]
+    nx_var = nc.createVariable('nx', 'i4', (record,))
+    nx_var.long_name = r'number of valid transect cells of each ' + record
+    dims = (record,'x',)
+    x_var = nc.createVariable('x', 'f4', dims, fill_value=1e20, 
+        chunksizes=get_output_chunksizes(dims, [chunk_sizes[d] for d in dims]))
+    x_var.long_name = r'platform transect coordinate'
+    x_var.units = 'm'
+    for key, long_name, units, dtype, fill, dims in output_vars:
+        dims = (record,) + dims
+        chunks = get_output_chunksizes(dims, [chunk_sizes[d] for d in dims])
+        ncname = 'TSM' if key=='Css' else key
+        var = nc.createVariable(ncname, dtype, dims, fill_value=fill, 
+                                chunksizes=chunks)
+        var.long_name = long_name
+        var.units = units
+    return nc
+
+def append_site_outputs(filename, tstep, category, site_id, outputs, 
+                        output_vars=None, record='site'):
+    """Append the outputs of a site into a per-process aggregated output 
+       shard. The shard is created at the first call.
+    Arguments:
+        filename : output shard file name
+        tstep : time step type string
+        category : 'hydro', 'ecogeom' or 'stats'
+        site_id : DIVA site id (or ensemble member index)
+        outputs : hydrodynamic, ecogeomorphology or statistics outputs
+        output_vars : archived variable list (None = OUTPUT_VARS[category])
+        record : stacking dimension, 'site' or ensemble 'member'
+    Returns : 
+    """
+    if output_vars is None:
+        output_vars = OUTPUT_VARS[category]
+    nx = len(outputs['x'])
+    try:
+        if os.path.exists(filename):
+            nc = Dataset(filename, 'a')
+        else:
+            sizes = {record: None, 'time': np.shape(outputs[output_vars[0][0]])[0], 
+                     'x': None}
+            if 'OM' in outputs:
+                sizes['pool'] = np.shape(outputs['OM'])[2]
+            nc = create_aggregate_outputs(filename, tstep, category, 
+                                          output_vars, sizes, record)
+        indx = len(nc.dimensions[record])
+        nc.variables[record][indx] = site_id
+        nc.variables['nx'][indx] = nx
+        nc.variables['x'][indx,:nx] = outputs['x']
+        for key, __, __, __, __, __ in output_vars:
+            ncname = 'TSM' if key=='Css' else key
+            nc.variables[ncname][indx,:,:nx] = outputs[key]
+    finally:
+        nc.close()
+
+def write_ensemble_params(filename, columns, samples):
+    """Write the parameter samples of ensemble members into an ensemble 
+       output nc file.
+    Arguments:
+        filename : ensemble output file name
+        columns : perturbed parameter names (COMPONENT:param[pft])
+        samples : parameter values of ensemble members (nmember,nparam)
+    Returns : 
+    """
+    try:
+        nc = Dataset(filename, 'a')
+        nc.param_names = ','.join(columns)
+        nc.createDimension('param', len(columns))
+        var = nc.createVariable('param_value', 'f8', ('member','param',))
+        var.long_name = r'perturbed parameter values (see param_names)'
+        members = np.array(nc.variables['member'][:])
+        var[:] = np.array(samples)[members]
+    finally:
+        nc.close()
+
+def merge_output_shards(shards, filename):
+    """Merge per-process aggregated output shards into one output file. 
+       Duplicated sites are only archived once and shards are removed.
+    Arguments:
+        shards : output shard file names
+        filename : merged output file name
+    Returns : 
+    """
+    shards = [shard for shard in shards if os.path.exists(shard)]
+    if len(shards)==0:
+        return
+    # collect unique site records
+    records = []
+    site_ids = set()
+    nx_max = 0
+    for shard in shards:
+        try:
+            nc = Dataset(shard, 'r')
+            sids = np.array(nc.variables['site'][:])
+            nxs = np.array(nc.variables['nx'][:])
+            for indx, site_id in enumerate(sids):
+                if site_id not in site_ids:
+                    site_ids.add(site_id)
+                    records.append((shard, indx, nxs[indx]))
+                    nx_max = max(nx_max, nxs[indx])
+            if shard==shards[0]:
+                tstep = nc.time_step
+                category = nc.category
+                sizes = {}
+                for dim in nc.dimensions:
+                    sizes[dim] = len(nc.dimensions[dim])
+                output_vars = []
+                for varname, var in nc.variables.items():
+                    if varname not in ('site','nx','x'):
+                        output_vars.append((varname, var.long_name, 
+                            var.units, var.dtype.str[1:], var._FillValue, 
+                            var.dimensions[1:]))
+        finally:
+            nc.close()
+    sizes['site'] = len(records)
+    sizes['x'] = nx_max
+    # copy site records shard by shard
+    try:
+        ncout = create_aggregate_outputs(filename, tstep, category, 
+                                         output_vars, sizes)
+        for shard in shards:
+            try:
+                nc = Dataset(shard, 'r')
+                for indx_out, (fname, indx, nx) in enumerate(records):
+                    if fname!=shard:
+                        continue
+                    ncout.variables['site'][indx_out] = \
+                        nc.variables['site'][indx]
+                    ncout.variables['nx'][indx_out] = nx
+                    ncout.variables['x'][indx_out,:nx] = \
+                        nc.variables['x'][indx,:nx]
+                    for varname, __, __, __, __, __ in output_vars:
+                        ncout.variables[varname][indx_out,:,:nx] = \
+                            nc.variables[varname][indx,:,:nx]
+            finally:
+                nc.close()
+    finally:
+        ncout.close()
+    for shard in shards:
+        os.remove(shard)
+
+def read_site_outputs(filename, site_id, varnames=None):
+    """Read the outputs of one site from an aggregated output file.
+    Arguments:
+        filename : aggregated output file name
+        site_id : DIVA site id
+        varnames : variable names to read (None = all)
+    Returns : a dictionary of site transect outputs
+    """
+    try:
+        nc = Dataset(filename, 'r')
+        indice = np.where(np.array(nc.variables['site'][:])==site_id)[0]
+        assert len(indice)>0, "site " + str(site_id) + " is not archived"
+        indx = indice[0]
+        nx = int(nc.variables['nx'][indx])
+        if varnames is None:
+            varnames = [varname for varname in nc.variables 
+                        if varname not in ('site','nx')]
+        site_out = {}
+        for varname in varnames:
+            var = nc.variables[varname]
+            # transects are padded along the x dimension
+            slices = [indx] + [slice(None)]*(var.ndim-1)
+            if 'x' in var.dimensions:
+                slices[var.dimensions.index('x')] = slice(0, nx)
+            site_out[varname] = np.array(var[tuple(slices)])
+    finally:
+        nc.close()
+    return site_out
+
+def bcast_arrays_shared(comm, arrays, meta, root=0):
+    """Broadcast numpy arrays into MPI-3 shared memory windows so that the 
+       processes of a node share one read-only copy. The arrays are 
+       broadcast among the node leaders and read zero-copy by the other 
+       processes of each node.
+    Arguments:
+        comm : mpi communicator
+        arrays : dictionary of numpy arrays (root) or None
+        meta : list of (key, shape, data type string)
+        root : root process
+    Returns : dictionary of numpy arrays and list of shared memory windows
+    """
+    from mpi4py import MPI
+    rank = comm.Get_rank()
+    # the root process leads its node and the leader group
+    order = 0 if rank==root else rank + 1
+    node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=order)
+    is_leader = node_comm.Get_rank()==0
+    color = 0 if is_leader else MPI.UNDEFINED
+    leader_comm = comm.Split(color, key=order)
+    outputs = {}
+    windows = []
+    try:
+        for key, shape, dtype in meta:
+            itemsize = np.dtype(dtype).itemsize
+            nbytes = int(np.prod(shape)) * itemsize if is_leader else 0
+            win = MPI.Win.Allocate_shared(nbytes, itemsize, comm=node_comm)
+            windows.append(win)
+            buf, __ = win.Shared_query(0)
+            data = np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+            if rank==root:
+                data[...] = arrays[key]
+            if is_leader:
+                leader_comm.Bcast(data.reshape(-1).view(np.uint8), root=0)
+            node_comm.Barrier()
+            data.flags.writeable = False
+            outputs[key] = data
+    except Exception:
+        # windows allocated before the error are not returned
+        free_shared_windows(windows)
+        raise
+    finally:
+        if leader_comm!=MPI.COMM_NULL:
+            leader_comm.Free()
+        node_comm.Free()
+    return outputs, windows
+
+def free_shared_windows(windows):
+    """Free the shared memory windows of broadcast arrays.
+    Arguments:
+        windows : list of shared memory windows
+    Returns :
+    """
+    for win in windows:
+        win.Free()
+
+###############################################################################
+class PhaseTimer(object):
+    """Wall-clock timer of the program phases of a process.
+
+    Attributes:
+        m_elapsed : accumulated wall-clock time (s) of each phase
+    """
+
+    # constructor
+    def __init__(self):
+        self.m_elapsed = {}
+        self.m_phase = None
+        self.m_start = 0.0
+
+    def start(self, phase):
+        """Start timing a phase (and stop the current one).
+        Arguments:
+            phase : phase name
+        Returns :
+        """
+        self.stop()
+        self.m_phase = phase
+        self.m_start = time.perf_counter()
+
+    def stop(self):
+        """Stop timing the current phase.
+        Arguments:
+        Returns :
+        """
+        if self.m_phase is not None:
+            elapsed = time.perf_counter() - self.m_start
+            self.m_elapsed[self.m_phase] = \
+                self.m_elapsed.get(self.m_phase, 0.0) + elapsed
+            self.m_phase = None
+
+    def report(self, elapsed):
+        """Print the minimum, mean and maximum wall-clock time of each 
+           phase over the processes that run it.
+        Arguments:
+            elapsed : list of elapsed time dictionaries of processes
+        Returns :
+        """
+        self.stop()
+        print("{:<24s}{:>12s}{:>12s}{:>12s}".format("phase (s)", "min", 
+              "mean", "max"))
+        phases = []
+        for item in elapsed:
+            phases += [phase for phase in item if phase not in phases]
+        for phase in phases:
+            values = np.array([item[phase] for item in elapsed 
+                               if phase in item])
+            print("{:<24s}{:>12.3f}{:>12.3f}{:>12.3f}".format(phase, 
+                  np.min(values), np.mean(values), np.max(values)))
+        sys.stdout.flush()
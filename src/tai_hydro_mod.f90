@@ -22,6 +22,9 @@ module tai_hydro_mod
    real(kind=8), allocatable, dimension(:) :: sim_Uwav
    real(kind=8), allocatable, dimension(:) :: sim_tau
    real(kind=8), allocatable, dimension(:) :: sim_Css
+   ! number of rejected Runge-Kutta-Fehlberg trial steps of the last run
+   !f2py integer :: sim_nreject
+   integer :: sim_nreject = 0
 
 contains
    subroutine InitHydroMod(xin, zhin, fetchin, Cs0, nvar, npft, nx)
@@ -104,17 +107,20 @@ contains
       allocate(par_alphaD(npft))       ; par_alphaD = 0.0d0
       allocate(par_betaD(npft))        ; par_betaD = 0.0d0
 
+      ! cell edges are halfway between nodes, so the end cells are half 
+      ! cells of the node spacing (as get_cell_edges of maces_utilities)
       do ii = 1, nx, 1
          if (ii==1) then
-            m_dX(ii) = 0.5 * (m_X(ii) + m_X(ii+1))
+            m_dX(ii) = 0.5 * (m_X(ii+1) - m_X(ii))
          else if (ii==nx) then
-            m_dX(ii) = 0.5 * (m_X(ii-1) + m_X(ii))
+            m_dX(ii) = 0.5 * (m_X(ii) - m_X(ii-1))
          else
             m_dX(ii) = 0.5 * (m_X(ii+1) - m_X(ii-1))
          end if
          m_uhydro(ii,1) = max(-m_Zh(ii), 0.0)
       end do
       m_uhydro(:,3) = Cs0
+      m_nact = nx
    end subroutine
 
    subroutine FinalizeHydroMod()
@@ -126,6 +132,7 @@ contains
       deallocate(m_dX)
       deallocate(m_Zh)
       deallocate(m_dZh)
+      deallocate(m_xfetch)
       deallocate(m_U)
       deallocate(m_Hwav)
       deallocate(m_kwav)
@@ -182,6 +189,50 @@ contains
       deallocate(par_betaD)
    end subroutine
 
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Move the model onto a new platform grid. The model parameters 
+   !          are kept and the state is set from the remapped GetModelState 
+   !          arrays of the new grid.
+   !
+   !------------------------------------------------------------------------------
+   subroutine RegridHydroMod(xin, zhin, fetchin, uhydro, states, nx, m, k)
+      implicit none
+      !f2py real(kind=8), intent(in) :: xin, zhin, fetchin
+      !f2py real(kind=8), intent(in) :: uhydro, states
+      !f2py integer, intent(hide), depend(xin) :: nx = len(xin)
+      !f2py integer, intent(hide), depend(uhydro) :: m = shape(uhydro,1)
+      !f2py integer, intent(hide), depend(states) :: k = shape(states,1)
+      real(kind=8), dimension(nx) :: xin     ! platform x coordinate (m) 
+      real(kind=8), dimension(nx) :: zhin    ! platform surface elevation (msl)
+      real(kind=8), dimension(nx) :: fetchin ! platform fetch length (m)
+      real(kind=8), dimension(nx,m) :: uhydro
+      real(kind=8), dimension(nx,k) :: states
+      integer :: nx, m, k
+      ! local variables
+      real(kind=8), allocatable, dimension(:,:) :: pft_params
+      integer :: npft
+
+      npft = size(par_cD0)
+      allocate(pft_params(npft,6))
+      pft_params(:,1) = par_alphaA
+      pft_params(:,2) = par_betaA
+      pft_params(:,3) = par_alphaD
+      pft_params(:,4) = par_betaD
+      pft_params(:,5) = par_cD0
+      pft_params(:,6) = par_ScD
+      call FinalizeHydroMod()
+      call InitHydroMod(xin, zhin, fetchin, 0.0d0, m, npft, nx)
+      par_alphaA = pft_params(:,1)
+      par_betaA = pft_params(:,2)
+      par_alphaD = pft_params(:,3)
+      par_betaD = pft_params(:,4)
+      par_cD0 = pft_params(:,5)
+      par_ScD = pft_params(:,6)
+      deallocate(pft_params)
+      call SetModelState(uhydro, states, nx, m, k)
+   end subroutine
+
    !------------------------------------------------------------------------------
    !
    ! Purpose: Set model parameters.
@@ -214,6 +265,84 @@ contains
       par_ScD = ScD
    end subroutine
 
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Get the model state so that a run can be restarted from it.
+   !          The columns of states are U, Hwav, Ewav, Uwav, Twav, kwav, Qb, 
+   !          tau, Swg, Sbf, Swc, Sbrk, Cz, Cs and the six sim_* outputs.
+   !
+   !------------------------------------------------------------------------------
+   subroutine GetModelState(uhydro, states, n, m, k)
+      implicit none
+      !f2py real(kind=8), intent(inout) :: uhydro, states
+      !f2py integer, intent(hide), depend(uhydro) :: n = shape(uhydro,0)
+      !f2py integer, intent(hide), depend(uhydro) :: m = shape(uhydro,1)
+      !f2py integer, intent(hide), depend(states) :: k = shape(states,1)
+      real(kind=8), dimension(n,m) :: uhydro
+      real(kind=8), dimension(n,k) :: states
+      integer :: n, m, k
+
+      uhydro = m_uhydro
+      states(:,1) = m_U
+      states(:,2) = m_Hwav
+      states(:,3) = m_Ewav
+      states(:,4) = m_Uwav
+      states(:,5) = m_Twav
+      states(:,6) = m_kwav
+      states(:,7) = m_Qb
+      states(:,8) = m_tau
+      states(:,9) = m_Swg
+      states(:,10) = m_Sbf
+      states(:,11) = m_Swc
+      states(:,12) = m_Sbrk
+      states(:,13) = m_Cz
+      states(:,14) = m_Cs
+      states(:,15) = sim_h
+      states(:,16) = sim_U
+      states(:,17) = sim_Hwav
+      states(:,18) = sim_Uwav
+      states(:,19) = sim_tau
+      states(:,20) = sim_Css
+   end subroutine
+
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Set the model state saved by GetModelState.
+   !
+   !------------------------------------------------------------------------------
+   subroutine SetModelState(uhydro, states, n, m, k)
+      implicit none
+      !f2py real(kind=8), intent(in) :: uhydro, states
+      !f2py integer, intent(hide), depend(uhydro) :: n = shape(uhydro,0)
+      !f2py integer, intent(hide), depend(uhydro) :: m = shape(uhydro,1)
+      !f2py integer, intent(hide), depend(states) :: k = shape(states,1)
+      real(kind=8), dimension(n,m) :: uhydro
+      real(kind=8), dimension(n,k) :: states
+      integer :: n, m, k
+
+      m_uhydro = uhydro
+      m_U = states(:,1)
+      m_Hwav = states(:,2)
+      m_Ewav = states(:,3)
+      m_Uwav = states(:,4)
+      m_Twav = states(:,5)
+      m_kwav = states(:,6)
+      m_Qb = states(:,7)
+      m_tau = states(:,8)
+      m_Swg = states(:,9)
+      m_Sbf = states(:,10)
+      m_Swc = states(:,11)
+      m_Sbrk = states(:,12)
+      m_Cz = states(:,13)
+      m_Cs = states(:,14)
+      sim_h = states(:,15)
+      sim_U = states(:,16)
+      sim_Hwav = states(:,17)
+      sim_Uwav = states(:,18)
+      sim_tau = states(:,19)
+      sim_Css = states(:,20)
+   end subroutine
+
    !------------------------------------------------------------------------------
    !
    ! Purpose: Pre-run model intermediate variable updates and read boundary 
@@ -260,10 +389,10 @@ contains
       call CalcWaveReductionByVeg(m_X, m_dX, Bag, xref, fctr_wave)
       call UpdateGroundRoughness(pft, Bag, m_uhydro(:,1), m_Cz)
 
-      ! boundary conditions
-      m_uhydro(1,1) = h0
+      ! boundary conditions, the seaward cell is dry at tides below it
+      m_uhydro(1,1) = max(0.0d0, h0)
       !m_uhydro(1,2) = h0*U0
-      m_uhydro(1,3) = h0*Cs0
+      m_uhydro(1,3) = max(0.0d0, h0)*Cs0
    end subroutine
 
    !------------------------------------------------------------------------------
@@ -279,13 +408,16 @@ contains
       integer :: wave_mod     ! wave mode
       ! local variables
       real(kind=8) :: h, kwav, Twav
-      integer :: ii, n, m
+      integer :: ii, n, m, nwet
       
       n = size(m_uhydro,1)
       m = size(m_uhydro,2)
+      ! cells landward of the first dry cell are dry
+      nwet = n
       do ii = 1, n, 1
          if (m_uhydro(ii,1)<=TOL_REL) then
             m_uhydro(ii:n,1) = 0.0
+            nwet = ii - 1
             exit
          end if
       end do
@@ -293,7 +425,15 @@ contains
          where (m_uhydro(:,ii)<0) m_uhydro(:,ii) = 0.0
       end do
 
-      do ii = 1, n, 1
+      ! dry cells are at rest
+      m_uhydro(nwet+1:n,2:m) = 0.0
+      m_U(nwet+1:n) = 0.0
+      m_Cs(nwet+1:n) = 0.0
+      m_Hwav(nwet+1:n) = 0.0
+      m_Uwav(nwet+1:n) = 0.0
+      m_kwav(nwet+1:n) = INFNT
+      m_tau(nwet+1:n) = 0.0
+      do ii = 1, nwet, 1
          h = m_uhydro(ii,1)
          if (h<=TOL_REL) then
             m_uhydro(ii,2:m) = 0.0
@@ -307,7 +447,8 @@ contains
 
       ! update wave dynamics
       if (wave_mod==EQM_WAVE) then
-         do ii = 1, n, 1
+         m_Twav(nwet+1:n) = frc_Twav
+         do ii = 1, nwet, 1
             h = m_uhydro(ii,1)
             if (h<=TOL_REL) then
                m_Hwav(ii) = 0.0
@@ -326,10 +467,11 @@ contains
       else
          Twav = frc_Twav
          m_Twav = frc_Twav
-         call UpdateWaveNumber(Twav, m_uhydro(:,1), m_kwav)
-         call UpdateSgnftWaveHeight(Twav, frc_U10, m_uhydro(:,1), &
-                                    m_kwav, m_Ewav)
-         do ii = 1, n, 1
+         m_Ewav(nwet+1:n) = 0.0
+         call UpdateWaveNumber(Twav, m_uhydro(1:nwet,1), m_kwav(1:nwet))
+         call UpdateSgnftWaveHeight(Twav, frc_U10, m_uhydro(1:nwet,1), &
+                                    m_kwav(1:nwet), m_Ewav(1:nwet))
+         do ii = 1, nwet, 1
             h = m_uhydro(ii,1)
             kwav = m_kwav(ii)
             if (h<=TOL_REL) then
@@ -351,7 +493,8 @@ contains
          !call UpdateWaveDepthBrking(frc_Twav, frc_U10, m_uhydro(:,1), &
          !                           m_Hwav, m_kwav, m_Ewav, m_Qb, m_Sbrk)
       end if
-      call UpdateShearStress(m_Twav, m_uhydro(:,1), m_U, m_Uwav, m_tau)
+      call UpdateShearStress(m_Twav(1:nwet), m_uhydro(1:nwet,1), &
+                             m_U(1:nwet), m_Uwav(1:nwet), m_tau(1:nwet))
 
       sim_h = m_uhydro(:,1)
       sim_U = m_U
@@ -367,29 +510,206 @@ contains
    !          method.
    !
    !------------------------------------------------------------------------------
-   subroutine ModelRun(mode, tol, dyncheck, curstep, ncurstep, &
+   subroutine ModelRun(mode, imex, tol, dyncheck, curstep, ncurstep, &
                        nextstep, error, n)
       implicit none
       !f2py integer, intent(in) :: mode
+      !f2py logical, intent(in) :: imex
       !f2py logical, intent(in) :: dyncheck
       !f2py real(kind=8), intent(in) :: tol, curstep
       !f2py real(kind=8), intent(out) :: ncurstep, nextstep
       !f2py integer, intent(out) :: error
       !f2py integer, intent(hide), depend(tol) :: n = len(tol)
       integer :: mode, error
+      logical :: imex
       logical, dimension(n) :: dyncheck
       real(kind=8), dimension(n) :: tol
       real(kind=8) :: curstep, ncurstep, nextstep
       integer :: n
 
       ncurstep = curstep
+      m_imex = imex
+      call UpdateActiveWindow()
       call RK4Fehlberg(TAIHydroEquations, m_uhydro, mode, tol, &
                        dyncheck, tmp_uhydro, ncurstep, nextstep, error)
+      sim_nreject = rk4_ntrial - 1
       if (error==0) then
+         if (m_imex) then
+            call ImplicitStiffStep(tmp_uhydro, ncurstep, &
+                                   size(m_uhydro,1), size(m_uhydro,2))
+         end if
          m_uhydro = tmp_uhydro
       end if
    end subroutine
 
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Get the maximum stable step of the current state from the 
+   !          Courant-Friedrichs-Lewy condition of the wave celerity.
+   !
+   !------------------------------------------------------------------------------
+   subroutine GetCFLStep(cfl, dtmax)
+      implicit none
+      !f2py real(kind=8), intent(in) :: cfl
+      !f2py real(kind=8), intent(out) :: dtmax
+      real(kind=8) :: cfl, dtmax
+      ! local variables
+      real(kind=8) :: speed, rate
+      integer :: ii
+
+      rate = 0.0d0
+      do ii = 1, size(m_uhydro,1), 1
+         if (m_uhydro(ii,1)>TOL_REL) then
+            speed = abs(m_uhydro(ii,2))/max(0.1,m_uhydro(ii,1)) + &
+               sqrt(G*m_uhydro(ii,1))
+            rate = max(rate, speed/m_dX(ii))
+         end if
+      end do
+      if (rate>0.0d0) then
+         dtmax = cfl / rate
+      else
+         dtmax = INFNT
+      end if
+   end subroutine
+
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Integrate the stiff bottom friction and sediment sink terms 
+   !          over a step by the linearly implicit Euler method. Friction 
+   !          of a cell is weighted over its neighbors, so the momentum 
+   !          update is a tridiagonal solve. The sink of a cell only 
+   !          depends on its own sediment, so the sediment update is 
+   !          diagonal.
+   !
+   !------------------------------------------------------------------------------
+   subroutine ImplicitStiffStep(uhydro, dt, n, m)
+      implicit none
+      real(kind=8), dimension(n,m) :: uhydro
+      real(kind=8) :: dt
+      integer :: n, m
+      ! local variables
+      real(kind=8), dimension(n) :: frc, dfrc
+      real(kind=8), dimension(n) :: diaga, diagb, diagc, rhs
+      real(kind=8) :: hh, wl, wc, wr, sink, pivot
+      logical :: isSingular
+      integer :: ii, nw
+
+      nw = min(n,m_nact)
+      if (nw<2) then
+         return
+      end if
+      ! cell friction and its derivative to the cell momentum
+      do ii = 1, min(n,nw+1), 1
+         if (uhydro(ii,1)>TOL_REL) then
+            hh = max(0.1,uhydro(ii,1))
+            tmp_U(ii) = uhydro(ii,2) / hh
+            frc(ii) = G*m_Cz(ii)*tmp_U(ii)*abs(tmp_U(ii))
+            dfrc(ii) = 2.0*G*m_Cz(ii)*abs(tmp_U(ii))/hh
+         else
+            tmp_U(ii) = 0.0d0
+            frc(ii) = 0.0d0
+            dfrc(ii) = 0.0d0
+         end if
+      end do
+      ! tridiagonal system (I + dt*J)*dq = -dt*friction, the seaward 
+      ! boundary cell and cells beyond the active window are fixed
+      diaga(1) = 0.0d0
+      diagb(1) = 1.0d0
+      diagc(1) = 0.0d0
+      rhs(1) = 0.0d0
+      do ii = 2, nw, 1
+         if (ii==n) then
+            wl = 0.25d0
+            wc = 0.75d0
+            wr = 0.0d0
+         else
+            wl = 0.25d0
+            wc = 0.5d0
+            wr = 0.25d0
+         end if
+         diaga(ii) = dt*wl*dfrc(ii-1)
+         diagb(ii) = 1.0d0 + dt*wc*dfrc(ii)
+         rhs(ii) = -dt*(wl*frc(ii-1) + wc*frc(ii))
+         if (ii<nw) then
+            diagc(ii) = dt*wr*dfrc(ii+1)
+         else
+            diagc(ii) = 0.0d0
+         end if
+         if (ii<n) then
+            rhs(ii) = rhs(ii) - dt*wr*frc(ii+1)
+         end if
+      end do
+      ! Thomas algorithm, the system is not diagonally dominant if 
+      ! friction changes sharply between cells
+      isSingular = .False.
+      do ii = 2, nw, 1
+         pivot = diagb(ii) - diaga(ii)*diagc(ii-1)
+         if (pivot<0.5d0) then
+            isSingular = .True.
+            exit
+         end if
+         diagc(ii) = diagc(ii) / pivot
+         rhs(ii) = (rhs(ii) - diaga(ii)*rhs(ii-1)) / pivot
+      end do
+      if (isSingular) then
+         ! fall back to the lumped diagonal system
+         do ii = 2, nw, 1
+            if (ii==n) then
+               rhs(ii) = -dt*(0.25*frc(ii-1) + 0.75*frc(ii)) / &
+                  (1.0d0 + dt*(0.25*dfrc(ii-1) + 0.75*dfrc(ii)))
+            else
+               rhs(ii) = -dt*(0.25*frc(ii-1) + 0.5*frc(ii) + &
+                  0.25*frc(ii+1)) / (1.0d0 + dt*(0.25*dfrc(ii-1) + &
+                  0.5*dfrc(ii) + 0.25*dfrc(ii+1)))
+            end if
+         end do
+      else
+         do ii = nw-1, 2, -1
+            rhs(ii) = rhs(ii) - diagc(ii)*rhs(ii+1)
+         end do
+      end if
+      uhydro(2:nw,2) = uhydro(2:nw,2) + rhs(2:nw)
+      ! sediment sink relative to the sediment at the start of the step
+      do ii = 2, nw, 1
+         if (ii==n) then
+            sink = 0.25*Cs_sink(ii-1) + 0.75*Cs_sink(ii)
+         else
+            sink = 0.25*Cs_sink(ii-1) + 0.5*Cs_sink(ii) + &
+               0.25*Cs_sink(ii+1)
+         end if
+         if (uhydro(ii,3)>0.0d0) then
+            uhydro(ii,3) = uhydro(ii,3) / (1.0d0 + dt*sink/ &
+               (m_uhydro(ii,3)+TOL_REL))
+         end if
+      end do
+   end subroutine
+
+   !------------------------------------------------------------------------------
+   !
+   ! Purpose: Update the active cell window of the hydrodynamic equations.
+   !          The equations of a cell only involve the states of cells within
+   !          two cells, so the tendencies of all Runge-Kutta-Fehlberg stages
+   !          are zero beyond NACT_HALO cells landward of the last cell with
+   !          water, sediment or sediment sources, and the window gives the 
+   !          same solution as evaluating the whole transect.
+   !
+   !------------------------------------------------------------------------------
+   subroutine UpdateActiveWindow()
+      implicit none
+      ! local variables
+      integer :: ii, n
+
+      n = size(m_uhydro,1)
+      m_nact = 0
+      do ii = n, 1, -1
+         if (any(m_uhydro(ii,:)/=0.0d0) .or. Cs_source(ii)/=0.0d0) then
+            m_nact = ii
+            exit
+         end if
+      end do
+      m_nact = min(n, m_nact+NACT_HALO)
+   end subroutine
+
    !------------------------------------------------------------------------------
    !
    ! Purpose: Calculate cell edge convection flux. 
@@ -408,7 +728,7 @@ contains
       real(kind=8) :: U
       integer :: ii
 
-      do ii = 1, n, 1
+      do ii = 1, min(n,m_nact+1), 1
          if (uhydro(ii,1)>TOL_REL) then
             U = uhydro(ii,2) / max(0.1,uhydro(ii,1))
          else
@@ -443,9 +763,10 @@ contains
       integer :: n, m
       ! local variables
       real(kind=8) :: U
-      integer :: ii
+      integer :: ii, ne
 
-      do ii = 1, n, 1
+      ne = min(n,m_nact+1)
+      do ii = 1, ne, 1
          if (uhydro(ii,1)>TOL_REL) then
             U = uhydro(ii,2) / max(0.1,uhydro(ii,1))
          else
@@ -455,7 +776,7 @@ contains
          tmp_eigval(ii,2) = 1.5*U - sqrt(1.25*(U**2))      
          tmp_eigval(ii,3:m) = U
       end do
-      gradient = maxval(abs(tmp_eigval), dim=2)
+      gradient(1:ne) = maxval(abs(tmp_eigval(1:ne,:)), dim=2)
    end subroutine
 
    subroutine CalcCellDiffusionFlux(uhydro, fluxes, n, m)
@@ -471,7 +792,7 @@ contains
       real(kind=8) :: h1, h2
       integer :: ii
 
-      do ii = 1, n, 1
+      do ii = 1, min(n,m_nact), 1
          fluxes(ii,1:2) = 0.0d0
          if (ii<n) then
             h1 = uhydro(ii,1)
@@ -502,10 +823,17 @@ contains
       real(kind=8), dimension(n,m) :: uhydro, sources
       integer :: n, m
       ! local variables
-      real(kind=8) :: scaler
-      integer :: ii
+      real(kind=8) :: scaler, stiff
+      integer :: ii, nw
 
-      do ii = 1, n, 1
+      nw = min(n,m_nact)
+      ! stiff terms are left to ImplicitStiffStep in the IMEX scheme
+      if (m_imex) then
+         stiff = 0.0d0
+      else
+         stiff = 1.0d0
+      end if
+      do ii = 1, min(n,nw+1), 1
          if (uhydro(ii,1)>TOL_REL) then
             tmp_U(ii) = uhydro(ii,2) / max(0.1,uhydro(ii,1))
          else
@@ -523,29 +851,29 @@ contains
          end if
       end do
       
-      sources(:,1) = 0.0d0
-      do ii = 1, n, 1
+      sources(1:nw,1) = 0.0d0
+      do ii = 1, nw, 1
          scaler = max(0.0,uhydro(ii,3))/(m_uhydro(ii,3)+TOL_REL)
          if (ii==1) then
-            sources(ii,2) = -(0.75*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
+            sources(ii,2) = -stiff*(0.75*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
                0.25*tmp_U(ii+1)*abs(tmp_U(ii+1))*G*m_Cz(ii+1)) - &
                G*(0.75*uhydro(ii,1)+0.25*uhydro(ii+1,1))*tmp_B(ii)/m_dX(ii)
             sources(ii,3) = (0.75*Cs_source(ii)+0.25*Cs_source(ii+1)) - &
-               (0.75*Cs_sink(ii)+0.25*Cs_sink(ii+1))*scaler
+               stiff*(0.75*Cs_sink(ii)+0.25*Cs_sink(ii+1))*scaler
          else if (ii==n) then
-            sources(ii,2) = -(0.75*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
+            sources(ii,2) = -stiff*(0.75*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
                0.25*tmp_U(ii-1)*abs(tmp_U(ii-1))*G*m_Cz(ii-1)) - &
                G*(0.75*uhydro(ii,1)+0.25*uhydro(ii-1,1))*tmp_B(ii)/m_dX(ii)
             sources(ii,3) = (0.25*Cs_source(ii-1)+0.75*Cs_source(ii)) - &
-               (0.25*Cs_sink(ii-1)+0.75*Cs_sink(ii))*scaler
+               stiff*(0.25*Cs_sink(ii-1)+0.75*Cs_sink(ii))*scaler
          else
-            sources(ii,2) = -(0.5*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
+            sources(ii,2) = -stiff*(0.5*tmp_U(ii)*abs(tmp_U(ii))*G*m_Cz(ii)+ &
                0.25*tmp_U(ii-1)*abs(tmp_U(ii-1))*G*m_Cz(ii-1)+ &
                0.25*tmp_U(ii+1)*abs(tmp_U(ii+1))*G*m_Cz(ii+1)) - &
                G*(0.5*uhydro(ii,1)+0.25*uhydro(ii-1,1)+0.25*uhydro(ii+1,1))* &
                tmp_B(ii)/m_dX(ii)
             sources(ii,3) = (0.25*Cs_source(ii-1)+0.5*Cs_source(ii)+ &
-               0.25*Cs_source(ii+1)) - (0.25*Cs_sink(ii-1)+ &
+               0.25*Cs_source(ii+1)) - stiff*(0.25*Cs_sink(ii-1)+ &
                0.5*Cs_sink(ii)+0.25*Cs_sink(ii+1))*scaler
          end if
       end do
@@ -568,12 +896,15 @@ contains
       ! local variables
       real(kind=8) :: Fminus(m), Fplus(m)
       real(kind=8) :: ap, am, dx
-      integer :: ii
+      integer :: ii, nw
 
+      ! cells landward of the active window are at rest
+      nw = min(n,m_nact)
       ! calculate slope limiter
-      call FVSKT_Superbee(uhydro, tmp_phi, n, m)
+      call FVSKT_Superbee(uhydro, tmp_phi, n, m, min(n,nw+1))
       ! calculate cell edge variable values
-      call FVSKT_celledge(uhydro, tmp_phi, tmp_uhydroL, tmp_uhydroR, n, m)
+      call FVSKT_celledge(uhydro, tmp_phi, tmp_uhydroL, tmp_uhydroR, n, m, &
+                          min(n,nw+1))
       ! calculate cell edge convective fluxes 
       call CalcEdgeConvectionFlux(tmp_uhydroL, tmp_FL, n, m)
       call CalcEdgeConvectionFlux(tmp_uhydroR, tmp_FR, n, m)
@@ -585,7 +916,8 @@ contains
       ! calculate cell state sources
       call CalcCellStateSources(uhydro, tmp_SRC, n, m) 
       ! calculate temporal gradients
-      do ii = 1, n, 1
+      duhydro(nw+1:n,:) = 0.0d0
+      do ii = 1, nw, 1
          dx = m_dX(ii)
          if (ii==1) then
             ! seaward boundary condition
@@ -608,7 +940,7 @@ contains
                tmp_P(ii-1,:)) / dx + tmp_SRC(ii,:)
          end if
       end do
-      where (uhydro(:,3)<=0 .and. duhydro(:,3)<0) duhydro(:,3) = 0
+      where (uhydro(1:nw,3)<=0 .and. duhydro(1:nw,3)<0) duhydro(1:nw,3) = 0
    end subroutine
 
 end module tai_hydro_mod 
@@ -24,6 +24,7 @@ class NULLMOD(WAVEROMODSuper):
     # constructor
     def __init__(self, params):
         self.m_params = params
+        self.m_hydro_feedback = False
         
     def wave_erosion(self, inputs):
         """"Calculate storm surge erosion rate. This should be used to get the
@@ -48,6 +49,7 @@ class L16MOD(WAVEROMODSuper):
     # constructor
     def __init__(self, params):
         self.m_params = params
+        self.m_hydro_feedback = False
         
     def wave_erosion(self, inputs):
         """"Calculate storm surge erosion rate. This should be used to get the
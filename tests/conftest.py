@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the MACES tests
+
+The hydrodynamic core is compiled once per test session with gfortran and
+f2py (as make_gnu.sh does) and tests that need it are skipped if it cannot
+be built.
+"""
+
+import os
+import re
+import sys
+import shutil
+import importlib
+import subprocess
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+BENCH_DIR = os.path.join(ROOT_DIR, 'benchmarks')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+FORTRAN_FILES = ['data_buffer_mod.f90', 'hydro_utilities_mod.f90',
+                 'tai_hydro_mod.f90']
+
+def build_hydro_module(build_dir, module_name='TAIHydroMOD', nact_halo=None):
+    """Compile the TAIHydroMOD library.
+    Arguments:
+        build_dir : build directory
+        module_name : python module name
+        nact_halo : halo of the active cell window (None for the default)
+    Returns : True if the library is built
+    """
+    if shutil.which('gfortran') is None:
+        return False
+    for filename in FORTRAN_FILES:
+        shutil.copy(os.path.join(SRC_DIR, filename), build_dir)
+    if nact_halo is not None:
+        filename = os.path.join(build_dir, 'hydro_utilities_mod.f90')
+        with open(filename, 'r') as f:
+            source = f.read()
+        with open(filename, 'w') as f:
+            f.write(re.sub(r'NACT_HALO = \d+', 'NACT_HALO = ' + 
+                           str(nact_halo), source))
+    commands = [
+        ['gfortran', '-O3', '-c', '-fPIC', 'data_buffer_mod.f90',
+         'hydro_utilities_mod.f90'],
+        [sys.executable, '-m', 'numpy.f2py', '-c', '--quiet', '--opt=-O3',
+         '-I.', 'data_buffer_mod.o', 'hydro_utilities_mod.o', '-m',
+         module_name, 'tai_hydro_mod.f90']]
+    for command in commands:
+        result = subprocess.run(command, cwd=build_dir,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        if result.returncode!=0:
+            return False
+    return True
+
+@pytest.fixture(scope='session')
+def taihydro(tmp_path_factory):
+    """The compiled hydrodynamic core (tai_hydro_mod)."""
+    build_dir = str(tmp_path_factory.mktemp('taihydro'))
+    if not build_hydro_module(build_dir):
+        pytest.skip('TAIHydroMOD cannot be built')
+    sys.path.insert(0, build_dir)
+    module = importlib.import_module('TAIHydroMOD')
+    return module.tai_hydro_mod
+
+@pytest.fixture(scope='session')
+def taihydro_full(tmp_path_factory):
+    """The hydrodynamic core evaluating the whole transect, i.e. with an 
+       active cell window wider than any platform."""
+    build_dir = str(tmp_path_factory.mktemp('taihydro_full'))
+    if not build_hydro_module(build_dir, 'TAIHydroFULL', nact_halo=100000):
+        pytest.skip('TAIHydroMOD cannot be built')
+    sys.path.insert(0, build_dir)
+    module = importlib.import_module('TAIHydroFULL')
+    return module.tai_hydro_mod
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the online archive accumulators of the coupler
+"""
+
+import numpy as np
+import maces_archive as archive
+import maces_utilities as utils
+
+NX = 6
+
+def make_substeps(nstep, seed, keys):
+    rng = np.random.default_rng(seed)
+    dts = rng.uniform(10.0, 600.0, nstep)
+    states = []
+    for ii in range(nstep):
+        state = {key: rng.lognormal(-2.0, 1.0, NX) for key in keys}
+        state['h'][rng.random(NX)<0.3] = 0.0
+        states.append(state)
+    return dts, states
+
+def weighted_quantile(values, weights, q):
+    order = np.argsort(values)
+    cdf = np.cumsum(weights[order]) / np.sum(weights)
+    return values[order][np.argmax(cdf>=q-1e-12)]
+
+def test_hydro_statistics():
+    quantiles = [0.1, 0.5, 0.9]
+    stats_keys = [key for key, __, __, __, __ in archive.STATS_VARS]
+    stats = archive.HydroStatistics(np.arange(NX), 2, quantiles)
+    periods = []
+    for indx in range(2):
+        dts, states = make_substeps(200, indx, stats_keys)
+        for dt, state in zip(dts, states):
+            stats.update(indx, dt, state)
+        periods.append((dts, states))
+    stats_out = stats.finalize()
+    for indx, (dts, states) in enumerate(periods):
+        for key in stats_keys:
+            values = np.array([state[key] for state in states])
+            mean = np.average(values, axis=0, weights=dts)
+            var = np.average((values-mean)**2, axis=0, weights=dts)
+            assert np.allclose(stats_out[key+'_mean'][indx], mean, rtol=1e-5)
+            assert np.allclose(stats_out[key+'_var'][indx], var, rtol=1e-4)
+            assert np.allclose(stats_out[key+'_min'][indx], 
+                               np.min(values, axis=0))
+            assert np.allclose(stats_out[key+'_max'][indx], 
+                               np.max(values, axis=0))
+            lower = [lb for k, __, __, lb, __ in archive.STATS_VARS 
+                     if k==key][0]
+            for q in quantiles:
+                est = stats_out[key+'_p{:g}'.format(100*q)][indx]
+                for ii in range(NX):
+                    exact = weighted_quantile(values[:,ii], dts, q)
+                    if exact>lower:
+                        # within one log-spaced sketch bin
+                        assert abs(np.log(est[ii]/exact))<0.05
+                    else:
+                        assert est[ii]<=lower
+        h = np.array([state['h'] for state in states])
+        wet = np.sum(dts[:,None]*(h>archive.INUND_DEPTH), axis=0) / np.sum(dts)
+        assert np.allclose(stats_out['hydroperiod'][indx], wet, rtol=1e-6)
+    assert set(stats_out)==set(['x'] + [key for key, __, __, __, __, __ in
+        archive.get_stats_output_vars(quantiles)])
+
+def linear_hydro_state(t):
+    # hydrodynamic state linear in time
+    state = {}
+    for ii, (key, __, __, __, __, __) in enumerate(utils.HYDRO_OUTPUT_VARS):
+        state[key] = 1.0 + ii + 1e-4*t*np.arange(1, NX+1)
+    return state
+
+def run_hydro_archive(mode, nt=4, seed=0):
+    rng = np.random.default_rng(seed)
+    hydro_archive = archive.HydroArchive(np.arange(NX), nt, 'hour', mode)
+    hydro_archive.set_initial_state(linear_hydro_state(0.0))
+    t = 0.0
+    starts = []
+    while t<3600.0*nt:
+        dt = rng.uniform(20.0, 1800.0)
+        hydro_archive.update(t, dt, linear_hydro_state(t+dt))
+        starts.append((t, dt))
+        t = t + dt
+    return hydro_archive.finalize(), starts
+
+def test_hydro_archive_average():
+    uhydro_out, __ = run_hydro_archive('average')
+    for indx in range(4):
+        expected = linear_hydro_state(3600.0*(indx+0.5))
+        for key in expected:
+            assert np.allclose(uhydro_out[key][indx], expected[key], 
+                               rtol=1e-6), key
+
+def test_hydro_archive_interpolate():
+    uhydro_out, __ = run_hydro_archive('interpolate')
+    for indx in range(4):
+        expected = linear_hydro_state(3600.0*indx)
+        for key in expected:
+            assert np.allclose(uhydro_out[key][indx], expected[key], 
+                               rtol=1e-6), key
+
+def test_hydro_archive_snapshot():
+    uhydro_out, starts = run_hydro_archive('snapshot')
+    for indx in range(4):
+        # the end state of the first sub-step starting in the interval
+        t, dt = [(t, dt) for t, dt in starts if int(t/3600.0)==indx][0]
+        expected = linear_hydro_state(t+dt)
+        for key in expected:
+            assert np.allclose(uhydro_out[key][indx], expected[key], 
+                               rtol=1e-6), key
+
+def test_ecogeom_archive():
+    npool = 2
+    rng = np.random.default_rng(0)
+    ecogeom_archive = archive.EcogeomArchive(np.arange(NX), 2, npool)
+    periods = []
+    for indx in range(2):
+        dts = rng.uniform(10.0, 600.0, 50)
+        states = []
+        for dt in dts:
+            state = {key: rng.random(NX) for key in archive.ECOGEOM_MEAN_VARS}
+            state['zh'] = rng.random(NX)
+            state['OM'] = rng.random((NX,npool))
+            state['pft'] = rng.integers(0, 8, NX)
+            ecogeom_archive.update(indx, dt, state)
+            states.append(state)
+        periods.append((dts, states))
+    ecogeom_out = ecogeom_archive.finalize()
+    for indx, (dts, states) in enumerate(periods):
+        for key in archive.ECOGEOM_MEAN_VARS:
+            mean = np.average([state[key] for state in states], axis=0, 
+                              weights=dts)
+            assert np.allclose(ecogeom_out[key][indx], mean, rtol=1e-6), key
+        # states are taken at the first sub-step of each period
+        assert np.allclose(ecogeom_out['zh'][indx], states[0]['zh'])
+        assert np.allclose(ecogeom_out['OM'][indx], states[0]['OM'])
+        assert np.array_equal(ecogeom_out['pft'][indx], states[0]['pft'])
+    assert ecogeom_out['OM'].shape==(2, NX, npool)
+
+def brute_force_inundation(dts, depths, wet0, dur0):
+    # flooding events ongoing at the start carry their duration
+    wet = depths > archive.INUND_DEPTH
+    hours = np.sum(dts[:,None]*wet, axis=0) / 3.6e3
+    maxdur = np.where(wet0, dur0, 0.0)
+    events = np.array(wet0, dtype=np.int32)
+    for ii in range(NX):
+        prev = wet0[ii]
+        duration = dur0[ii] if wet0[ii] else 0.0
+        for dt, flag in zip(dts, wet[:,ii]):
+            duration = duration + dt/3.6e3 if flag else 0.0
+            maxdur[ii] = max(maxdur[ii], duration)
+            events[ii] += int(flag and not prev)
+            prev = flag
+    return hours, maxdur, events
+
+def test_inundation_accumulator():
+    rng = np.random.default_rng(0)
+    inund = archive.InundationAccumulator(NX)
+    # a first accumulation period that is reset by landward migration
+    for ii in range(20):
+        inund.update(600.0, rng.random(NX) - 0.5)
+    wet0 = inund.m_wet.copy()
+    dur0 = inund.m_curdur.copy()
+    assert np.any(wet0) and np.any(~wet0)
+    inund.reset()
+    dts = rng.uniform(10.0, 1800.0, 300)
+    depths = np.where(rng.random((300,NX))<0.6, rng.random((300,NX)), 0.0)
+    for dt, h in zip(dts, depths):
+        inund.update(dt, h)
+    inundation = inund.get_inundation()
+    hours, maxdur, events = brute_force_inundation(dts, depths, wet0, dur0)
+    assert np.isclose(inundation['inund_period'], np.sum(dts)/3.6e3)
+    assert np.allclose(inundation['inund_hours'], hours)
+    assert np.allclose(inundation['inund_maxdur'], maxdur)
+    assert np.array_equal(inundation['inund_events'], events)
+
+def test_inundation_reset_event():
+    inund = archive.InundationAccumulator(NX)
+    h = np.where(np.arange(NX)<3, 0.5, 0.0)
+    for ii in range(10):
+        inund.update(3.6e3, h)
+    # a flooding event crossing the reset is not split
+    inund.reset()
+    inundation = inund.get_inundation()
+    assert inundation['inund_period']==0.0
+    assert np.all(inundation['inund_hours']==0.0)
+    assert np.array_equal(inundation['inund_events'], h>0)
+    for ii in range(5):
+        inund.update(3.6e3, h)
+    inundation = inund.get_inundation()
+    assert np.allclose(inundation['inund_hours'], np.where(h>0, 5.0, 0.0))
+    assert np.allclose(inundation['inund_maxdur'], np.where(h>0, 15.0, 0.0))
+    assert np.array_equal(inundation['inund_events'], h>0)
+
+def test_inundation_set_wet():
+    inund = archive.InundationAccumulator(NX)
+    h = np.linspace(0.0, 0.1, NX)
+    inund.set_wet(h)
+    # cells wet before the sub-step do not start a new flooding event
+    inund.update(60.0, h)
+    assert np.all(inund.get_inundation()['inund_events']==0)
+
+def test_inundation_remap():
+    inund = archive.InundationAccumulator(NX)
+    x = np.linspace(0.0, 500.0, NX)
+    h = np.linspace(0.5, -0.5, NX)
+    for ii in range(4):
+        inund.update(3.6e3, h)
+    x_new = np.linspace(0.0, 500.0, 2*NX)
+    h_new = np.interp(x_new, x, h)
+    inund.remap(x, x_new, h_new)
+    inundation = inund.get_inundation()
+    indice = utils.remap_categorical(x, np.arange(NX), x_new)
+    assert inundation['inund_events'].dtype==np.int32
+    for key in ['inund_hours', 'inund_maxdur', 'inund_events']:
+        assert len(inundation[key])==2*NX
+    assert np.allclose(inundation['inund_hours'], 
+                       np.where(h>archive.INUND_DEPTH, 4.0, 0.0)[indice])
+    # ongoing flooding continues in the new wet cells only
+    assert np.array_equal(inund.m_wet, h_new>archive.INUND_DEPTH)
+    assert np.all(inund.m_curdur[~inund.m_wet]==0.0)
+    inund.update(3.6e3, h_new)
+    assert np.array_equal(inund.get_inundation()['inund_events'], 
+                          inundation['inund_events'])
+
+def cycle_states(t, decay):
+    # a periodic state with a transient decaying over time
+    phase = np.sin(2*np.pi*t/100.0)
+    scale = 1.0 + decay*np.exp(-t/150.0)
+    return {'h': scale*(1.0 + 0.5*phase)*np.ones(NX), 
+            'U': scale*phase*np.ones(NX), 
+            'Css': scale*np.linspace(0.01, 0.02, NX), 'Bag': np.zeros(NX)}
+
+def test_cycle_convergence():
+    cycles = archive.CycleConvergence(NX, 100.0)
+    metrics = []
+    t = 0.0
+    while t<1000.0:
+        t = t + 5.0
+        if cycles.update(t, 5.0, cycle_states(t, 1.0)):
+            metrics.append(cycles.m_metric)
+    assert cycles.m_ncycle==10
+    # no metric before two cycles are completed
+    assert np.isinf(metrics[0])
+    assert np.all(np.diff(metrics[1:])<0)
+    assert metrics[-1]<1e-2
+
+def test_cycle_convergence_periodic():
+    cycles = archive.CycleConvergence(NX, 100.0)
+    t = 0.0
+    while t<300.0:
+        t = t + 5.0
+        cycles.update(t, 5.0, cycle_states(t, 0.0))
+    assert cycles.m_ncycle==3
+    assert cycles.m_metric<1e-12
+
+def test_hydro_emulator():
+    keys = [key for key, __, __, __, __, __ in utils.HYDRO_OUTPUT_VARS]
+    def hydro_state(t):
+        return {key: (ii+1.0)*(1.0 + np.sin(2*np.pi*t/1200.0))*np.ones(NX) 
+                for ii, key in enumerate(keys)}
+    def forcings(t):
+        return np.array([1.0 + 0.5*np.sin(2*np.pi*t/1200.0), 5.0])
+    zh = np.zeros(NX)
+    emulator = archive.HydroEmulator(NX, 1200.0, 100.0, 0.01, 0.1)
+    assert emulator.m_nbin==12
+    emulator.start(0.0, zh)
+    rng = np.random.default_rng(0)
+    t = 0.0
+    done = False
+    while not done:
+        assert not emulator.is_emulating(t, zh, forcings(t))
+        dt = rng.uniform(5.0, 40.0)
+        done = emulator.record(t, dt, hydro_state(t+dt), forcings(t))
+        t = t + dt
+    assert t>=1200.0 and t<1240.0
+    # emulated steps end at phase bin boundaries
+    steps = []
+    while t<3600.0:
+        # elevation changes are only checked at cycle ends
+        if t>=3000.0:
+            zh = np.full(NX, 0.02)
+        assert emulator.is_emulating(t, zh, forcings(t))
+        dt = emulator.get_step(t)
+        uhydro = emulator.get_state(t)
+        tb = emulator.m_t0 + (emulator.get_bin(t)+1)*emulator.m_dbin
+        phase = np.mod(tb - 50.0, 1200.0)
+        for ii, key in enumerate(keys):
+            # bin means of the recorded cycle
+            assert np.allclose(uhydro[key], hydro_state(phase)[key], 
+                               rtol=0.05, atol=0.05*(ii+1))
+        steps.append(dt)
+        t = t + dt
+    assert np.allclose(steps[1:], 100.0)
+    assert np.isclose(t, 3600.0)
+    assert not emulator.is_emulating(t, zh, forcings(t))
+    assert emulator.m_recording and emulator.m_t0==t
+
+def test_hydro_emulator_forcings():
+    keys = [key for key, __, __, __, __, __ in utils.HYDRO_OUTPUT_VARS]
+    uhydro = {key: np.ones(NX) for key in keys}
+    zh = np.zeros(NX)
+    emulator = archive.HydroEmulator(NX, 1200.0, 100.0, 0.01, 0.1)
+    emulator.start(0.0, zh)
+    # tide depth (m) and wind speed (m/s) of the recorded cycle
+    for t in np.arange(0.0, 1200.0, 50.0):
+        done = emulator.record(t, 50.0, uhydro, 
+                               [2.0 + np.sin(2*np.pi*t/1200.0), 5.0])
+    assert done
+    assert np.allclose(emulator.m_fscale, [3.0, 5.0], rtol=0.01)
+    # departures within the fraction of the recorded magnitude are emulated
+    assert emulator.is_emulating(1230.0, zh, [2.3, 5.4])
+    assert emulator.is_emulating(1530.0, zh, [2.7, 4.6])
+    # a stronger wind starts a new representative cycle
+    assert not emulator.is_emulating(1830.0, zh, [2.0, 5.6])
+    assert emulator.m_recording and emulator.m_t0==1830.0
+    assert emulator.m_fsum is None
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the benchmark suite
+"""
+
+import os
+import sys
+import json
+import subprocess
+import run_benchmarks as bench
+
+BENCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                            '..', 'benchmarks', 'run_benchmarks.py')
+
+def make_results(medians):
+    return {'benchmarks': {name: {'median': median, 'rate': 1.0/median, 
+            'unit': 'steps/s'} for name, median in medians.items()}}
+
+def test_compare_results(capsys):
+    baseline = make_results({'a': 1.0, 'b': 1.0, 'c': 1.0})
+    results = make_results({'a': 1.2, 'b': 0.8, 'c': 1.1, 'd': 1.0})
+    assert bench.compare_results(results, baseline, 0.15)==['a']
+    output = capsys.readouterr().out
+    assert 'REGRESSION' in output and 'faster' in output and 'new' in output
+    assert bench.compare_results(results, baseline, 0.25)==[]
+
+def test_benchmark_suite(tmp_path, taihydro):
+    suite = bench.BenchmarkSuite(str(tmp_path), taihydro, 1, True)
+    results = suite.run(bench.BENCHMARK_GROUPS)
+    names = results['benchmarks'].keys()
+    for group in bench.BENCHMARK_GROUPS:
+        assert any(name.startswith(group + '/') for name in names)
+    # the quick suite runs the short platform and default models only
+    assert 'hydro/short' in names and 'hydro/long' not in names
+    assert [name for name in names if name.startswith('coupler/')]== \
+        ['coupler/short/F07MOD-DA07MOD']
+    for result in results['benchmarks'].values():
+        assert result['repeat']==1 and result['rate']>0
+    assert results['benchmarks']['hydro/short']['steps']>0
+
+def test_benchmark_cli(tmp_path):
+    output = str(tmp_path / 'results.json')
+    command = [sys.executable, BENCH_SCRIPT, '-o', output, '-g', 
+               'startup,io', '-r', '1', '-q']
+    result = subprocess.run(command, capture_output=True, text=True)
+    assert result.returncode==0, result.stdout + result.stderr
+    with open(output, 'r') as f:
+        results = json.load(f)
+    assert 'startup/read_site_database' in results['benchmarks']
+    # a much faster baseline is reported as a regression
+    for item in results['benchmarks'].values():
+        item['median'] = 1e-3*item['median']
+    baseline = str(tmp_path / 'baseline.json')
+    with open(baseline, 'w') as f:
+        json.dump(results, f)
+    result = subprocess.run(command + ['-b', baseline], capture_output=True,
+                            text=True)
+    assert result.returncode==1
+    assert 'performance regressions' in result.stdout
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the case configuration and its batch editing
+"""
+
+import os
+import sys
+import copy
+import shutil
+import subprocess
+import numpy as np
+import pytest
+import maces_config as mcfg
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'src')
+CONFIG_SCRIPT = os.path.join(SRC_DIR, 'maces_config.py')
+
+def make_case(case_dir):
+    # a case of the namelist and parameter files of the source directory
+    case_dir = str(case_dir)
+    os.makedirs(case_dir, exist_ok=True)
+    for filename in [mcfg.NAMELIST_FILE] + \
+            list(mcfg.COMPONENT_FILES.values()):
+        shutil.copy(os.path.join(SRC_DIR, filename), case_dir)
+    mcfg.edit_case(case_dir, {'NAMELIST:RUNROOT': os.path.abspath(case_dir)})
+    return os.path.join(case_dir, mcfg.NAMELIST_FILE)
+
+def get_entry_value(case_dir, key):
+    trees = mcfg.load_case(str(case_dir))
+    __, entry = mcfg.find_entry(trees, key)
+    values = [item.text for item in entry.findall('values/value')]
+    return values if len(values)>0 else entry.get('value')
+
+def test_parse_edit_key():
+    assert mcfg.parse_edit_key('NAMELIST:RUN_STOPDATE')== \
+        ('NAMELIST', None, 'RUN_STOPDATE', None)
+    assert mcfg.parse_edit_key(' omac:DA07MOD:Bmax[2] ')== \
+        ('OMAC', 'DA07MOD', 'Bmax', '2')
+    with pytest.raises(AssertionError):
+        mcfg.parse_edit_key('SOIL:d50')
+    with pytest.raises(AssertionError):
+        mcfg.parse_edit_key('NAMELIST')
+
+def test_edit_case(tmp_path):
+    namelist_file = make_case(tmp_path)
+    mcfg.edit_case(str(tmp_path), {'MINAC:E0': 5e-6, 'OMAC:phi[2]': 1.5,
+        'OMAC:M12MOD:phi': 0.5, 'NAMELIST:HYDRO_TOL[h]': '1e-4',
+        'NAMELIST:Verbose': 'true'})
+    assert get_entry_value(tmp_path, 'MINAC:E0')=='5e-06'
+    assert get_entry_value(tmp_path, 'NAMELIST:HYDRO_TOL')== \
+        ['1e-4', '1e-4', '1e-5']
+    assert set(get_entry_value(tmp_path, 'OMAC:M12MOD:phi'))=={'0.5'}
+    config = mcfg.MacesConfig.from_xml(namelist_file)
+    namelist = config.get_namelist()
+    assert namelist['Verbose'] is True
+    assert namelist['HYDRO_TOL'].dtype==np.float64
+    params = config.get_params('OMAC')
+    assert params['phi'][2]==1.5 and params['phi'][3]==2.2
+    assert config.get_params('MINAC')['E0']==5e-6
+
+def test_edit_range(tmp_path):
+    make_case(tmp_path)
+    # valid values a...b are an inclusive range
+    mcfg.edit_case(str(tmp_path), {'OMAC:KM12MOD:jdps': 200})
+    assert get_entry_value(tmp_path, 'OMAC:KM12MOD:jdps')=='200'
+    mcfg.edit_case(str(tmp_path), {'OMAC:KM12MOD:jdps': ' 365'})
+    assert get_entry_value(tmp_path, 'OMAC:KM12MOD:jdps')=='365'
+    for value in [0, 366, '1...365']:
+        with pytest.raises(AssertionError, match='1...365'):
+            mcfg.edit_case(str(tmp_path), {'OMAC:KM12MOD:jdps': value})
+    assert get_entry_value(tmp_path, 'OMAC:KM12MOD:jdps')=='365'
+
+def test_edit_case_errors(tmp_path):
+    make_case(tmp_path)
+    # invalid edits are reported together and nothing is written
+    with pytest.raises(AssertionError) as excinfo:
+        mcfg.edit_case(str(tmp_path), {'MINAC:E0': 'fast',
+            'NAMELIST:Verbose': 'yes', 'OMAC:phi[12]': 1.0,
+            'MINAC:nonexist': 1.0, 'NAMELIST:MINAC_TYPE': 'XX07MOD'})
+    message = str(excinfo.value)
+    for key in ['MINAC:E0', 'NAMELIST:Verbose', 'OMAC:phi[12]',
+                'MINAC:nonexist', 'NAMELIST:MINAC_TYPE']:
+        assert key + ':' in message
+    assert get_entry_value(tmp_path, 'MINAC:E0')=='6.12e-6'
+    with pytest.raises(AssertionError):
+        mcfg.edit_case(str(tmp_path), {'NAMELIST:HYDRO_TOL': [1e-4, 1e-5]})
+
+def test_read_edits(tmp_path):
+    yaml_file = tmp_path / 'edits.yaml'
+    yaml_file.write_text("cases:\n  - MINAC:E0: 5e-6\n"
+                         "  - MINAC:E0: 7e-6\n    OMAC:phi[2]: 1.0\n")
+    edit_sets = mcfg.read_edits(str(yaml_file))
+    assert len(edit_sets)==2 and edit_sets[1]['OMAC:phi[2]']==1.0
+    yaml_file.write_text("MINAC:E0: 5e-6\n")
+    assert mcfg.read_edits(str(yaml_file))==[{'MINAC:E0': '5e-6'}]
+    csv_file = tmp_path / 'sweep.csv'
+    csv_file.write_text("MINAC:E0, OMAC:phi[2]\n5e-6,1.0\n7e-6,2.0\n")
+    assert mcfg.read_edits(str(csv_file))== \
+        [{'MINAC:E0': '5e-6', 'OMAC:phi[2]': '1.0'},
+         {'MINAC:E0': '7e-6', 'OMAC:phi[2]': '2.0'}]
+
+def test_create_sweep(tmp_path):
+    template_dir = tmp_path / 'template'
+    make_case(template_dir)
+    # the sweep is generated inside the template directory
+    sweep_root = template_dir / 'sweep'
+    case_dirs = mcfg.create_sweep(str(template_dir), str(sweep_root),
+        [{'MINAC:E0': 5e-6}, {'MINAC:E0': 7e-6, 'NAMELIST:RUNROOT': '/tmp'}])
+    assert [os.path.basename(case_dir) for case_dir in case_dirs]== \
+        ['case0000', 'case0001']
+    assert not os.path.exists(os.path.join(case_dirs[0], 'sweep'))
+    assert get_entry_value(case_dirs[0], 'MINAC:E0')=='5e-06'
+    assert get_entry_value(case_dirs[0], 'NAMELIST:RUNROOT')== \
+        os.path.abspath(case_dirs[0])
+    assert get_entry_value(case_dirs[1], 'NAMELIST:RUNROOT')=='/tmp'
+    assert get_entry_value(template_dir, 'MINAC:E0')=='6.12e-6'
+    # no case is generated if any edit set is invalid
+    with pytest.raises(AssertionError):
+        mcfg.create_sweep(str(template_dir), str(tmp_path / 'bad'),
+            [{'MINAC:E0': 5e-6}, {'MINAC:E0': 'fast'}])
+    assert not os.path.exists(str(tmp_path / 'bad'))
+
+def test_config_cli(tmp_path):
+    case_dir = tmp_path / 'case'
+    make_case(case_dir)
+    edit_file = tmp_path / 'edits.csv'
+    edit_file.write_text("MINAC:E0\n5e-6\n")
+    result = subprocess.run([sys.executable, CONFIG_SCRIPT, '-c',
+        str(case_dir), '-e', str(edit_file)], capture_output=True, text=True)
+    assert result.returncode==0, result.stdout + result.stderr
+    assert get_entry_value(case_dir, 'MINAC:E0')=='5e-6'
+    # multiple edit sets make a sweep
+    edit_file.write_text("MINAC:E0\n5e-6\n7e-6\n")
+    result = subprocess.run([sys.executable, CONFIG_SCRIPT, '-c',
+        str(case_dir), '-e', str(edit_file)], capture_output=True, text=True)
+    assert result.returncode==1 and 'sweep output' in result.stdout
+    result = subprocess.run([sys.executable, CONFIG_SCRIPT, '-c',
+        str(case_dir), '-e', str(edit_file), '-o', str(tmp_path / 'sweep')],
+        capture_output=True, text=True)
+    assert result.returncode==0, result.stdout + result.stderr
+    assert get_entry_value(tmp_path / 'sweep' / 'case0001', 'MINAC:E0')== \
+        '7e-6'
+
+def test_config_readonly(tmp_path):
+    namelist_file = make_case(tmp_path)
+    config = mcfg.load_config(namelist_file)
+    assert mcfg.load_config(namelist_file) is config
+    namelist = config.get_namelist()
+    with pytest.raises(TypeError):
+        namelist['FIRST_ID'] = 2
+    with pytest.raises(ValueError):
+        namelist['HYDRO_TOL'][0] = 1.0
+    values = copy.deepcopy(namelist)
+    values['FIRST_ID'] = 2
+    values['HYDRO_TOL'][0] = 1.0
+    # parameters are mutable copies
+    params = config.get_params('OMAC')
+    params['phi'][2] = 0.0
+    assert config.get_params('OMAC')['phi'][2]==2.2
+    restored = mcfg.MacesConfig.loads(config.dumps())
+    assert restored.get_namelist()['FIRST_ID']==namelist['FIRST_ID']
+    with pytest.raises(ValueError):
+        restored.get_namelist()['HYDRO_TOL'][0] = 1.0
+    # edited files are parsed again
+    mcfg.edit_case(str(tmp_path), {'MINAC:E0': 5e-6})
+    os.utime(os.path.join(str(tmp_path), 'optpar_minac.xml'), (0, 0))
+    assert not config.is_current()
+    config = mcfg.load_config(namelist_file)
+    assert config.get_params('MINAC')['E0']==5e-6
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the sub-step control of the simulation coupler
+"""
+
+import copy
+import numpy as np
+import pytest
+import synthetic_case as syn
+import TAIMODSuper
+import maces_config as mcfg
+import maces_coupler as cpl
+import maces_ensemble as ens
+import maces_utilities as utils
+import minac_mod
+import omac_mod
+import wavero_mod
+import lndmgr_mod
+
+NDAY = 1    # simulated days
+
+class RecordingHydro(object):
+    """Hydrodynamic core that records the sub-steps solved by the coupler.
+
+    Attributes:
+        m_taihydro : hydrodynamic core
+        m_cfl : Courant number of the run
+        m_traj : trajectory of all sub-steps of the run
+        m_runs : sub-step index, tried step, accepted step, next step and 
+                 CFL step of each solved sub-step
+        m_cflstep : CFL step of the coupler for the next sub-step
+        m_setups : sub-step index, tide level (msl), wind speed and 
+                   sediment concentration of each model setup
+    """
+
+    def __init__(self, taihydro, cfl, traj):
+        self.m_taihydro = taihydro
+        self.m_cfl = cfl
+        self.m_traj = traj
+        self.m_runs = []
+        self.m_cflstep = np.inf
+        self.m_setups = []
+
+    def getcflstep(self, cfl):
+        assert cfl==self.m_cfl
+        self.m_cflstep = self.m_taihydro.getcflstep(cfl)
+        return self.m_cflstep
+
+    def __getattr__(self, name):
+        return getattr(self.m_taihydro, name)
+
+    def modelsetup(self, sources, sinks, zh, pft, Bag, xref, Twav, h0, U10, 
+                   Cs0):
+        self.m_setups.append((len(self.m_traj.m_steps), h0 + zh[0], U10, 
+                              Cs0))
+        self.m_taihydro.modelsetup(sources, sinks, zh, pft, Bag, xref, Twav, 
+                                   h0, U10, Cs0)
+
+    def modelrun(self, mode, imex, tol, dyncheck, step):
+        curstep, nextstep, error = self.m_taihydro.modelrun(mode, imex, tol,
+            dyncheck, step)
+        self.m_runs.append((len(self.m_traj.m_steps), step, curstep, 
+                            nextstep, self.m_cflstep))
+        self.m_cflstep = np.inf
+        return curstep, nextstep, error
+
+@pytest.fixture(scope='module')
+def coupler_case(tmp_path_factory):
+    """Namelist and linked model parameters of the synthetic case."""
+    case_dir = str(tmp_path_factory.mktemp('coupler_case'))
+    config = mcfg.MacesConfig.from_xml(syn.make_case(case_dir, 1, NDAY))
+    params = config.get_params()
+    ens.link_model_params(params)
+    return config.get_namelist(), params
+
+def get_event_periods(namelist):
+    """Periods (s) of the forcing records and output times of the coupler."""
+    periods = [60.0*namelist[key] for key in ['U10_TSTEP', 'h_TSTEP', 
+        'Wave_TSTEP', 'SSC_TSTEP']] + [3600.0*namelist['Tair_TSTEP'], 3600.0]
+    if utils.get_shr_output_step(namelist['HYDRO_TSTEP'])>0:
+        periods.append(utils.get_shr_output_step(namelist['HYDRO_TSTEP']))
+    return periods
+
+def run_coupler(taihydro, coupler_case, tmp_path, edits, forcings=None, 
+                spinup=False):
+    """Run the coupler on the short synthetic platform.
+    Returns : coupler outputs, sub-step end times (s), sub-steps (current 
+              and next step) and RecordingHydro of the solved sub-steps
+    """
+    namelist = copy.deepcopy(coupler_case[0])
+    namelist.update(edits)
+    params = coupler_case[1]
+    hydro_params = params['HYDRO']
+    if forcings is None:
+        forcings = syn.get_site_forcings(NDAY)
+    plat = syn.get_site_platform('short')
+    nx = len(plat['x'])
+    traj = ens.HydroTrajectory(str(tmp_path / 'traj.bin'), nx)
+    hydro = RecordingHydro(taihydro, namelist['HYDRO_CFL'], traj)
+    models = {'taihydro': hydro, 
+              'mac_mod': minac_mod.F07MOD(params['MINAC']), 
+              'omac_mod': omac_mod.DA07MOD(params['OMAC']), 
+              'wavero_mod': wavero_mod.NULLMOD(params['WAVERO']), 
+              'lndmgr_mod': lndmgr_mod.NULLMOD(params['LNDMGR'])}
+    tai_state = {'pft': np.array(plat['pft'], order='F'), 
+                 'zh': np.array(plat['zh'], order='F'), 
+                 'Bag': np.zeros(nx, dtype=np.float64, order='F'), 
+                 'Bbg': np.zeros(nx, dtype=np.float64, order='F'), 
+                 'OM': np.zeros((nx,TAIMODSuper.npool), dtype=np.float64, 
+                                order='F')}
+    input_data = {'coord': {'x': plat['x'], 'dx': plat['dx'], 
+                            'fetch': plat['fetch']}, 
+                  'state': tai_state, 'forcings': forcings, 
+                  'namelist': namelist}
+    taihydro.inithydromod(plat['x'], plat['zh'], plat['fetch'], 
+        1e-3*syn.SITE_TEMPLATE['TSM'], len(namelist['HYDRO_TOL']), 
+        TAIMODSuper.npft)
+    taihydro.setmodelparams(hydro_params['d50'], hydro_params['Cz0'], 
+        hydro_params['Kdf'], hydro_params['cbc'], hydro_params['cwc'], 
+        hydro_params['fr'], hydro_params['alphaA'], hydro_params['betaA'], 
+        hydro_params['alphaD'], hydro_params['betaD'], hydro_params['cD0'], 
+        hydro_params['ScD'])
+    try:
+        outputs = cpl.run_tai_maces(input_data, models, spinup, 
+                                    hydro_traj=traj)
+    finally:
+        taihydro.finalizehydromod()
+        traj.close()
+    steps = np.array(traj.m_steps)
+    return outputs, np.cumsum(steps[:,0]), steps, hydro
+
+def test_carried_step(taihydro, coupler_case, tmp_path):
+    # each sub-step tries the step proposed by the controller before
+    __, times, steps, hydro = run_coupler(taihydro, coupler_case, tmp_path, 
+                                          {})
+    runs = hydro.m_runs
+    assert len(runs)==len(steps)
+    assert runs[0][1]==50.0
+    for ii in range(1, len(runs)):
+        assert runs[ii][1]==runs[ii-1][3]
+    # the run ends with the first sub-step beyond the stop time
+    assert times[-2]<=8.64e4*NDAY<times[-1]
+
+def test_cfl_cap(taihydro, coupler_case, tmp_path):
+    cfl = 0.5
+    __, __, steps, hydro = run_coupler(taihydro, coupler_case, tmp_path, 
+                                       {'HYDRO_CFL': cfl})
+    runs = hydro.m_runs
+    ncapped = 0
+    for ii, (__, trystep, curstep, nextstep, cflstep) in enumerate(runs):
+        assert trystep<=cflstep
+        # the controller step of the previous sub-step is capped
+        prevstep = 50.0 if ii==0 else runs[ii-1][3]
+        assert trystep==min(prevstep, cflstep)
+        ncapped += int(cflstep<prevstep)
+    assert ncapped>0
+    __, __, steps_free, __ = run_coupler(taihydro, coupler_case, tmp_path, 
+                                         {})
+    assert len(steps)>len(steps_free)
+
+def test_step_events(taihydro, coupler_case, tmp_path):
+    namelist = coupler_case[0]
+    forcings = syn.get_site_forcings(NDAY)
+    __, times, steps, hydro = run_coupler(taihydro, coupler_case, tmp_path, 
+                                          {'STEP_EVENTS': True}, forcings)
+    runs = hydro.m_runs
+    assert len(runs)==len(steps)
+    tf = 8.64e4*NDAY
+    assert np.isclose(times[-1], tf, rtol=0, atol=1e-6)
+    period = 60.0*namelist['h_TSTEP']
+    periods = get_event_periods(namelist)
+    # sub-steps end at forcing records unless a sub-step ends within the 
+    # minimum gap before them
+    tstarts = np.concatenate(([0.0], times[:-1]))
+    nhit = 0
+    for tevent in np.arange(period, tf, period):
+        ii = np.searchsorted(times, tevent - 1e-6)
+        if abs(times[ii] - tevent)<1e-6:
+            nhit += 1
+            # the next sub-step uses the forcing record of the event
+            indx = int(round(tevent/period))
+            istep, h0, U10, Cs0 = hydro.m_setups[ii+1]
+            assert istep==ii+1
+            assert np.isclose(h0, forcings['h0'][indx], rtol=0, atol=1e-12)
+            assert U10==forcings['U10'][indx] and Cs0==forcings['Cs0'][indx]
+        else:
+            assert tevent - times[ii-1]<1.0
+    assert nhit>0.9*len(np.arange(period, tf, period))
+    # truncated sub-steps resume the step before truncation
+    nrestore = 0
+    natstep = 50.0
+    for ii, (__, trystep, curstep, nextstep, __) in enumerate(runs):
+        t = tstarts[ii]
+        tevent = utils.get_next_event_time(t, periods)
+        assert np.isclose(trystep, min(natstep, tevent - t), rtol=1e-12, 
+                          atol=1e-6)
+        if curstep==trystep and trystep<natstep:
+            assert steps[ii][1]==max(nextstep, natstep)
+            nrestore += int(nextstep<natstep)
+        else:
+            assert steps[ii][1]==nextstep
+        natstep = steps[ii][1]
+    assert nrestore>0
+
+def test_zz_explore(taihydro, coupler_case, tmp_path):
+    forcings = syn.get_site_forcings(NDAY)
+    t = 900.0*np.arange(len(forcings['h0']))
+    for amp, mid in [(0.45, -4.3), (0.6, -4.2), (0.8, -4.0)]:
+        forcings['h0'] = mid + amp*np.sin(2*np.pi*t/44712.0)
+        for quiet in (False, True):
+            out, times, steps, hydro = run_coupler(taihydro, coupler_case, tmp_path, {'QUIET_SKIP': quiet}, forcings)
+            solved = set(r[0] for r in hydro.m_runs)
+            nq = len(steps) - len(solved)
+            print(amp, mid, quiet, len(steps), nq, out[2].keys() if isinstance(out[2], dict) else None)
+            print({k: np.asarray(v).shape for k, v in out[2].items()})
+            print(out[0]['zh'][:8] - syn.get_site_platform('short')['zh'][:8])
+
+def test_quiet_skip(taihydro, coupler_case, tmp_path):
+    namelist = coupler_case[0]
+    # a tide that ebbs below the seaward cell, so the platform runs dry
+    forcings = syn.get_site_forcings(NDAY)
+    period = 60.0*namelist['h_TSTEP']
+    zh0 = syn.get_site_platform('short')['zh'][0]
+    forcings['h0'] = zh0 + 0.3 + 0.6*np.sin(2*np.pi*period* \
+        np.arange(len(forcings['h0']))/44712.0)
+    # the full solve is the reference when it also ends steps at events
+    outputs, __, __, hydro = run_coupler(taihydro, coupler_case, tmp_path, 
+        {'STEP_EVENTS': True}, forcings)
+    outputs_quiet, times, steps, hydro_quiet = run_coupler(taihydro, 
+        coupler_case, tmp_path, {'STEP_EVENTS': True, 'QUIET_SKIP': True}, 
+        forcings)
+    solved = set(run[0] for run in hydro_quiet.m_runs)
+    assert len(steps) - len(solved)>10
+    assert len(hydro_quiet.m_runs)<len(hydro.m_runs)
+    dx = syn.get_site_platform('short')['dx']
+    dzh = outputs[0]['zh'] - syn.get_site_platform('short')['zh']
+    dzh_quiet = outputs_quiet[0]['zh'] - syn.get_site_platform('short')['zh']
+    assert np.isclose(np.dot(dx, dzh_quiet), np.dot(dx, dzh), rtol=5e-3)
+    for key in ['Esed', 'Dsed']:
+        assert np.isclose(np.dot(dx, outputs_quiet[2][key][0]), 
+                          np.dot(dx, outputs[2][key][0]), rtol=5e-3)
+    # dry sub-steps end at the next event or where the tide rises above 
+    # the seaward cell
+    periods = get_event_periods(namelist)
+    tstarts = np.concatenate(([0.0], times[:-1]))
+    for ii in range(len(steps)):
+        if ii in solved:
+            continue
+        t = tstarts[ii]
+        indx0 = utils.get_forcing_index(t, 'minute', namelist['h_TSTEP'])
+        indx1 = int(np.ceil(times[ii]/period - 1e-9))
+        assert np.all(forcings['h0'][indx0:indx1]<=zh0)
+        tevent = min(utils.get_next_event_time(t, periods), 
+                     t + cpl.MAX_OF_STEP)
+        if forcings['h0'][indx1]>zh0:
+            tevent = min(tevent, indx1*period)
+            # the platform is solved again once the tide rises
+            assert ii+1==len(steps) or ii+1 in solved
+        assert np.isclose(times[ii], tevent, rtol=0, atol=1e-6)
+
+def test_emulator(taihydro, coupler_case, tmp_path, monkeypatch):
+    # the tide range grows by 40% from the middle of the second day
+    nday = 4
+    tchange = 1.5*8.64e4
+    forcings = syn.get_site_forcings(nday)
+    t = 60.0*coupler_case[0]['h_TSTEP']*np.arange(len(forcings['h0']))
+    forcings['h0'] = np.where(t>=tchange, 1.4, 1.0) * forcings['h0']
+    edits = {'RUN_STOPDATE': '2004-01-05'}
+    dx = syn.get_site_platform('short')['dx']
+    outputs, __, __, hydro = run_coupler(taihydro, coupler_case, tmp_path, 
+                                         edits, forcings)
+    # daily mean deposition (kg/m/s) of the transect
+    Dsed = np.dot(outputs[2]['Dsed'], dx)
+    edits['MORFAC_DZ'] = 0.01
+    for ftol in [cpl.EMULATOR_FTOL, np.inf]:
+        monkeypatch.setattr(cpl, 'EMULATOR_FTOL', ftol)
+        outputs_emu, times, __, hydro_emu = run_coupler(taihydro, 
+            coupler_case, tmp_path, edits, forcings)
+        assert len(hydro_emu.m_runs)<0.6*len(hydro.m_runs)
+        tstarts = np.concatenate(([0.0], times))
+        tsolved = tstarts[[run[0] for run in hydro_emu.m_runs]]
+        nsolved = np.sum((tsolved>=tchange) & 
+                         (tsolved<tchange+cpl.TIDAL_DAY))
+        errors = np.abs(np.dot(outputs_emu[2]['Dsed'], dx)/Dsed - 1.0)
+        if np.isfinite(ftol):
+            # a new representative cycle is simulated at the tide change
+            assert nsolved>0
+            assert np.all(errors[2:]<0.035)
+        else:
+            # the cycle recorded before the change is emulated throughout
+            assert nsolved==0
+            assert np.all(errors[2:]>0.05)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the parameter ensemble mode
+"""
+
+import numpy as np
+import pytest
+import maces_ensemble as ens
+import minac_mod
+import omac_mod
+import wavero_mod
+import lndmgr_mod
+
+def get_base_params():
+    return {'HYDRO': {'Cz0': 65.0},
+            'MINAC': {'d50': 2.5e-5, 'alphaA': np.array([0.0, 8.0, 8.0])},
+            'OMAC': {'Bmax': np.array([0.0, 1.2, 2.0]), 'mps': 7,
+                     'order': np.array([1, 0, 2], dtype=np.int32)},
+            'WAVERO': {}, 'LNDMGR': {}}
+
+def test_parse_param_column():
+    assert ens.parse_param_column('minac:d50')==('MINAC', 'd50', -1)
+    assert ens.parse_param_column(' OMAC:Bmax[2] ')==('OMAC', 'Bmax', 2)
+    with pytest.raises(AssertionError):
+        ens.parse_param_column('SOIL:d50')
+    with pytest.raises(AssertionError):
+        ens.parse_param_column('MINAC-d50')
+
+def test_member_params_real():
+    base = get_base_params()
+    params = ens.get_member_params(base, ['MINAC:d50', 'OMAC:Bmax[1]',
+        'MINAC:alphaA'], [3e-5, 1.5, 4.0])
+    assert params['MINAC']['d50']==3e-5
+    assert params['HYDRO']['d50']==3e-5
+    assert np.array_equal(params['OMAC']['Bmax'], [0.0, 1.5, 2.0])
+    assert np.array_equal(params['HYDRO']['alphaA'], [4.0, 4.0, 4.0])
+    # the base parameters are not modified
+    assert base['OMAC']['Bmax'][1]==1.2
+
+def test_member_params_integer():
+    base = get_base_params()
+    params = ens.get_member_params(base, ['OMAC:mps', 'OMAC:order[0]'],
+                                   [8.0, 2.0])
+    assert params['OMAC']['mps']==8
+    assert isinstance(params['OMAC']['mps'], int)
+    assert np.array_equal(params['OMAC']['order'], [2, 0, 2])
+    assert params['OMAC']['order'].dtype==np.int32
+    for column in ['OMAC:mps', 'OMAC:order[1]', 'OMAC:order']:
+        with pytest.raises(AssertionError, match='non-integral'):
+            ens.get_member_params(base, [column], [1.6])
+
+def test_spinup_signature():
+    columns = ['MINAC:d50', 'LNDMGR:rate', 'OMAC:Bmax[1]']
+    sig1 = ens.get_spinup_signature(columns, [3e-5, 1.0, 1.5])
+    sig2 = ens.get_spinup_signature(columns, [3e-5, 2.0, 1.5])
+    sig3 = ens.get_spinup_signature(columns, [4e-5, 1.0, 1.5])
+    assert sig1==sig2
+    assert sig1!=sig3
+
+def get_models(params, lndmgr_class=lndmgr_mod.R20MOD):
+    return {'mac_mod': minac_mod.F06MOD(params['MINAC']), 
+            'omac_mod': omac_mod.DA07MOD(params['OMAC']), 
+            'wavero_mod': wavero_mod.NULLMOD(params['WAVERO']), 
+            'lndmgr_mod': lndmgr_class(params['LNDMGR'])}
+
+def test_hydro_feedback():
+    base = get_base_params()
+    base['LNDMGR'] = {'rate': 1.0}
+    ref = ens.get_member_params(base, [], [])
+    models = get_models(ref)
+    # biomass and deposition drive the hydrodynamics
+    assert models['mac_mod'].m_hydro_feedback
+    assert models['omac_mod'].m_hydro_feedback
+    assert not ens.has_hydro_feedback(models, ref, ref)
+    for columns, values, feedback in [(['MINAC:d50'], [3e-5], True), 
+            (['OMAC:Bmax[1]'], [1.5], True), (['LNDMGR:rate'], [2.0], False),
+            (['OMAC:mps'], [7.0], False)]:
+        params = ens.get_member_params(base, columns, values)
+        assert ens.has_hydro_feedback(get_models(params), params, ref)== \
+            feedback
+    # pft changes of landward migration drive the hydrodynamics
+    params = ens.get_member_params(base, ['LNDMGR:rate'], [2.0])
+    models = get_models(params, lndmgr_mod.NULLMOD)
+    assert ens.has_hydro_feedback(models, params, ref)
+
+def test_hydro_trajectory(tmp_path, monkeypatch):
+    # extend the trajectory file several times
+    monkeypatch.setattr(ens, 'TRAJECTORY_CHUNK', 3)
+    nx = 4
+    filename = str(tmp_path / 'traj.dat')
+    traj = ens.HydroTrajectory(filename, nx)
+    rng = np.random.default_rng(0)
+    initial = {key: rng.uniform(size=nx) for key in ens.TRAJECTORY_VARS}
+    initial['zh'] = np.zeros(nx)
+    traj.set_initial_state(initial)
+    states = []
+    for ii in range(8):
+        uhydro = {key: rng.uniform(size=nx) for key in ens.TRAJECTORY_VARS}
+        traj.record(10.0+ii, 11.0+ii, uhydro)
+        states.append(uhydro)
+    assert traj.m_capacity==9
+    traj.rewind()
+    assert sorted(traj.get_initial_state())==sorted(ens.TRAJECTORY_VARS)
+    with pytest.raises(AssertionError):
+        traj.record(1.0, 1.0, states[0])
+    # every replay starts from the first sub-step
+    for __ in range(2):
+        for ii in range(8):
+            assert not traj.is_replayed()
+            curstep, nextstep, uhydro = traj.replay()
+            assert (curstep, nextstep)==(10.0+ii, 11.0+ii)
+            for key in ens.TRAJECTORY_VARS:
+                assert uhydro[key].dtype==np.float64
+                assert np.allclose(uhydro[key], states[ii][key], rtol=1e-6)
+        assert traj.is_replayed()
+        with pytest.raises(AssertionError):
+            traj.replay()
+        traj.rewind()
+    traj.close()
+    assert not (tmp_path / 'traj.dat').exists()
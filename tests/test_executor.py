@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the executors of the site loop
+"""
+
+import os
+import numpy as np
+import pytest
+import maces_executor as mexe
+import maces_utilities as utils
+
+def assign_sites(rank, nworker, sites):
+    # round-robin site assignment of the MACES site loop
+    return {'rank': rank, 'nworker': nworker, 'pid': os.getpid(),
+            'sites': [site for ii, site in enumerate(sites)
+                      if ii % nworker==rank]}
+
+def test_get_executor(monkeypatch):
+    for key in mexe.MPI_LAUNCHER_VARS:
+        monkeypatch.delenv(key, raising=False)
+    assert not mexe.is_mpi_launched()
+    assert type(mexe.get_executor('auto'))==mexe.SerialExecutor
+    assert type(mexe.get_executor('serial'))==mexe.SerialExecutor
+    assert type(mexe.get_executor('pool', 2))==mexe.PoolExecutor
+    assert mexe.get_executor('pool', 0).m_nworker==os.cpu_count()
+    monkeypatch.setenv('PMI_SIZE', '2')
+    assert mexe.is_mpi_launched()
+    with pytest.raises(AssertionError):
+        mexe.get_executor('threads')
+
+def test_serial_executor():
+    executor = mexe.SerialExecutor()
+    assert executor.is_master()
+    assert executor.bcast({'a': 1})=={'a': 1}
+    assert executor.gather(3)==[3]
+    results = executor.run_workers(assign_sites, [1, 2, 3], ntask=3)
+    assert len(results)==1
+    assert results[0]['sites']==[1, 2, 3]
+
+def test_pool_executor():
+    sites = list(range(10))
+    results = mexe.PoolExecutor(3).run_workers(assign_sites, sites, 
+                                               ntask=len(sites))
+    assert [result['rank'] for result in results]==[0, 1, 2]
+    assert sorted(sum([result['sites'] for result in results], []))==sites
+    assert all(result['pid']!=os.getpid() for result in results)
+
+def test_pool_executor_capped_by_sites():
+    # workers beyond the number of sites are not started
+    sites = [466, 467]
+    results = mexe.PoolExecutor(8).run_workers(assign_sites, sites, 
+                                               ntask=len(sites))
+    assert len(results)==2
+    assert all(result['nworker']==2 for result in results)
+    assert sorted(sum([result['sites'] for result in results], []))==sites
+
+def test_mpi_shared_arrays(monkeypatch):
+    # a single-rank MPI smoke test of the shared memory forcings
+    MPI = pytest.importorskip('mpi4py.MPI')
+    arrays = {'h0': np.linspace(0.0, 1.0, 12).reshape((4,3)), 
+              'rslr': np.arange(5, dtype=np.int32)}
+    meta = utils.get_array_meta(arrays)
+    executor = mexe.MPIExecutor()
+    assert executor.is_master()
+    shared, windows = executor.bcast_arrays(arrays, meta, shared=True)
+    assert len(windows)==2
+    for key in arrays:
+        assert np.array_equal(shared[key], arrays[key])
+        assert shared[key].dtype==arrays[key].dtype
+        assert not shared[key].flags.writeable
+    executor.free_arrays(windows)
+    copied, windows = executor.bcast_arrays(arrays, meta)
+    assert windows==[] and np.array_equal(copied['h0'], arrays['h0'])
+    # windows are freed if the broadcast fails
+    freed = []
+    free = utils.free_shared_windows
+    def free_counted(windows):
+        freed.extend(windows)
+        free(windows)
+    monkeypatch.setattr(utils, 'free_shared_windows', free_counted)
+    with pytest.raises(KeyError):
+        utils.bcast_arrays_shared(MPI.COMM_WORLD, {'h0': arrays['h0']}, 
+                                  meta)
+    assert len(freed)==2
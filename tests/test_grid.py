@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the adaptive platform grid and the remapping between grids
+"""
+
+import numpy as np
+import synthetic_case as syn
+import maces_utilities as utils
+
+def get_random_grid(rng, nx, length=500.0):
+    x = np.sort(rng.uniform(0.0, length, nx-2))
+    return np.concatenate(([0.0], x, [length]))
+
+def get_integral(x, values):
+    return np.dot(np.diff(utils.get_cell_edges(x)), values)
+
+def test_remap_conservative():
+    rng = np.random.default_rng(0)
+    x = get_random_grid(rng, 40)
+    values = rng.uniform(0.0, 2.0, (40,3))
+    # coarsening, refining and identity remapping
+    for x_new in [get_random_grid(rng, 15), get_random_grid(rng, 90), x]:
+        values_new = utils.remap_conservative(x, values, x_new)
+        assert values_new.shape==(len(x_new),3)
+        assert np.allclose(get_integral(x_new, values_new),
+                           get_integral(x, values), rtol=1e-12)
+        assert np.allclose(utils.remap_conservative(x, values[:,1], x_new),
+                           values_new[:,1], rtol=0, atol=0)
+        # constant fields are preserved
+        assert np.allclose(utils.remap_conservative(x, np.ones(40), x_new),
+                           1.0, rtol=1e-12)
+    assert np.allclose(utils.remap_conservative(x, values, x), values,
+                       rtol=1e-12)
+
+def test_remap_platform_state():
+    rng = np.random.default_rng(1)
+    x = get_random_grid(rng, 30)
+    x_new = get_random_grid(rng, 50)
+    operator = utils.get_remap_operator(x, x_new)
+    state = {'zh': np.linspace(-1.0, 2.0, 30),
+             'pft': np.repeat(np.array([0, 2, 5], dtype=np.int32), 10),
+             'OM': rng.uniform(0.0, 1.0, (30,2))}
+    state_new = utils.remap_platform_state(x, x_new, state, operator)
+    assert state_new['pft'].dtype==np.int32
+    assert set(state_new['pft'])<=set(state['pft'])
+    # the pft of a new node is that of the old cell containing it
+    edges = utils.get_cell_edges(x)
+    for ii in range(len(x_new)):
+        cell = min(np.searchsorted(edges, x_new[ii], side='right')-1, 29)
+        assert state_new['pft'][ii]==state['pft'][cell]
+    for key in ['zh', 'OM']:
+        assert np.allclose(get_integral(x_new, state_new[key]),
+                           get_integral(x, state[key]), rtol=1e-12)
+        assert np.array_equal(state_new[key],
+            utils.remap_platform_state(x, x_new, {key: state[key]})[key])
+
+def test_adaptive_grid():
+    plat = syn.get_site_platform('long')
+    x = plat['x']
+    zh = plat['zh']
+    trng = syn.SITE_TEMPLATE['mtidalrng']
+    x_new = utils.generate_adaptive_grid(x, zh, trng, 50.0, 500.0,
+                                         breaks=[x[0], x[-1]])
+    assert x_new[0]==x[0] and x_new[-1]==x[-1]
+    dx = np.diff(x_new)
+    # cells are stretched slightly to end at the breaks
+    assert np.all(dx>0) and np.max(dx)<=500.0*1.01
+    assert np.max(dx[1:]/dx[:-1])<=1.0 + 2*utils.GRID_GROWTH
+    # the refined zone is resolved at the reference cell length
+    for x0, x1 in utils.get_refined_zone(x, zh, trng):
+        inside = (x_new[:-1]>=x0) & (x_new[1:]<=x1)
+        assert np.sum(inside)>0
+        assert np.allclose(dx[inside], 50.0, rtol=0.01)
+    x_max = utils.generate_adaptive_grid(x, zh, trng, 50.0, 500.0,
+                                         breaks=[x[0], x[-1]], nmax=40)
+    assert len(x_max)==41
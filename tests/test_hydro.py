@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests of the hydrodynamic core on the synthetic platform
+"""
+
+import numpy as np
+import pytest
+import synthetic_case as syn
+import maces_config as mcfg
+import maces_coupler as cpl
+import maces_ensemble as ens
+import maces_utilities as utils
+
+NHOUR = 6   # simulated hours of the tidal flooding
+
+@pytest.fixture(scope='module')
+def hydro_case(tmp_path_factory):
+    """Namelist and linked model parameters of the synthetic case."""
+    case_dir = str(tmp_path_factory.mktemp('hydro_case'))
+    config = mcfg.MacesConfig.from_xml(syn.make_case(case_dir, 1, 1))
+    params = config.get_params()
+    ens.link_model_params(params)
+    return config.get_namelist(), params
+
+def init_hydro(taihydro, namelist, params, plat):
+    hydro_params = params['HYDRO']
+    taihydro.inithydromod(plat['x'], plat['zh'], plat['fetch'],
+        1e-3*syn.SITE_TEMPLATE['TSM'], len(namelist['HYDRO_TOL']),
+        len(hydro_params['cD0']))
+    taihydro.setmodelparams(hydro_params['d50'], hydro_params['Cz0'],
+        hydro_params['Kdf'], hydro_params['cbc'], hydro_params['cwc'],
+        hydro_params['fr'], hydro_params['alphaA'], hydro_params['betaA'],
+        hydro_params['alphaD'], hydro_params['betaD'], hydro_params['cD0'],
+        hydro_params['ScD'])
+
+def run_hydro(taihydro, namelist, params, plat, imex, nhour=NHOUR,
+              finalize=True):
+    """Run the hydrodynamic core over the rising tide of the first hours.
+    Returns : sub-step end times (s) and water depth, velocity and
+              sediment concentration at the end of each hour
+    """
+    init_hydro(taihydro, namelist, params, plat)
+    nx = len(plat['x'])
+    zeros = np.zeros(nx, dtype=np.float64, order='F')
+    xref = utils.get_refshore_coordinate(plat['x'], plat['zh'])
+    forcings = syn.get_site_forcings(1)
+    times = []
+    hourly = []
+    t = 0.0
+    curstep = 50.0
+    while t < 3600.0*nhour:
+        indx = utils.get_forcing_index(t, 'minute', namelist['h_TSTEP'])
+        taihydro.modelsetup(zeros, zeros, plat['zh'], plat['pft'], zeros,
+            xref, forcings['Twav'][indx], forcings['h0'][indx] -
+            plat['zh'][0], forcings['U10'][indx], forcings['Cs0'][indx])
+        # sub-steps end at the hours
+        tb = 3600.0*(np.floor(t/3600.0) + 1.0)
+        curstep, nextstep, error = taihydro.modelrun(cpl.rk4_mode, imex,
+            namelist['HYDRO_TOL'], namelist['DYN_CHECK'],
+            min(curstep, tb-t))
+        assert error==0
+        taihydro.modelcallback(namelist['WAVE_TYPE'])
+        t = t + curstep
+        curstep = max(nextstep, 0.1)
+        times.append(t)
+        if np.isclose(t, tb):
+            t = tb
+            hourly.append(np.array([taihydro.sim_h, taihydro.sim_u,
+                                    taihydro.sim_css]))
+    if finalize:
+        taihydro.finalizehydromod()
+    return np.array(times), np.array(hourly)
+
+def test_active_window(taihydro, taihydro_full, hydro_case):
+    namelist, params = hydro_case
+    plat = syn.get_site_platform('long')
+    for imex in (False, True):
+        times, hourly = run_hydro(taihydro, namelist, params, plat, imex)
+        # the landward cells stay dry
+        assert np.all(hourly[:,0,-20:]==0.0)
+        assert np.any(hourly[:,0,:]>0.0)
+        times_full, hourly_full = run_hydro(taihydro_full, namelist,
+                                            params, plat, imex)
+        assert np.array_equal(times, times_full)
+        assert np.array_equal(hourly, hourly_full)
+
+def test_regrid_hydro(taihydro, hydro_case):
+    namelist, params = hydro_case
+    plat = syn.get_site_platform('long')
+    x = plat['x']
+    nx = len(x)
+    nvar = len(namelist['HYDRO_TOL'])
+    run_hydro(taihydro, namelist, params, plat, False, finalize=False)
+    hydro_state = cpl.get_hydro_state(taihydro, nx, nvar)
+    # regridding to the same grid keeps the state
+    taihydro.regridhydromod(x, plat['zh'], plat['fetch'],
+        hydro_state['uhydro'], hydro_state['states'])
+    same_state = cpl.get_hydro_state(taihydro, nx, nvar)
+    assert np.array_equal(same_state['uhydro'], hydro_state['uhydro'])
+    assert np.array_equal(same_state['states'], hydro_state['states'])
+    # water volume, momentum and sediment mass are conserved on a new grid
+    x_new = utils.generate_adaptive_grid(x, plat['zh'],
+        syn.SITE_TEMPLATE['mtidalrng'], 20.0, 200.0, breaks=[x[0], x[-1]])
+    nx_new = len(x_new)
+    uhydro_new = utils.remap_conservative(x, hydro_state['uhydro'], x_new)
+    states_new = utils.remap_categorical(x, hydro_state['states'], x_new)
+    zh_new = utils.remap_conservative(x, plat['zh'], x_new)
+    fetch_new = np.array(np.interp(x_new, x, plat['fetch']), order='F')
+    taihydro.regridhydromod(x_new, zh_new, fetch_new, uhydro_new,
+                            states_new)
+    new_state = cpl.get_hydro_state(taihydro, nx_new, nvar)
+    dx = np.diff(utils.get_cell_edges(x))
+    dx_new = np.diff(utils.get_cell_edges(x_new))
+    assert np.allclose(np.dot(dx_new, new_state['uhydro']),
+                       np.dot(dx, hydro_state['uhydro']), rtol=1e-10)
+    taihydro.finalizehydromod()
+
+def test_imex_scheme(taihydro, hydro_case):
+    namelist, params = hydro_case
+    plat = syn.get_site_platform('long')
+    times, hourly = run_hydro(taihydro, namelist, params, plat, False)
+    times_imex, hourly_imex = run_hydro(taihydro, namelist, params, plat,
+                                        True)
+    assert abs(len(times_imex) - len(times)) < 0.1*len(times)
+    # depth (m), velocity (m/s) and sediment concentration (kg/m3)
+    errors = np.max(np.abs(hourly_imex - hourly), axis=(0,2))
+    assert np.all(errors < [0.01, 0.02, 2e-3])
+    # water volume and suspended sediment mass of the transect
+    dx = np.diff(utils.get_cell_edges(plat['x']))
+    for values, values_imex, rtol in [(hourly[:,0], hourly_imex[:,0], 1e-4),
+            (hourly[:,0]*hourly[:,2], hourly_imex[:,0]*hourly_imex[:,2],
+             1e-3)]:
+        assert np.allclose(np.dot(values_imex, dx), np.dot(values, dx),
+                           rtol=rtol)
+
+def test_end_cell_length(taihydro, hydro_case):
+    # the end cells extend half the node spacing into the transect, so the
+    # cell lengths do not depend on where the transect starts
+    namelist, params = hydro_case
+    plat = syn.get_site_platform('short')
+    nx = len(plat['x'])
+    nvar = len(namelist['HYDRO_TOL'])
+    dx = np.diff(utils.get_cell_edges(plat['x']))
+    for shift in [0.0, 5e3]:
+        shifted = dict(plat)
+        shifted['x'] = np.array(plat['x'] + shift, order='F')
+        init_hydro(taihydro, namelist, params, shifted)
+        hydro_state = cpl.get_hydro_state(taihydro, nx, nvar)
+        steps = []
+        for cell in [0, 1, nx-2, nx-1]:
+            # the CFL step of a single wet cell at rest is dx/sqrt(g*h)
+            hydro_state['uhydro'][:] = 0.0
+            hydro_state['uhydro'][cell,0] = 1.0
+            cpl.set_hydro_state(taihydro, hydro_state)
+            steps.append(taihydro.getcflstep(1.0))
+        assert np.allclose(np.array(steps)/steps[1], dx[[0,1,-2,-1]]/dx[1],
+                           rtol=1e-9)
+        taihydro.finalizehydromod()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the wetland landward migration models
+"""
+
+import numpy as np
+import maces_archive as archive
+import lndmgr_mod
+
+PARAMS = {'finund_min': 0.05, 'maxdur_max': 168.0}
+
+def get_inputs(depths):
+    # inundation regime of hourly water depths
+    inund = archive.InundationAccumulator(np.shape(depths)[1])
+    for h in depths:
+        inund.update(3.6e3, h)
+    inputs = {'pft': np.array([0, 2, 2, 2, 1, 1, 1], dtype=np.int32)}
+    inputs.update(inund.get_inundation())
+    return inputs
+
+def test_s18_migration():
+    # two days of semidiurnal tides and a first cell flooded permanently
+    hours = np.arange(48)
+    tide = np.sin(2*np.pi*hours/12.42)
+    zh = np.array([-1.0, -0.2, 0.2, 0.5, 0.8, 0.95, 2.0])
+    depths = np.maximum(tide[:,None] - zh[None,:], 0.0)
+    inputs = get_inputs(depths)
+    pft = lndmgr_mod.S18MOD(PARAMS).landward_migration(inputs)
+    # regularly flooded upland is colonized, the dry upland is not
+    assert np.array_equal(pft, [0, 2, 2, 2, 2, 2, 1])
+    # wetlands flooded longer than the tolerance drown
+    depths[:,1] = 0.5
+    inputs = get_inputs(depths)
+    pft = lndmgr_mod.S18MOD({'finund_min': 0.05, 'maxdur_max': 24.0}) \
+        .landward_migration(inputs)
+    assert np.array_equal(pft, [0, 1, 2, 2, 2, 2, 1])
+
+def test_s18_no_inundation():
+    inputs = get_inputs(np.zeros((0,7)))
+    pft = lndmgr_mod.S18MOD(PARAMS).landward_migration(inputs)
+    assert np.array_equal(pft, [0, 2, 2, 2, 1, 1, 1])
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the forcing reader of the main program
+"""
+
+import numpy as np
+import synthetic_case as syn
+import maces_config as mcfg
+import maces_utilities as utils
+
+def read_case_forcings(case_dir, nsite, edits=None):
+    namelist_file = syn.make_case(str(case_dir), nsite=nsite, nday=1)
+    if edits is not None:
+        mcfg.edit_case(str(case_dir), edits)
+    namelist = mcfg.MacesConfig.from_xml(namelist_file).get_namelist()
+    site_db = utils.read_site_database(namelist['SITE_FILE'],
+        namelist['FIRST_ID'], namelist['LAST_ID'])
+    import MACES_main
+    return site_db, MACES_main.read_forcings(namelist, site_db)
+
+def test_read_forcings_more_sites_than_columns(taihydro, tmp_path):
+    # more sites than columns of the site database
+    nsite = 60
+    site_db, forcings = read_case_forcings(tmp_path, nsite)
+    assert len(site_db) < nsite
+    for key, data in forcings.items():
+        assert np.shape(data)[1]==nsite, key
+
+def test_read_forcings_site_range(taihydro, tmp_path):
+    site_db, forcings = read_case_forcings(tmp_path, 8,
+        {'NAMELIST:FIRST_ID': 3, 'NAMELIST:LAST_ID': 5})
+    assert len(site_db['DIVA_ID'])==3
+    for key, data in forcings.items():
+        assert np.shape(data)[1]==3, key
+
+def test_read_forcings_constant_ssc(taihydro, tmp_path):
+    site_db, forcings = read_case_forcings(tmp_path, 4,
+        {'NAMELIST:FILE_SSC': ''})
+    assert np.shape(forcings['SSC'])[1]==4
+    assert np.allclose(forcings['SSC'], 1e-3*np.array(site_db['TSM']))
+
+def test_read_forcings_morfac(taihydro, tmp_path):
+    # a day evolves 400 days of sea level rise, i.e. two SLR years
+    site_db, forcings = read_case_forcings(tmp_path, 2,
+        {'NAMELIST:MORFAC': 400.0})
+    assert np.shape(forcings['SLR'])[0]==2
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the aggregated multi-site outputs
+"""
+
+import numpy as np
+import maces_utilities as utils
+
+NT = 3
+NPOOL = 2
+
+def make_ecogeom_outputs(nx, seed):
+    rng = np.random.default_rng(seed)
+    outputs = {'x': np.arange(nx, dtype=np.float32)}
+    for key, __, __, dtype, __, dims in utils.ECOGEOM_OUTPUT_VARS:
+        shape = (NT, nx, NPOOL) if 'pool' in dims else (NT, nx)
+        if dtype=='i1':
+            outputs[key] = rng.integers(0, 8, shape).astype(np.int8)
+        else:
+            outputs[key] = rng.random(shape).astype(np.float32)
+    return outputs
+
+def check_site_outputs(filename, site_id, outputs):
+    site_out = utils.read_site_outputs(filename, site_id)
+    assert np.array_equal(site_out['x'], outputs['x'])
+    for key, __, __, __, __, __ in utils.ECOGEOM_OUTPUT_VARS:
+        assert site_out[key].shape==outputs[key].shape, key
+        assert np.array_equal(site_out[key], outputs[key]), key
+
+def test_read_site_outputs_roundtrip(tmp_path):
+    filename = str(tmp_path / 'ecogeom.nc')
+    sites = {466: make_ecogeom_outputs(7, 0), 467: make_ecogeom_outputs(4, 1)}
+    for site_id, outputs in sites.items():
+        utils.append_site_outputs(filename, 'day', 'ecogeom', site_id, 
+                                  outputs)
+    for site_id, outputs in sites.items():
+        check_site_outputs(filename, site_id, outputs)
+    site_out = utils.read_site_outputs(filename, 467, ['OM'])
+    assert site_out['OM'].shape==(NT, 4, NPOOL)
+
+def test_merge_output_shards(tmp_path):
+    shards = [str(tmp_path / 'shard0.nc'), str(tmp_path / 'shard1.nc'),
+              str(tmp_path / 'missing.nc')]
+    sites = {466: make_ecogeom_outputs(5, 0), 467: make_ecogeom_outputs(9, 1),
+             468: make_ecogeom_outputs(3, 2)}
+    utils.append_site_outputs(shards[0], 'day', 'ecogeom', 466, sites[466])
+    utils.append_site_outputs(shards[0], 'day', 'ecogeom', 468, sites[468])
+    utils.append_site_outputs(shards[1], 'day', 'ecogeom', 467, sites[467])
+    # a site simulated by two processes is merged once
+    utils.append_site_outputs(shards[1], 'day', 'ecogeom', 466, sites[466])
+    filename = str(tmp_path / 'merged.nc')
+    utils.merge_output_shards(shards, filename)
+    assert not (tmp_path / 'shard0.nc').exists()
+    assert not (tmp_path / 'shard1.nc').exists()
+    from netCDF4 import Dataset
+    with Dataset(filename, 'r') as nc:
+        assert sorted(np.array(nc.variables['site'][:]))==[466, 467, 468]
+        assert len(nc.dimensions['x'])==9
+    for site_id, outputs in sites.items():
+        check_site_outputs(filename, site_id, outputs)
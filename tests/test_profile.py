@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the per-site profiling
+"""
+
+import json
+import pytest
+import maces_profile as mprof
+
+class FakeUsage(object):
+    def __init__(self, maxrss):
+        self.ru_maxrss = maxrss
+
+class FakeResource(object):
+    RUSAGE_SELF = 0
+    def __init__(self, maxrss):
+        self.m_maxrss = maxrss
+    def getrusage(self, who):
+        return FakeUsage(self.m_maxrss)
+
+@pytest.mark.parametrize('platform, maxrss', [('darwin', 512*1048576), 
+    ('darwin', 4096*1048576), ('linux', 512*1024), ('linux', 4096*1024)])
+def test_memory_highwater_units(monkeypatch, platform, maxrss):
+    monkeypatch.setattr(mprof.sys, 'platform', platform)
+    monkeypatch.setattr(mprof, 'resource', FakeResource(maxrss))
+    expected = 512.0 if maxrss in (512*1048576, 512*1024) else 4096.0
+    assert mprof.get_memory_highwater()==expected
+
+def test_memory_highwater_unknown(monkeypatch):
+    monkeypatch.setattr(mprof, 'resource', None)
+    assert mprof.get_memory_highwater()==-1.0
+
+def test_site_profiler(tmp_path):
+    profiler = mprof.SiteProfiler(466)
+    profiler.set_stage('spinup')
+    profiler.lap('hydro_run')
+    profiler.count('steps')
+    profiler.count('steps', 2)
+    profiler.set_stage('run')
+    profiler.lap('hydro_run')
+    profiler.count('steps')
+    summary = profiler.get_summary()
+    assert summary['site']==466
+    assert summary['counters']=={'spinup/steps': 3, 'run/steps': 1}
+    assert sorted(summary['phases'])==['run/hydro_run', 'spinup/hydro_run']
+    other = mprof.SiteProfiler(467).get_summary()
+    merged = mprof.merge_profiles([summary, other])
+    assert merged['nsite']==2
+    assert merged['counters']['spinup/steps']==3
+    filename = str(tmp_path / 'profile.json')
+    mprof.write_profile(filename, merged)
+    with open(filename) as f:
+        assert json.load(f)['nsite']==2
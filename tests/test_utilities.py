@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the site database and platform utilities
+"""
+
+import os
+import sys
+import subprocess
+import multiprocessing
+import numpy as np
+import pytest
+import synthetic_case as syn
+import maces_utilities as utils
+from netCDF4 import Dataset
+from datetime import date
+
+def write_site_database(filename, nsite, seed=0):
+    syn.make_site_database(nsite, seed).to_excel(filename, 
+        sheet_name=utils.SITE_SHEET, index=False)
+
+def set_cache_attrs(cachefile, **attrs):
+    nc = Dataset(cachefile, 'a')
+    try:
+        for key, value in attrs.items():
+            nc.setncattr(key, value)
+    finally:
+        nc.close()
+
+@pytest.fixture
+def site_file(tmp_path):
+    filename = str(tmp_path / 'DIVA_maces.xlsx')
+    write_site_database(filename, 5)
+    return filename
+
+@pytest.fixture
+def conversions(monkeypatch):
+    # count the conversions of the excel file, i.e. cache misses
+    counts = []
+    convert = utils.convert_site_database
+    def convert_counted(filename, cachefile):
+        counts.append(cachefile)
+        convert(filename, cachefile)
+    monkeypatch.setattr(utils, 'convert_site_database', convert_counted)
+    return counts
+
+def test_site_cache_hit(site_file, conversions):
+    site_db = utils.read_site_database(site_file, 2, 4)
+    cachefile = utils.get_site_cache_file(site_file, '')
+    assert conversions==[cachefile] and os.path.isfile(cachefile)
+    ref_db = syn.make_site_database(5)
+    assert np.array_equal(site_db['DIVA_ID'], ref_db['DIVA_ID'][1:4])
+    assert np.allclose(site_db['coastline'], ref_db['coastline'][1:4])
+    # the cache is reused and the last site is clipped to the database
+    site_db = utils.read_site_database(site_file, 4, 10)
+    assert len(conversions)==1
+    assert np.array_equal(site_db['DIVA_ID'], ref_db['DIVA_ID'][3:])
+    # a separate cache directory
+    cache_dir = os.path.join(os.path.dirname(site_file), 'cache')
+    os.makedirs(cache_dir)
+    utils.read_site_database(site_file, 1, 5, cache_dir)
+    assert conversions[-1]==os.path.join(cache_dir, 'DIVA_maces.cache.nc')
+
+def test_site_cache_invalidation(site_file, conversions):
+    utils.read_site_database(site_file, 1, 5)
+    cachefile = utils.get_site_cache_file(site_file, '')
+    stat = os.stat(site_file)
+    # a touched but unchanged file is recognized by its md5 checksum
+    os.utime(site_file, (stat.st_atime, stat.st_mtime + 10.0))
+    assert utils.is_valid_site_cache(site_file, cachefile)
+    set_cache_attrs(cachefile, source_md5='0'*32)
+    assert not utils.is_valid_site_cache(site_file, cachefile)
+    # the size is always checked
+    set_cache_attrs(cachefile, source_md5=utils.get_file_md5(site_file),
+                    source_mtime=np.float64(os.stat(site_file).st_mtime),
+                    source_size=np.int64(stat.st_size + 1))
+    assert not utils.is_valid_site_cache(site_file, cachefile)
+    # a changed database is converted again
+    write_site_database(site_file, 5, seed=1)
+    os.utime(site_file, (stat.st_atime, stat.st_mtime + 20.0))
+    nconv = len(conversions)
+    site_db = utils.read_site_database(site_file, 1, 5)
+    assert len(conversions)==nconv + 1
+    assert np.allclose(site_db['coastline'], 
+                       syn.make_site_database(5, 1)['coastline'])
+    assert utils.is_valid_site_cache(site_file, cachefile)
+    # corrupt caches are rebuilt
+    with open(cachefile, 'wb') as f:
+        f.write(b'corrupt')
+    assert not utils.is_valid_site_cache(site_file, cachefile)
+    utils.read_site_database(site_file, 1, 5)
+    assert len(conversions)==nconv + 2
+
+def read_coastline(site_file):
+    return utils.read_site_database(site_file, 1, 5)['coastline']
+
+def test_site_cache_concurrent(site_file):
+    # writers of the same cache never expose a partial file
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        results = pool.map(read_coastline, [site_file]*8)
+    ref = syn.make_site_database(5)['coastline']
+    for coastline in results:
+        assert np.allclose(coastline, ref)
+    cache_dir = os.path.dirname(site_file)
+    assert not [name for name in os.listdir(cache_dir) 
+                if name.endswith('.tmp')]
+    assert utils.is_valid_site_cache(site_file, 
+        utils.get_site_cache_file(site_file, ''))
+
+def build_platform_segments_loop(site_db, npft):
+    # the per-site implementation replaced by build_platform_segments
+    nsite = len(site_db['coastline'])
+    diva_segments = []
+    pft_segments = []
+    pft_codes = []
+    for iid in range(nsite):
+        area = np.array([site_db['area{:02d}'.format(jj+1)][iid] 
+                         for jj in range(utils.NTOPSEG)], dtype=np.float64)
+        diva_segments.append(area / site_db['coastline'][iid])
+        orders = np.array([site_db['pft{:d}_order'.format(jj)][iid] 
+                           for jj in range(npft)], dtype=np.int32)
+        segments = np.array([site_db['pft{:d}'.format(jj)][iid] 
+                             for jj in range(npft)], dtype=np.float64)
+        pfts = np.arange(npft)
+        indice = orders>=0
+        orders = orders[indice]
+        segments = segments[indice]
+        pfts = pfts[indice]
+        indices = sorted(range(len(orders)), key=lambda k: orders[k])
+        pft_segments.append(segments[indices])
+        pft_codes.append(pfts[indices])
+    return diva_segments, pft_segments, pft_codes
+
+def test_build_platform_segments():
+    npft = len(syn.SITE_PFTS)
+    df = syn.make_site_database(20)
+    # random pft orders with absent pfts and ties of the same order
+    rng = np.random.default_rng(2)
+    for iid in range(1, 20):
+        orders = rng.integers(-1, 4, npft)
+        lengths = np.where(orders>=0, rng.uniform(0.1, 20.0, npft), 0.0)
+        for jj in range(npft):
+            df.loc[iid, 'pft{:d}_order'.format(jj)] = orders[jj]
+            df.loc[iid, 'pft{:d}'.format(jj)] = lengths[jj]
+    site_db = {key: np.array(df[key]) for key in df.columns}
+    diva_segments, pft_segments, pft_codes, masks = \
+        utils.build_platform_segments(site_db, npft)
+    assert np.all(masks['coastline']) and np.all(masks['pft'])
+    ref_diva, ref_segments, ref_codes = \
+        build_platform_segments_loop(site_db, npft)
+    for iid in range(20):
+        assert np.array_equal(diva_segments[iid], ref_diva[iid])
+        indice = pft_codes[iid]>=0
+        assert np.array_equal(pft_codes[iid][indice], ref_codes[iid])
+        assert np.array_equal(pft_segments[iid][indice], ref_segments[iid])
+        # absent pfts are at the end
+        assert np.all(indice[:np.sum(indice)])
+        assert np.all(pft_segments[iid][~indice]==0.0)
+    # invalid sites are masked
+    site_db['coastline'][3] = 0.0
+    site_db['pft0'][5] = 0.0
+    site_db['pft0_order'][5] = 0
+    __, __, __, masks = utils.build_platform_segments(site_db, npft)
+    assert np.array_equal(np.nonzero(~masks['coastline'])[0], [3])
+    assert np.array_equal(np.nonzero(~masks['pft'])[0], [5])
+
+def get_platform_args():
+    diva_segments = np.array(syn.SITE_AREAS) / syn.SITE_TEMPLATE['coastline']
+    return [diva_segments, syn.SITE_TEMPLATE['coastline'], 
+            syn.SITE_TEMPLATE['fetchagl'], syn.CELL_RES, 
+            syn.PLATFORM_SIZES['short'], np.array([1.6, 18.4, 15.6]), 
+            np.array([1, 0, 2])]
+
+def test_platform_signature():
+    args = get_platform_args()
+    signature = utils.get_platform_signature(*args)
+    # the key depends on the values only
+    assert len(signature)==40
+    assert utils.get_platform_signature(*[list(arg) if np.ndim(arg)>0 
+        else arg for arg in args])==signature
+    assert utils.get_platform_signature(*args, xResMax=None)==signature
+    signatures = {signature}
+    for ii, value in [(1, 120.0), (2, 31.0), (3, 2.0), (4, 11), 
+                      (6, np.array([1, 2, 0]))]:
+        new_args = list(args)
+        new_args[ii] = value
+        signatures.add(utils.get_platform_signature(*new_args))
+    signatures.add(utils.get_platform_signature(*args, xResMax=50.0, 
+                                                trng=0.8))
+    signatures.add(utils.get_platform_signature(*args, xResMax=50.0, 
+                                                trng=0.9))
+    assert len(signatures)==8
+
+def test_platform_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    platform = syn.get_site_platform('short')
+    assert utils.load_platform_cache(cache_dir, 'a') is None
+    utils.save_platform_cache(cache_dir, 'a', platform, 2)
+    cached = utils.load_platform_cache(cache_dir, 'a')
+    assert set(cached)==set(platform)
+    for key in platform:
+        assert np.array_equal(cached[key], platform[key])
+        assert cached[key].dtype==platform[key].dtype
+    # the least recently used platform is evicted
+    os.utime(os.path.join(cache_dir, 'platform_a.npz'), (100.0, 100.0))
+    utils.save_platform_cache(cache_dir, 'b', platform, 2)
+    os.utime(os.path.join(cache_dir, 'platform_b.npz'), (200.0, 200.0))
+    assert utils.load_platform_cache(cache_dir, 'a') is not None
+    utils.save_platform_cache(cache_dir, 'c', platform, 2)
+    assert sorted(os.listdir(cache_dir))== \
+        ['platform_a.npz', 'platform_c.npz']
+    utils.save_platform_cache(cache_dir, 'd', platform, 1)
+    assert os.listdir(cache_dir)==['platform_d.npz']
+
+def test_platform_cache_corrupt(tmp_path):
+    cache_dir = str(tmp_path)
+    platform = syn.get_site_platform('short')
+    filename = os.path.join(cache_dir, 'platform_a.npz')
+    utils.save_platform_cache(cache_dir, 'a', platform, 4)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    # truncated, garbled and incomplete files are cache misses
+    with open(filename, 'wb') as f:
+        f.write(data[:len(data)//2])
+    assert utils.load_platform_cache(cache_dir, 'a') is None
+    with open(filename, 'wb') as f:
+        f.write(b'corrupt')
+    assert utils.load_platform_cache(cache_dir, 'a') is None
+    np.savez(filename, x=platform['x'])
+    assert utils.load_platform_cache(cache_dir, 'a') is None
+    utils.save_platform_cache(cache_dir, 'a', platform, 4)
+    assert np.array_equal(utils.load_platform_cache(cache_dir, 'a')['zh'], 
+                          platform['zh'])
+
+def test_morphological_date():
+    # leap days and non-integer factors
+    date0 = date(2003, 3, 1)
+    assert utils.get_morphological_date(date0, date(2004, 2, 29), 2.0)== \
+        date(2005, 2, 28)
+    assert utils.get_morphological_date(date0, date(2004, 2, 29), 1.5)== \
+        date(2004, 8, 29)
+    assert utils.get_morphological_date(date0, date(2004, 2, 29), 1.0)== \
+        date(2004, 2, 29)
+    assert utils.get_morphological_date(date0, date(2004, 3, 1), 1e9)== \
+        date.max
+
+def test_flooding_time():
+    # 15-minute tide records, flooding from the third record
+    h0 = np.array([-1.0, -0.5, 0.2, -0.2])
+    assert utils.get_flooding_time(10.0, 1700.0, h0, 0.0, 15)==1700.0
+    assert utils.get_flooding_time(10.0, 1800.0, h0, 0.0, 15)==1800.0
+    assert utils.get_flooding_time(899.5, 2700.0, h0, 0.0, 15)==1800.0
+    assert utils.get_flooding_time(1900.0, 2700.0, h0, 0.0, 15)==1900.0
+    assert utils.get_flooding_time(10.0, 1.0e4, h0, 0.5, 15)==1.0e4
+
+def test_lazy_imports():
+    # worker processes import the utilities without pandas and the config
+    src_dir = os.path.dirname(os.path.abspath(utils.__file__))
+    result = subprocess.run([sys.executable, '-c', 'import sys; '
+        'import maces_utilities; print(sorted({"pandas", "maces_config", '
+        '"mpi4py"} & set(sys.modules)))'], cwd=src_dir, capture_output=True,
+        text=True)
+    assert result.returncode==0, result.stderr
+    assert result.stdout.strip()=='[]'